@@ -0,0 +1,377 @@
+"""
+Benchmark harness for the hotfolder agent.
+
+Generates synthetic hotfolders (see synthetic.py) and drives HotfolderWatcher.handle_hotfolder,
+move_hotfolder_contents, HotfolderStateDB and write_metadata directly. Every benchmark/profile pair
+runs in its own spawned process, so peak RSS is per case. Results are printed as a table and can be
+written as JSON (--output) and compared with an earlier run (--compare) to track regressions.
+
+    python benchmarks/run.py                              # all benchmarks, all profiles
+    python benchmarks/run.py -b scan -p many_small --tmpfs
+    python benchmarks/run.py --scale 0.1 --output bench.json --compare baseline.json
+"""
+import argparse
+import json
+import logging
+import multiprocessing
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BENCH_DIR = Path(__file__).resolve().parent
+sys.path.insert(0, str(BENCH_DIR.parent / "src"))
+sys.path.insert(0, str(BENCH_DIR))
+
+import synthetic  # noqa: E402
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None
+
+def _write_config(folder, **overrides):
+    from hotfolder.config import DEFAULT_CONFIG, generate_example_config_dict, dump_with_headlines_no_comments
+    config = dict(DEFAULT_CONFIG)
+    config.update(cleanup=False, debug=False, **overrides)
+    (folder / ".config").mkdir(parents=True, exist_ok=True)
+    (folder / ".config" / "config.yml").write_text(
+        dump_with_headlines_no_comments(generate_example_config_dict(include_hotfolders=False, example_config=config)))
+
+
+def _hotfolder(workdir, profile, scale, **config):
+    # A generated hotfolder with its OUT folder and config; returns (IN, OUT, files, bytes)
+    folder = (workdir / "hotfolder").resolve()
+    out = workdir / "hotfolder_out"
+    files, total = synthetic.generate_hotfolder(folder, **synthetic.scaled(profile, scale))
+    out.mkdir()
+    _write_config(folder, **config)
+    return folder, out, files, total
+
+
+# --- Benchmarks: each returns a dict of metrics ---
+
+def bench_scan(workdir, profile, scale, repeat):
+    """
+    Steady-state scans of a hotfolder whose jobs are all resting: the cost paid every scan_interval.
+    """
+    from hotfolder.watcher import HotfolderWatcher
+    folder, out, files, _ = _hotfolder(workdir, profile, scale, resting_time=10 ** 6)
+    watcher = HotfolderWatcher()
+    start = time.perf_counter()
+    watcher.handle_hotfolder(folder, out, False)  # Cold: every job ARRIVES and is recorded
+    cold = time.perf_counter() - start
+    state_db = watcher.state_dbs[str(folder)]
+    commits = state_db.commits
+    stat_calls = 0
+    start = time.perf_counter()
+    for _ in range(repeat):
+        watcher.handle_hotfolder(folder, out, False)
+        stat_calls += watcher.snapshots[str(folder)].stat_calls
+    warm = time.perf_counter() - start
+    result = {
+        "files": files,
+        "cold_scan_seconds": cold,
+        "scan_seconds": warm / repeat,
+        "scans_per_sec": repeat / warm if warm else 0.0,
+        "stat_calls_per_scan": stat_calls / repeat,
+        "db_transactions_per_scan": (state_db.commits - commits) / repeat,
+    }
+    _close(watcher)
+    return result
+
+
+def bench_deliver(workdir, profile, scale, repeat, keep_copy=False):
+    """
+    handle_hotfolder delivering every job to OUT (resting_time 0): the scan that moves or copies.
+    """
+    from hotfolder.watcher import HotfolderWatcher
+    folder, out, files, total = _hotfolder(workdir, profile, scale, resting_time=0, keep_copy=keep_copy)
+    watcher = HotfolderWatcher()
+    watcher.handle_hotfolder(folder, out, False)  # Records everything as seen
+    state_db = watcher.state_dbs[str(folder)]
+    commits = state_db.commits
+    start = time.perf_counter()
+    watcher.handle_hotfolder(folder, out, False)
+    seconds = time.perf_counter() - start
+    delivered, _ = synthetic.tree_size(out)
+    result = {
+        "files": files,
+        "bytes": total,
+        "delivered_files": delivered,
+        "seconds": seconds,
+        "bytes_per_sec": total / seconds if seconds else 0.0,
+        "files_per_sec": files / seconds if seconds else 0.0,
+        "stat_calls": watcher.snapshots[str(folder)].stat_calls,
+        "db_transactions": state_db.commits - commits,
+    }
+    _close(watcher)
+    return result
+
+
+def bench_deliver_copy(workdir, profile, scale, repeat):
+    """
+    bench_deliver with keep_copy: jobs stay in IN and are copied.
+    """
+    return bench_deliver(workdir, profile, scale, repeat, keep_copy=True)
+
+
+def bench_move(workdir, profile, scale, repeat):
+    """
+    move_hotfolder_contents copying every job with a 4-worker TransferEngine, without the watcher.
+    """
+    from hotfolder.mover import move_hotfolder_contents
+    from hotfolder.transfer import TransferEngine, TransferStats
+    src = workdir / "src"
+    files, total = synthetic.generate_hotfolder(src, **synthetic.scaled(profile, scale))
+    engine = TransferEngine(workers=4)
+    stats = TransferStats()
+    start = time.perf_counter()
+    move_hotfolder_contents(src, workdir / "dst", keep_copy=True, transfer_engine=engine, stats=stats)
+    seconds = time.perf_counter() - start
+    engine.shutdown()
+    return {
+        "files": files,
+        "bytes": total,
+        "seconds": seconds,
+        "bytes_per_sec": total / seconds if seconds else 0.0,
+        "files_per_sec": files / seconds if seconds else 0.0,
+        "methods": dict(stats.methods),
+    }
+
+
+def bench_state_db(workdir, profile, scale, repeat):
+    """
+    HotfolderStateDB bookkeeping for every file of the profile: batched seen/processed writes,
+    per-job reads and job deletes, each timed separately.
+    """
+    from hotfolder.state_db import HotfolderStateDB
+    params = synthetic.scaled(profile, scale)
+    jobs = [f"job_{j:05d}" for j in range(params["jobs"])]
+    per_job = params["files"] * params.get("depth", 1)
+    rows = [(f"{job}/file_{i:06d}.bin", job) for job in jobs for i in range(per_job)]
+    folder = workdir / "db"
+    folder.mkdir()
+    state_db = HotfolderStateDB(folder)
+    now = time.time()
+    timings = {}
+
+    def timed(name, count, fn):
+        start = time.perf_counter()
+        fn()
+        seconds = time.perf_counter() - start
+        timings[f"{name}_ops_per_sec"] = count / seconds if seconds else 0.0
+
+    def write_seen():
+        with state_db.transaction():
+            state_db.set_seen_many([(job, now, now) for job in jobs])
+            state_db.set_seen_many([(rel, now, now) for rel, _ in rows])
+
+    def read_jobs():
+        for _ in range(repeat):
+            for job in jobs:
+                state_db.get_seen_for_job(job)
+
+    def write_processed():
+        for job in jobs:
+            with state_db.transaction():
+                state_db.set_processed_many((rel, now, now, False) for rel, j in rows if j == job)
+
+    commits = state_db.commits
+    timed("set_seen", len(rows) + len(jobs), write_seen)
+    timed("get_seen_for_job", len(jobs) * repeat, read_jobs)
+    timed("set_processed", len(rows), write_processed)
+    timed("delete_job", len(jobs), lambda: [state_db.delete_job(job) for job in jobs])
+    result = {"rows": len(rows), "jobs": len(jobs), "db_transactions": state_db.commits - commits}
+    result.update(timings)
+    result["ops_per_sec"] = min(timings.values())
+    state_db.close()
+    return result
+
+
+def bench_metadata(workdir, profile, scale, repeat):
+    """
+    write_metadata on every image (image profiles only), then once more when every tag is present, then
+    with a value too long for the block written first. After the first and last pass every image is read
+    back with iptcinfo3, which scans for IIM data instead of following the TIFF tag.
+    """
+    from hotfolder.mover import write_metadata
+    params = synthetic.scaled(profile, scale)
+    if not params.get("images"):
+        return None
+    files, _ = synthetic.generate_hotfolder(workdir / "images", **params)
+    images = sorted(p for p in (workdir / "images").rglob("*") if p.suffix in (".jpg", ".tif"))
+    logger = logging.getLogger("hotfolder.benchmark")
+    logger.addHandler(logging.NullHandler())
+    logger.propagate = False
+    start = time.perf_counter()
+    for path in images:
+        write_metadata(path, "headline", path.parent.name, logger)
+    first = time.perf_counter() - start
+    _check_headlines(images, lambda path: path.parent.name)
+    start = time.perf_counter()
+    for path in images:
+        write_metadata(path, "headline", path.parent.name, logger)
+    again = time.perf_counter() - start
+    start = time.perf_counter()
+    for path in images:
+        write_metadata(path, "headline", path.parent.name * 64, logger)
+    grown = time.perf_counter() - start
+    _check_headlines(images, lambda path: path.parent.name * 64)
+    return {
+        "images": files,
+        "seconds": first,
+        "images_per_sec": files / first if first else 0.0,
+        "already_tagged_seconds": again,
+        "grown_seconds": grown,
+    }
+
+
+def _check_headlines(images, expected):
+    # iptcinfo3 must find the current value and no stale block; TIFFs are also read through their IPTC tag
+    from iptcinfo3 import IPTCInfo
+    from PIL import Image, IptcImagePlugin
+    logging.getLogger("iptcinfo").setLevel(logging.ERROR)  # Warns about every image without IPTC data
+    for path in images:
+        headlines = [IPTCInfo(str(path))["headline"]]
+        if path.suffix == ".tif":
+            with Image.open(path) as image:
+                headlines.append((IptcImagePlugin.getiptcinfo(image) or {}).get((2, 105)))
+        for headline in headlines:
+            headline = headline.decode("utf-8") if isinstance(headline, bytes) else headline
+            if headline != expected(path):
+                raise RuntimeError(f"{path} reads back headline {headline!r}, expected {expected(path)!r}")
+
+
+BENCHMARKS = {
+    "scan": bench_scan,
+    "deliver": bench_deliver,
+    "deliver_copy": bench_deliver_copy,
+    "move": bench_move,
+    "state_db": bench_state_db,
+    "metadata": bench_metadata,
+}
+
+
+def _close(watcher):
+    for state_db in watcher.state_dbs.values():
+        state_db.close()
+    watcher.transfer_engine.shutdown()
+    watcher.metadata_stage.shutdown()
+
+
+def _peak_rss():
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024  # bytes on macOS, KiB on Linux
+
+
+def _run_case(bench, profile, scale, repeat, base_dir):
+    # Runs in a fresh process: generate, measure, clean up
+    workdir = Path(tempfile.mkdtemp(prefix=f"hotfolder-bench-{bench}-", dir=base_dir))
+    try:
+        result = BENCHMARKS[bench](workdir, profile, scale, repeat)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+    if result is not None:
+        result["peak_rss_bytes"] = _peak_rss()
+    return result
+
+
+def run(benchmarks, profiles, scale=1.0, repeat=5, base_dir=None):
+    """
+    Run every benchmark on every profile, each in its own process. Returns the JSON report as a dict.
+    """
+    from hotfolder import __version__
+    context = multiprocessing.get_context("spawn")
+    results = []
+    for bench in benchmarks:
+        for profile in profiles:
+            with context.Pool(1) as pool:
+                result = pool.apply(_run_case, (bench, profile, scale, repeat, base_dir))
+            if result is None:
+                continue  # Benchmark does not apply to this profile
+            results.append({"benchmark": bench, "profile": profile, **result})
+            print(f"{bench:>13} {profile:>11}  {_summary(result)}", flush=True)
+    return {
+        "version": __version__,
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "scale": scale,
+        "repeat": repeat,
+        "base_dir": str(base_dir or tempfile.gettempdir()),
+        "results": results,
+    }
+
+
+def _summary(result):
+    keys = [k for k in ("scans_per_sec", "bytes_per_sec", "files_per_sec", "ops_per_sec", "images_per_sec",
+                        "stat_calls_per_scan", "db_transactions_per_scan", "db_transactions") if k in result]
+    parts = [f"{k}={result[k]:,.1f}" for k in keys]
+    if result.get("peak_rss_bytes"):
+        parts.append(f"peak_rss={result['peak_rss_bytes'] / 1048576:.0f}MiB")
+    return "  ".join(parts)
+
+
+def compare(report, baseline):
+    """
+    Print how every numeric metric changed relative to a baseline report (same benchmark and profile).
+    """
+    previous = {(r["benchmark"], r["profile"]): r for r in baseline.get("results", [])}
+    print(f"\nCompared with {baseline.get('version')} ({baseline.get('timestamp')}):")
+    for result in report["results"]:
+        old = previous.get((result["benchmark"], result["profile"]))
+        if old is None:
+            continue
+        changes = []
+        for key, value in result.items():
+            if not isinstance(value, (int, float)) or isinstance(value, bool) or not old.get(key):
+                continue
+            ratio = value / old[key]
+            better = ratio > 1 if key.endswith("_per_sec") else ratio < 1  # Rates up, seconds/calls/RSS down
+            mark = "" if abs(ratio - 1) < 0.05 else (" +" if better else " -")
+            changes.append(f"{key} x{ratio:.2f}{mark}")
+        print(f"{result['benchmark']:>13} {result['profile']:>11}  " + ", ".join(changes))
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the hotfolder agent on synthetic hotfolders.")
+    parser.add_argument("-b", "--benchmark", action="append", choices=sorted(BENCHMARKS),
+                        help="Benchmark to run (repeatable; default: all)")
+    parser.add_argument("-p", "--profile", action="append", choices=sorted(synthetic.PROFILES),
+                        help="Synthetic hotfolder profile (repeatable; default: all)")
+    parser.add_argument("--scale", type=float, default=1.0, help="Multiply job counts and file sizes (default 1.0)")
+    parser.add_argument("--repeat", type=int, default=5, help="Warm scans / read passes per case (default 5)")
+    parser.add_argument("--root", help="Directory to generate hotfolders in (default: system temp dir)")
+    parser.add_argument("--tmpfs", action="store_true", help="Generate hotfolders in /dev/shm to take the disk out")
+    parser.add_argument("--output", help="Write the JSON report to this file ('-' for stdout)")
+    parser.add_argument("--compare", help="Earlier JSON report to compare against")
+    args = parser.parse_args(argv)
+
+    base_dir = args.root
+    if args.tmpfs:
+        if not os.path.isdir("/dev/shm"):
+            parser.error("--tmpfs needs /dev/shm")
+        base_dir = "/dev/shm"
+    for name in args.profile or []:
+        print(f"{name}: {synthetic.PROFILES[name][0]} (x{args.scale})")
+    report = run(args.benchmark or list(BENCHMARKS), args.profile or list(synthetic.PROFILES),
+                 args.scale, max(1, args.repeat), base_dir)
+    if args.output == "-":
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    elif args.output:
+        with open(args.output, "w") as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(report, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
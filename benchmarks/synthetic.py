@@ -0,0 +1,97 @@
+import io
+import os
+import random
+from pathlib import Path
+
+# name: (description, generator keyword arguments). Sizes are multiplied by --scale.
+PROFILES = {
+    "many_small": ("50 jobs of 200 files of 4 KiB", dict(jobs=50, files=200, size=4096)),
+    "few_huge": ("2 jobs of 2 files of 128 MiB", dict(jobs=2, files=2, size=128 << 20)),
+    "deep": ("20 jobs, 3 files per level, 12 levels deep", dict(jobs=20, files=3, size=16384, depth=12)),
+    "many_jobs": ("5000 jobs of 1 file of 8 KiB", dict(jobs=5000, files=1, size=8192)),
+    "images": ("20 jobs of 10 JPEG images", dict(jobs=20, files=10, images=True)),
+    "tiff_images": ("20 jobs of 10 TIFF images of 400x300", dict(jobs=20, files=10, images="tiff")),
+}
+
+_CHUNK = 1 << 20
+
+
+def scaled(profile, scale):
+    """
+    Generator arguments of a profile with job counts and file sizes multiplied by scale (at least 1).
+    """
+    params = dict(PROFILES[profile][1])
+    params["jobs"] = max(1, int(params["jobs"] * scale))
+    if "size" in params:
+        params["size"] = max(1, int(params["size"] * scale))
+    return params
+
+
+def generate_hotfolder(folder, jobs, files, size=4096, depth=1, images=False, seed=0):
+    """
+    Create jobs job folders in folder, each with files files per directory level and depth levels.
+    Contents are pseudo-random (seeded) so copies cannot be deduplicated or compressed away.
+    images: True for JPEG images, 'tiff' for TIFF images.
+    Returns (number of files, total bytes).
+    """
+    folder = Path(folder)
+    folder.mkdir(parents=True, exist_ok=True)
+    rng = random.Random(seed)
+    block = rng.randbytes(_CHUNK) if not images else None
+    image_format = "TIFF" if images == "tiff" else "JPEG"
+    # TIFFs stay within the 800 KB iptcinfo3 scans, so the metadata benchmark can read their IPTC back
+    image = _image_bytes(rng, image_format, (400, 300) if image_format == "TIFF" else (1600, 1200)) if images else None
+    count = 0
+    total = 0
+    for j in range(jobs):
+        level = folder / f"job_{j:05d}"
+        for d in range(depth):
+            level.mkdir(parents=True, exist_ok=True)
+            for i in range(files):
+                suffix = ".tif" if image_format == "TIFF" else ".jpg"
+                path = level / (f"img_{i:04d}{suffix}" if images else f"file_{i:04d}.bin")
+                if images:
+                    path.write_bytes(image)
+                    total += len(image)
+                else:
+                    _write_random(path, size, block, rng)
+                    total += size
+                count += 1
+            level = level / f"level_{d + 1:02d}"
+    return count, total
+
+
+def _write_random(path, size, block, rng):
+    # Reuse one random block at a random rotation per chunk: cheap to write, still not dedupable
+    with open(path, "wb") as f:
+        remaining = size
+        while remaining > 0:
+            offset = rng.randrange(len(block))
+            chunk = (block[offset:] + block[:offset])[:min(remaining, _CHUNK)]
+            f.write(chunk)
+            remaining -= len(chunk)
+
+
+def _image_bytes(rng, image_format="JPEG", size=(1600, 1200)):
+    from PIL import Image  # Only needed for the image profiles
+    pixels = rng.randbytes(size[0] * size[1] * 3)
+    if image_format == "TIFF":
+        # TIFF pixels are stored raw; iptcinfo3 would take any 0x1c 0x02 in them for the start of IPTC data
+        pixels = pixels.translate(bytes(range(0x1c)) + b"\x1d" + bytes(range(0x1d, 256)))
+    image = Image.frombytes("RGB", size, pixels)
+    buffer = io.BytesIO()
+    image.save(buffer, image_format, **({"quality": 85} if image_format == "JPEG" else {}))
+    return buffer.getvalue()
+
+
+def tree_size(path):
+    """
+    (files, bytes) below path.
+    """
+    files = 0
+    total = 0
+    for root, _, names in os.walk(path):
+        for name in names:
+            files += 1
+            total += os.path.getsize(os.path.join(root, name))
+    return files, total
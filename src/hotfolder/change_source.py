@@ -0,0 +1,357 @@
+import ctypes
+import ctypes.util
+import errno
+import os
+import re
+import select
+import struct
+import sys
+import threading
+import time
+from pathlib import Path
+
+# Filesystems where inotify only sees local changes; these always use polling
+NETWORK_FILESYSTEMS = {
+    "nfs", "nfs4", "cifs", "smb", "smb2", "smb3", "smbfs", "afpfs", "9p", "ceph", "glusterfs",
+    "fuse.sshfs", "fuse.rclone", "fuse.glusterfs", "davfs", "fuse.davfs2",
+}
+
+# inotify(7) constants
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ONLYDIR = 0x01000000
+IN_ISDIR = 0x40000000
+
+WATCH_MASK = (IN_MODIFY | IN_ATTRIB | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO |
+              IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF | IN_ONLYDIR)
+EVENT_HEADER = struct.Struct("iIII")  # wd, mask, cookie, len
+
+
+class PollingChangeSource:
+    """
+    Fallback change source: no notifications, every wait() sleeps for the full timeout and
+    reports a possible change. Used on network filesystems and non-Linux platforms.
+    """
+    backend = "poll"
+
+    def __init__(self, paths, recursive=True):
+        self.paths = [Path(p) for p in paths]
+
+    def fileno(self):
+        return None
+
+    def wait(self, timeout):
+        time.sleep(timeout)
+        return True
+
+    def drain(self):
+        return True
+
+    def close(self):
+        pass
+
+
+class InotifyChangeSource:
+    """
+    Linux inotify change source (via ctypes, no extra dependency).
+    Watches the given paths (recursively by default; hidden top-level folders such as .db and .log
+    are skipped so the agent's own writes do not wake it) and reports whether anything changed.
+    """
+    backend = "inotify"
+    _libc = None
+
+    def __init__(self, paths, recursive=True):
+        libc = self._load_libc()
+        self.paths = [Path(p) for p in paths]
+        self.recursive = recursive
+        self.watches = {}  # {wd: Path}
+        self.fd = _inotify_init(libc)
+        try:
+            for path in self.paths:
+                self._add_tree(path, top_level=True)
+        except Exception:
+            self.close()
+            raise
+
+    @classmethod
+    def _load_libc(cls):
+        if cls._libc is None:
+            if not sys.platform.startswith("linux"):
+                raise OSError(errno.ENOSYS, "inotify is only available on Linux")
+            libc = ctypes.CDLL(ctypes.util.find_library("c") or None, use_errno=True)
+            libc.inotify_init1.argtypes = [ctypes.c_int]
+            libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+            libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+            cls._libc = libc
+        return cls._libc
+
+    def _add_watch(self, path):
+        wd = _add_watch(self._libc, self.fd, path)
+        if wd is not None:
+            self.watches[wd] = Path(path)
+
+    def _add_tree(self, path, top_level=False):
+        self._add_watch(path)
+        if not self.recursive:
+            return
+        for root, dirs, _ in os.walk(path):
+            if top_level and Path(root) == Path(path):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for d in dirs:
+                self._add_watch(Path(root) / d)
+
+    def fileno(self):
+        return self.fd
+
+    def wait(self, timeout):
+        """
+        Block until something changes or timeout seconds pass. Returns True if a change was seen.
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return False
+        return self.drain()
+
+    def drain(self):
+        """
+        Consume all queued events without blocking. Returns True if any of them was a change.
+        New directories are watched as they appear.
+        """
+        changed = False
+        if self.fd is None:
+            return changed
+        for wd, mask, name in _read_events(self.fd):
+            if mask & IN_IGNORED:
+                self.watches.pop(wd, None)
+                continue
+            changed = True
+            if mask & IN_Q_OVERFLOW:
+                continue
+            parent = self.watches.get(wd)
+            if parent is None or not name:
+                continue
+            if self.recursive and mask & IN_ISDIR and mask & (IN_CREATE | IN_MOVED_TO):
+                is_root = parent in self.paths
+                if not (is_root and name.startswith(b'.')):
+                    try:
+                        self._add_tree(parent / os.fsdecode(name))
+                    except OSError:
+                        pass  # Unwatched subtree; still picked up by the idle rescan
+        return changed
+
+    def close(self):
+        if self.fd is not None and self.fd >= 0:
+            os.close(self.fd)
+        self.fd = None
+        self.watches = {}
+
+
+def _inotify_init(libc):
+    fd = libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+    if fd < 0:
+        err = ctypes.get_errno()
+        # EMFILE means fs.inotify.max_user_instances (128 by default) is exhausted
+        raise OSError(err, f"inotify_init1 failed: {os.strerror(err)}")
+    return fd
+
+
+def _add_watch(libc, fd, path):
+    # Returns the watch descriptor, or None if path vanished before we got to it (the next scan will notice)
+    wd = libc.inotify_add_watch(fd, os.fsencode(str(path)), WATCH_MASK)
+    if wd < 0:
+        err = ctypes.get_errno()
+        if err in (errno.ENOENT, errno.ENOTDIR):
+            return None
+        # ENOSPC means fs.inotify.max_user_watches is exhausted
+        raise OSError(err, f"inotify_add_watch failed for {path}: {os.strerror(err)}")
+    return wd
+
+
+def _read_events(fd):
+    # Yield (wd, mask, name) for every queued event without blocking
+    while True:
+        try:
+            data = os.read(fd, 64 * 1024)
+        except BlockingIOError:
+            return
+        if not data:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, _, length = EVENT_HEADER.unpack_from(data, offset)
+            name = data[offset + EVENT_HEADER.size:offset + EVENT_HEADER.size + length].rstrip(b"\0")
+            offset += EVENT_HEADER.size + length
+            yield wd, mask, name
+
+
+class InotifyHub:
+    """
+    One inotify instance shared by the change sources of every hotfolder (see SharedInotifySource).
+    An instance per hotfolder would run into fs.inotify.max_user_instances (128 by default) and leave
+    every further hotfolder polling; the watch limit (max_user_watches) counts per user, not per
+    instance, so a single instance serves any number of hotfolders. drain() routes each event by its
+    watch descriptor and returns the sources that saw a change.
+    """
+    backend = "inotify"
+
+    def __init__(self):
+        self._libc = InotifyChangeSource._load_libc()
+        self.fd = _inotify_init(self._libc)
+        self.lock = threading.RLock()
+        self.watches = {}  # {wd: (Path, {SharedInotifySource})}; a directory watched twice has one wd
+
+    def fileno(self):
+        return self.fd
+
+    def add_watch(self, source, path):
+        with self.lock:
+            wd = _add_watch(self._libc, self.fd, path)
+            if wd is None:
+                return
+            _, sources = self.watches.setdefault(wd, (Path(path), set()))
+            sources.add(source)
+            source.wds.add(wd)
+
+    def detach(self, source):
+        """
+        Remove the watches of a source that no other source shares.
+        """
+        with self.lock:
+            for wd in source.wds:
+                _, sources = self.watches.get(wd, (None, set()))
+                sources.discard(source)
+                if not sources and self.watches.pop(wd, None) is not None and self.fd is not None:
+                    self._libc.inotify_rm_watch(self.fd, wd)  # Fails harmlessly if the directory is gone
+            source.wds = set()
+
+    def drain(self):
+        """
+        Consume all queued events without blocking. Returns the set of sources with a change;
+        new directories are watched for the sources that contain them.
+        """
+        changed = set()
+        with self.lock:
+            if self.fd is None:
+                return changed
+            for wd, mask, name in _read_events(self.fd):
+                if mask & IN_Q_OVERFLOW:
+                    # Events were lost: every source may have changed
+                    for _, sources in self.watches.values():
+                        changed.update(sources)
+                    continue
+                parent, sources = self.watches.get(wd, (None, set()))
+                if mask & IN_IGNORED:
+                    # The directory is gone (or its watch was removed)
+                    self.watches.pop(wd, None)
+                    for source in sources:
+                        source.wds.discard(wd)
+                    continue
+                changed.update(sources)
+                if parent is None or not name or not mask & IN_ISDIR or not mask & (IN_CREATE | IN_MOVED_TO):
+                    continue
+                for source in list(sources):
+                    if source.recursive and not (parent in source.paths and name.startswith(b'.')):
+                        try:
+                            source._add_tree(parent / os.fsdecode(name))
+                        except OSError:
+                            pass  # Unwatched subtree; still picked up by the idle rescan
+        return changed
+
+    def close(self):
+        with self.lock:
+            if self.fd is not None and self.fd >= 0:
+                os.close(self.fd)
+            self.fd = None
+            self.watches = {}
+
+
+class SharedInotifySource:
+    """
+    Change source of one hotfolder on a shared InotifyHub. It has no descriptor of its own: the hub's
+    descriptor is watched once (HotfolderScheduler.add_shared_source) and its events are routed here.
+    """
+    backend = "inotify"
+
+    def __init__(self, hub, paths, recursive=True):
+        self.hub = hub
+        self.paths = [Path(p) for p in paths]
+        self.recursive = recursive
+        self.wds = set()
+        try:
+            for path in self.paths:
+                self._add_tree(path, top_level=True)
+        except Exception:
+            self.close()
+            raise
+
+    def _add_tree(self, path, top_level=False):
+        self.hub.add_watch(self, path)
+        if not self.recursive:
+            return
+        for root, dirs, _ in os.walk(path):
+            if top_level and Path(root) == Path(path):
+                dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for d in dirs:
+                self.hub.add_watch(self, Path(root) / d)
+
+    def fileno(self):
+        return None
+
+    def close(self):
+        self.hub.detach(self)
+
+
+def is_network_filesystem(path):
+    """
+    True if path lives on a network filesystem according to /proc/self/mounts (Linux only).
+    """
+    try:
+        with open("/proc/self/mounts") as f:
+            mounts = [line.split() for line in f]
+    except OSError:
+        return False
+    path = str(Path(path).resolve())
+    best, best_type = "", None
+    for fields in mounts:
+        if len(fields) < 3:
+            continue
+        # Mount points escape spaces and tabs as octal sequences
+        mount_point = re.sub(r"\\([0-7]{3})", lambda m: chr(int(m.group(1), 8)), fields[1])
+        if (path == mount_point or path.startswith(mount_point.rstrip("/") + "/")) and len(mount_point) >= len(best):
+            best, best_type = mount_point, fields[2]
+    return best_type in NETWORK_FILESYSTEMS
+
+
+def create_change_source(paths, backend="auto", recursive=True, logger=None, hub=None):
+    """
+    Return a change source for paths (a path or list of paths).
+    backend: 'auto' (inotify on local Linux filesystems, polling otherwise), 'inotify' or 'poll'.
+    hub: optional InotifyHub; inotify watches are then added to its instance instead of a new one.
+    Falls back to polling if inotify cannot be set up (e.g. watch limit reached).
+    """
+    if isinstance(paths, (str, Path)):
+        paths = [paths]
+    backend = str(backend).lower()
+    if backend not in ("auto", "inotify", "poll"):
+        raise ValueError(f"Invalid watch_backend '{backend}', expected one of ('auto', 'inotify', 'poll')")
+    if backend == "poll":
+        return PollingChangeSource(paths, recursive)
+    if backend == "auto" and any(is_network_filesystem(p) for p in paths):
+        return PollingChangeSource(paths, recursive)
+    try:
+        if hub is not None:
+            return SharedInotifySource(hub, paths, recursive)
+        return InotifyChangeSource(paths, recursive)
+    except OSError as e:
+        if logger:
+            logger.warning(f"inotify unavailable for {', '.join(str(p) for p in paths)} ({e}); falling back to polling")
+        return PollingChangeSource(paths, recursive)
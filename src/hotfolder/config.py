@@ -2,6 +2,7 @@ import yaml
 from pathlib import Path
 import os
 from collections import OrderedDict
+from types import MappingProxyType
 
 group_comments = OrderedDict([
     ("hotfolders", "# === Hotfolder Roots ==="),
@@ -11,39 +12,86 @@ group_comments = OrderedDict([
     ("metadata", "# === Metadata Handling ==="),
     ("auto_cleanup", "# === Auto Cleanup Options ==="),
     ("mtime", "# === File Modification Time Handling ==="),
+    ("changes", "# === Change Detection ==="),
+    ("transfer", "# === Transfer Settings ==="),
+    ("cpu", "# === CPU Offload ==="),
+    ("throttle", "# === Throughput Limits ==="),
     ("logging", "# === Logging Settings ==="),
+    ("database", "# === State Database ==="),
     ("debugging", "# === Debugging ==="),
     ("heartbeat", "# === Heartbeat Settings ==="),
+    ("metrics", "# === Metrics Endpoint ==="),
+    ("cluster", "# === Cluster Mode ==="),
 ])
 key_comments = {
     "scan_interval": "# Seconds between scans of the hotfolder",
     "resting_time": "# Seconds a job must be unchanged before processing",
+    "watch_backend": "# Change detection: auto (inotify on local Linux disks), inotify or poll",
+    "idle_rescan_interval": "# Seconds between safety rescans of an idle, event-watched hotfolder",
+    "scan_workers": "# Global only: size of the worker pool that runs hotfolder scans",
+    "priority": "# Hotfolders with higher priority are scanned first when scan workers are busy",
+    "small_jobs_first": "# Process jobs up to small_job_size before larger ones in each scan",
+    "small_job_size": "# Bytes up to which a job counts as small for small_jobs_first",
     "cleanup": "# Perform retention cleanup after jobs are processed",
     "keep_copy": "# Keep a copy of jobs in IN after processing",
     "cleanup_time": "# Minutes to keep jobs in IN after processing",
     "dissolve_folders": "# If true, flatten job folders when moving to OUT",
+    "dissolve_collision": "# suffix, hash, keep_newest or overwrite: flattened file whose name is taken",
+    "dissolve_ignore_case": "# Names differing only in case or Unicode form collide (SMB, macOS volumes)",
     "enabled": "# Enable/disable metadata extraction",
     "field": "# Optional: specify a metadata field to extract",
     "ds_store": "# Remove .DS_Store files from jobs",
     "thumbs_db": "# Remove Thumbs.db files from jobs",
     "update_mtime": "# Update mtime on files after processing",
+    "change_detection": "# mtime, sampled or full: hash content so touched-only files are not re-copied",
+    "hash_sample_size": "# Bytes hashed at start, middle and end of a file in sampled mode",
+    "transfer_workers": "# Global only: files copied/moved to OUT in parallel",
+    "copy_buffer_size": "# Global only: buffer in bytes when a copy cannot be done in the kernel",
+    "delta_sync": "# keep_copy only: rewrite just the changed blocks of files already in OUT",
+    "delta_block_size": "# Block size in bytes for delta_sync",
+    "cpu_workers": "# Global only: processes for CPU-bound job steps (content hashing, image metadata)",
+    "cpu_queue_size": "# Global only: CPU tasks queued at once, half per hotfolder (0 = 4 per worker)",
+    "staged_delivery": "# Write to OUT/.staging first and rename into place once complete",
+    "staging_fsync_batch": "# Staged files fsync'd together before they are renamed into place",
+    "max_bytes_in_flight": "# Bytes this hotfolder may have queued for transfer at once (0 = no limit)",
+    "max_bytes_per_second": "# Bytes per second this hotfolder may write to OUT (0 = no limit)",
+    "max_files_per_second": "# Files per second this hotfolder may deliver to OUT (0 = no limit)",
+    "volume_bytes_per_second": "# Global only: bytes per second per destination volume, shared by all hotfolders",
+    "volume_files_per_second": "# Global only: files per second per destination volume, shared by all hotfolders",
     "log_retention": "# Days to keep log files",
+    "db_journal_mode": "# SQLite journal mode for the state DB (WAL recommended)",
+    "db_synchronous": "# SQLite synchronous pragma: OFF, NORMAL, FULL or EXTRA",
+    "db_cache_size": "# SQLite cache_size pragma (negative = KiB, positive = pages)",
     "debug": "# Enable debug logging",
+    "profile_scans": "# Profile scans: none, sampling or cprofile (top functions go into slow-scan traces)",
+    "slow_scan_threshold": "# Seconds after which a scan's trace is written to .log/ (0 = never)",
     "heartbeat_enabled": "# Enable writing a heartbeat.txt file for external monitoring",
+    "metrics_enabled": "# Serve Prometheus metrics over HTTP",
+    "metrics_host": "# Address the metrics endpoint listens on",
+    "metrics_port": "# Port of the metrics endpoint (http://host:port/metrics)",
+    "cluster_enabled": "# Share hotfolders between agent processes through leases",
+    "cluster_processes": "# Worker processes started by this agent (each gets a share of the hotfolders)",
+    "cluster_db": "# Coordination DB shared by all workers (empty = .cluster/ in the first hotfolder root)",
+    "lease_ttl": "# Seconds a worker's hotfolders stay leased without a heartbeat",
 }
 
 GLOBAL_CONFIG_PATH = Path(__file__).parent.parent.parent / "config.yml"
 
 GROUPED_KEYS = OrderedDict([
     ("hotfolders", []),
-    ("schedule", ["scan_interval", "resting_time"]),
+    ("schedule", ["scan_interval", "resting_time", "watch_backend", "idle_rescan_interval", "scan_workers", "priority", "small_jobs_first", "small_job_size"]),
     ("retention", ["keep_copy", "cleanup", "cleanup_time"]),
-    ("structure", ["dissolve_folders"]),
+    ("structure", ["dissolve_folders", "dissolve_collision", "dissolve_ignore_case"]),
     ("metadata", ["inject_folder_name", "metadata_field"]),
     ("auto_cleanup", ["ds_store", "thumbs_db"]),
     ("mtime", ["update_mtime"]),
+    ("changes", ["change_detection", "hash_sample_size"]),
+    ("transfer", ["transfer_workers", "copy_buffer_size", "delta_sync", "delta_block_size", "staged_delivery", "staging_fsync_batch", "max_bytes_in_flight"]),
+    ("cpu", ["cpu_workers", "cpu_queue_size"]),
+    ("throttle", ["max_bytes_per_second", "max_files_per_second", "volume_bytes_per_second", "volume_files_per_second"]),
     ("logging", ["log_retention"]),
-    ("debugging", ["debug"]),
+    ("database", ["db_journal_mode", "db_synchronous", "db_cache_size"]),
+    ("debugging", ["debug", "profile_scans", "slow_scan_threshold"]),
 ])
 
 REQUIRED_FIELDS = [
@@ -66,10 +114,18 @@ DEFAULT_CONFIG = {
     "hotfolders": [],
     "scan_interval": 10,
     "resting_time": 300,
+    "watch_backend": "auto",
+    "idle_rescan_interval": 300,
+    "scan_workers": 4,
+    "priority": 0,
+    "small_jobs_first": False,
+    "small_job_size": 104857600,
     "cleanup": True,
     "keep_copy": False,
     "cleanup_time": 1440,
     "dissolve_folders": False,
+    "dissolve_collision": "suffix",
+    "dissolve_ignore_case": False,
     "inject_folder_name": False,
     "metadata_field": "headline",
     "log_retention": 7,
@@ -77,15 +133,67 @@ DEFAULT_CONFIG = {
     "update_mtime": True,
     "debug": False,
     "thumbs_db": True,
+    "change_detection": "mtime",
+    "hash_sample_size": 1048576,
+    "transfer_workers": 4,
+    "copy_buffer_size": 8388608,
+    "delta_sync": False,
+    "delta_block_size": 1048576,
+    "staged_delivery": False,
+    "staging_fsync_batch": 64,
+    "max_bytes_in_flight": 0,
+    "cpu_workers": 2,
+    "cpu_queue_size": 0,
+    "max_bytes_per_second": 0,
+    "max_files_per_second": 0,
+    "volume_bytes_per_second": 0,
+    "volume_files_per_second": 0,
+    "db_journal_mode": "WAL",
+    "db_synchronous": "NORMAL",
+    "db_cache_size": -2000,
+    "profile_scans": "none",
+    "slow_scan_threshold": 60,
+}
+
+# Keys that only make sense in the global config.yml; left out of per-hotfolder examples and overrides
+GLOBAL_ONLY_KEYS = ["scan_workers", "metadata_workers", "cpu_workers", "cpu_queue_size", "transfer_workers", "copy_buffer_size",
+                    "volume_bytes_per_second", "volume_files_per_second"]
+
+# Optional keys: validated when present in a per-hotfolder config, defaulted otherwise
+OPTIONAL_TYPE_CHECKS = {
+    "watch_backend": str,
+    "idle_rescan_interval": int,
+    "priority": int,
+    "small_jobs_first": bool,
+    "small_job_size": int,
+    "dissolve_collision": str,
+    "dissolve_ignore_case": bool,
+    "change_detection": str,
+    "hash_sample_size": int,
+    "delta_sync": bool,
+    "delta_block_size": int,
+    "staged_delivery": bool,
+    "staging_fsync_batch": int,
+    "max_bytes_in_flight": int,
+    "max_bytes_per_second": int,
+    "max_files_per_second": int,
+    "db_journal_mode": str,
+    "db_synchronous": str,
+    "db_cache_size": int,
+    "profile_scans": str,
+    "slow_scan_threshold": int,
 }
 
 def flatten_grouped_config(config, *, global_only=False):
     flat = dict(config)
     for group, keys in GROUPED_KEYS.items():
-        group_val = config.get(group, {})
+        group_val = config.get(group) or {}
         if group == "metadata":
             flat["inject_folder_name"] = group_val.get("inject_folder_name", False)
             flat["metadata_field"] = group_val.get("metadata_field", "headline")
+            if "metadata_workers" in group_val:
+                # Superseded by cpu.cpu_workers; still used when that is not set
+                flat["metadata_workers"] = group_val["metadata_workers"]
         elif group == "hotfolders":
             if "hotfolders" in config:
                 flat["hotfolders"] = config["hotfolders"]
@@ -102,6 +210,13 @@ def flatten_grouped_config(config, *, global_only=False):
         if isinstance(group_val, dict):
             for k, v in group_val.items():
                 flat[k] = v
+    if global_only and isinstance(config.get("metrics"), dict):
+        # Like heartbeat, metrics are global only
+        for k, v in config["metrics"].items():
+            flat[k] = v
+    if global_only and isinstance(config.get("cluster"), dict):
+        for k, v in config["cluster"].items():
+            flat[k] = v
     if "auto_cleanup" in config:
         flat["ds_store"] = config["auto_cleanup"].get("ds_store", True)
         flat["thumbs_db"] = config["auto_cleanup"].get("thumbs_db", True)
@@ -121,13 +236,36 @@ def validate_config(config):
         raise ValueError(f"Missing required config fields: {missing}")
     return config
 
+# Parsed configs, re-read only when the file's (mtime, size, inode) changes
+_global_config_cache = None  # (path, signature, config)
+_effective_config_cache = {}  # {hotfolder path: (signature, global_config, config)}
+
+def _file_signature(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size, st.st_ino)
+
 def load_global_config():
-    if GLOBAL_CONFIG_PATH.exists():
-        with open(GLOBAL_CONFIG_PATH, "r") as f:
+    """
+    Return the flattened global config as a read-only mapping.
+    config.yml is only parsed again when it changes on disk.
+    """
+    global _global_config_cache
+    path = GLOBAL_CONFIG_PATH
+    signature = _file_signature(path)
+    cached = _global_config_cache
+    if cached is not None and cached[0] == path and cached[1] == signature:
+        return cached[2]
+    if signature is not None:
+        with open(path, "r") as f:
             config = yaml.safe_load(f)
-        flat = flatten_grouped_config(config, global_only=True)
-        return flat
-    return DEFAULT_CONFIG
+        flat = MappingProxyType(flatten_grouped_config(config, global_only=True))
+    else:
+        flat = MappingProxyType(dict(DEFAULT_CONFIG))
+    _global_config_cache = (path, signature, flat)
+    return flat
 
 def generate_example_config_dict(include_hotfolders=True, example_config=None):
     # Returns an OrderedDict for the example config, with or without hotfolders
@@ -145,7 +283,10 @@ def generate_example_config_dict(include_hotfolders=True, example_config=None):
                 "metadata_field": example_config["metadata_field"]
             }
         else:
-            grouped_example[group] = {k: example_config[k] for k in GROUPED_KEYS[group]}
+            keys = [k for k in GROUPED_KEYS[group] if include_hotfolders or k not in GLOBAL_ONLY_KEYS]
+            if not keys:
+                continue  # Group holds only global-only keys
+            grouped_example[group] = {k: example_config.get(k, DEFAULT_CONFIG.get(k)) for k in keys}
     return grouped_example
 
 def dump_with_comments(data):
@@ -191,17 +332,52 @@ def dump_with_headlines_no_comments(data):
     return "\n".join(lines)
 
 def get_effective_config(hotfolder_path, global_config=None):
-    from hotfolder.logger import get_hotfolder_logger
+    """
+    Return the effective config of a hotfolder as a read-only mapping.
+    The result is cached per hotfolder and only rebuilt when .config/config.yml changes on disk
+    or a different global config is passed, so calling this on every scan costs a single stat().
+    """
     hotfolder_path = Path(hotfolder_path)
+    if global_config is None:
+        global_config = load_global_config()
+    key = str(hotfolder_path)
+    signature = _file_signature(hotfolder_path / ".config" / "config.yml")
+    cached = _effective_config_cache.get(key)
+    if cached is not None and cached[0] == signature and cached[1] is global_config:
+        return cached[2]
+    config = MappingProxyType(_load_effective_config(hotfolder_path, global_config))
+    _effective_config_cache[key] = (signature, global_config, config)
+    return config
+
+def clear_config_cache(hotfolder_path=None):
+    """
+    Forget the cached effective config of one hotfolder, or of all hotfolders and the global config.
+    """
+    global _global_config_cache
+    if hotfolder_path is None:
+        _effective_config_cache.clear()
+        _global_config_cache = None
+    else:
+        _effective_config_cache.pop(str(Path(hotfolder_path)), None)
+
+def _load_effective_config(hotfolder_path, global_config):
+    from hotfolder.logger import get_hotfolder_logger
     config_dir = hotfolder_path / ".config"
-    config_dir.mkdir(exist_ok=True)
     config_file = config_dir / "config.yml"
     example_file = config_dir / "config.yml.example"
-    base = dict(global_config or load_global_config())
+    base = dict(global_config)
     base.pop("hotfolders", None)
     # Remove heartbeat from per-hotfolder config
     base.pop("heartbeat", None)
     base.pop("heartbeat_enabled", None)
+    # Metrics are served for the whole agent
+    for key in ("metrics", "metrics_enabled", "metrics_host", "metrics_port"):
+        base.pop(key, None)
+    # So is the cluster a process belongs to
+    for key in ("cluster", "cluster_enabled", "cluster_processes", "cluster_db", "lease_ttl"):
+        base.pop(key, None)
+    for key in GLOBAL_ONLY_KEYS:
+        base.pop(key, None)
     example_config = {**DEFAULT_CONFIG, **base}
     # Per-hotfolder config example: no hotfolders group, with comments, and NO heartbeat
     grouped_example = generate_example_config_dict(include_hotfolders=False, example_config=example_config)
@@ -234,6 +410,13 @@ def get_effective_config(hotfolder_path, global_config=None):
             if not isinstance(val, expected_type):
                 logger.error(f"[CONFIG ERROR] Key '{key}' in per-hotfolder config for {hotfolder_path} has wrong type: expected {expected_type.__name__}, got {type(val).__name__}. Failing hotfolder processing.")
                 raise ValueError(f"Key '{key}' in per-hotfolder config for {hotfolder_path} has wrong type: expected {expected_type.__name__}, got {type(val).__name__}")
+        for key, expected_type in OPTIONAL_TYPE_CHECKS.items():
+            if key not in flat_folder:
+                continue
+            val = flat_folder[key]
+            if not isinstance(val, expected_type):
+                logger.error(f"[CONFIG ERROR] Key '{key}' in per-hotfolder config for {hotfolder_path} has wrong type: expected {expected_type.__name__}, got {type(val).__name__}. Failing hotfolder processing.")
+                raise ValueError(f"Key '{key}' in per-hotfolder config for {hotfolder_path} has wrong type: expected {expected_type.__name__}, got {type(val).__name__}")
         if flat_folder["scan_interval"] <= 0:
             logger.error(f"[CONFIG ERROR] scan_interval must be > 0 in per-hotfolder config for {hotfolder_path}. Failing hotfolder processing.")
             raise ValueError(f"scan_interval must be > 0 in per-hotfolder config for {hotfolder_path}")
@@ -248,7 +431,8 @@ def get_effective_config(hotfolder_path, global_config=None):
             raise ValueError(f"log_retention must be >= 0 in per-hotfolder config for {hotfolder_path}")
         return flat_folder
     else:
-        if not example_file.exists():
+        if hotfolder_path.is_dir() and not example_file.exists():
+            config_dir.mkdir(exist_ok=True)
             with open(example_file, "w") as f:
                 # Write example config with headlines and empty lines, but no inline comments
                 # NO heartbeat in per-hotfolder config.example
@@ -0,0 +1,92 @@
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+
+class CpuPool:
+    """
+    Process pool for CPU-bound job steps (content hashing, image metadata), shared by all hotfolders so a few
+    busy hotfolders cannot hold the GIL that every scan and transfer thread needs. At most queue_size tasks
+    are queued or running at once, and one hotfolder may use at most half of them: a scan thread that has
+    filled its share blocks until its own tasks finish (backpressure), while other hotfolders still get slots.
+    With workers <= 1, or a single task, the work runs in the calling thread.
+    """
+    def __init__(self, workers=2, queue_size=0):
+        self.workers = max(1, int(workers))
+        self.queue_size = max(2, int(queue_size or 4 * self.workers))
+        self._slots = threading.BoundedSemaphore(self.queue_size)
+        self._owner_slots = {}  # {owner: BoundedSemaphore}, each hotfolder's share of the queue
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs scan, transfer and log threads is not safe
+                self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            return self._executor
+
+    def _owner(self, owner):
+        with self._lock:
+            slots = self._owner_slots.get(owner)
+            if slots is None:
+                slots = self._owner_slots[owner] = threading.BoundedSemaphore(self.queue_size // 2)
+            return slots
+
+    def forget(self, owner):
+        """
+        Drop the queue share of a hotfolder that is no longer watched.
+        """
+        with self._lock:
+            self._owner_slots.pop(owner, None)
+
+    def map(self, fn, *iterables, owner=None):
+        """
+        Run fn over the argument iterables like Executor.map, submitting as queue slots free up.
+        Returns [(result, error)] in order, where error is None or the exception that task raised,
+        so the caller can record failures in its hotfolder's state DB and log.
+        """
+        calls = list(zip(*iterables))
+        if self.workers == 1 or len(calls) <= 1:
+            return [_call(fn, args) for args in calls]
+        owner_slots = self._owner(owner)
+        futures = []
+        results = []
+        try:
+            for args in calls:
+                owner_slots.acquire()
+                self._slots.acquire()
+                try:
+                    future = self._pool().submit(fn, *args)
+                except BaseException:
+                    self._slots.release()
+                    owner_slots.release()
+                    raise
+                future.add_done_callback(lambda _, owner_slots=owner_slots: (self._slots.release(), owner_slots.release()))
+                futures.append(future)
+            for future in futures:
+                error = future.exception()
+                if isinstance(error, BrokenProcessPool):
+                    raise error
+                results.append((None, error) if error is not None else (future.result(), None))
+        except BrokenProcessPool:
+            # A worker died (e.g. killed by the OS); drop the pool and finish the rest serially
+            self.shutdown(wait=False)
+            for future in futures:
+                future.cancel()
+            return results + [_call(fn, args) for args in calls[len(results):]]
+        return results
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
+
+
+def _call(fn, args):
+    try:
+        return fn(*args), None
+    except Exception as e:
+        return None, e
@@ -0,0 +1,62 @@
+import hashlib
+import os
+import shutil
+
+DELTA_BLOCK_SIZE = 1024 * 1024
+DIGEST_SIZE = 16
+
+
+def _block_digest(block):
+    return hashlib.blake2b(block, digest_size=DIGEST_SIZE).digest()
+
+
+def split_signatures(blob):
+    """
+    Split a stored signature blob into the list of per-block digests.
+    """
+    return [blob[i:i + DIGEST_SIZE] for i in range(0, len(blob), DIGEST_SIZE)]
+
+
+def delta_sync_file(src, dst, block_size=DELTA_BLOCK_SIZE, previous=None):
+    """
+    Bring dst up to date with src, rewriting only the fixed-size blocks that changed.
+
+    previous: (block_size, out_size, out_mtime_ns, signatures) recorded when dst was last delivered,
+    or None. The delta is only used if dst still has exactly that size and mtime and the block size
+    matches; otherwise dst is rewritten in full. Block positions are fixed, so appended data (extra
+    PDF revisions, TIFF pages) only rewrites the last partial block and the new tail; an insertion
+    rewrites everything after it.
+
+    Metadata is copied like shutil.copy2. Returns (bytes_written, record, method) where record is the
+    new (block_size, out_size, out_mtime_ns, signatures) to persist for the next delivery.
+    """
+    src, dst = str(src), str(dst)
+    usable = False
+    if previous is not None and previous[0] == block_size:
+        try:
+            st = os.stat(dst)
+            usable = (st.st_size, st.st_mtime_ns) == (previous[1], previous[2])
+        except FileNotFoundError:
+            pass
+    old_signatures = split_signatures(previous[3]) if usable else []
+    signatures = []
+    written = 0
+    with open(src, "rb") as fsrc, open(dst, "r+b" if usable else "wb") as fdst:
+        index = 0
+        while True:
+            block = fsrc.read(block_size)
+            if not block:
+                break
+            digest = _block_digest(block)
+            signatures.append(digest)
+            if index >= len(old_signatures) or old_signatures[index] != digest:
+                fdst.seek(index * block_size)
+                fdst.write(block)
+                written += len(block)
+            index += 1
+        size = fsrc.tell()
+        fdst.truncate(size)
+    shutil.copystat(src, dst)
+    st = os.stat(dst)
+    record = (block_size, st.st_size, st.st_mtime_ns, b"".join(signatures))
+    return written, record, "delta" if usable else "full"
@@ -0,0 +1,161 @@
+import os
+import unicodedata
+from pathlib import Path
+from hotfolder.hashing import file_digest
+
+# How a flattened file whose name is already taken in OUT (or by another file of the job) is delivered:
+# suffix: as name_1.ext, name_2.ext, ...
+# hash: dropped if its content equals the file holding the name (or name_<digest>.ext), else as name_<digest>.ext
+# keep_newest: between files of the job, the newest (by mtime) keeps the name and the others stay in IN;
+#   a name taken in OUT is handled as in suffix (the mtime of a delivered file is its delivery time)
+# overwrite: replaces the file holding the name (the behaviour before collision handling)
+DISSOLVE_COLLISIONS = ("suffix", "hash", "keep_newest", "overwrite")
+# Hex digits of the content digest appended in hash mode
+HASH_SUFFIX_LENGTH = 8
+
+
+class NameIndex:
+    """
+    The names in one OUT folder, listed with a single os.scandir(), so placing the files of a
+    dissolved job costs one directory read on the share instead of one lookup per file. Names delivered
+    later are added with update(); the index is not refreshed from disk.
+    ignore_case: treat names that differ only in case or Unicode normalization as the same, as SMB shares
+    and macOS volumes do; otherwise names are compared exactly.
+    """
+    def __init__(self, folder, ignore_case=False):
+        self.folder = Path(folder)
+        self.ignore_case = ignore_case
+        self.names = {}  # {key: name as spelled in OUT}
+        self.dirs = set()  # keys of names held by directories (or anything else that is not a regular file)
+        try:
+            with os.scandir(self.folder) as it:
+                for entry in it:
+                    self.names[self.key(entry.name)] = entry.name
+                    if not entry.is_file(follow_symlinks=False):
+                        self.dirs.add(self.key(entry.name))
+        except FileNotFoundError:
+            pass
+
+    def key(self, name):
+        if self.ignore_case:
+            return unicodedata.normalize('NFC', name).casefold()
+        return name
+
+    def get(self, name):
+        """
+        Return the spelling of name in OUT, or None if it is free.
+        """
+        return self.names.get(self.key(name))
+
+    def is_file(self, name):
+        """
+        True if name is held by a regular file in OUT, whose content can be compared or replaced.
+        """
+        return self.key(name) in self.names and self.key(name) not in self.dirs
+
+    def update(self, names):
+        for name in names:
+            self.names[self.key(name)] = name
+            self.dirs.discard(self.key(name))
+
+
+def plan_dissolve(files, index, collision="suffix"):
+    """
+    Destinations for flattening files (source paths of one job) into index.folder.
+    Returns (tasks, dropped): tasks are the (src, dst) pairs to transfer, dropped (src, identical) pairs for the
+    sources that are not delivered; identical is True when the same content is already in OUT or delivered
+    by this job ('hash'), False when another file of the job takes the name ('keep_newest', 'overwrite').
+    Sources are placed in path order, so the same job in the same OUT always gets the same names;
+    index is not changed (see NameIndex.update). A name held by a directory in OUT is taken, but
+    never compared or overwritten: the file gets a suffix (or its hashed name) instead.
+    """
+    if collision not in DISSOLVE_COLLISIONS:
+        collision = "suffix"
+    out = index.folder
+    key = index.key
+    planned = {}  # {name key: (src, dst)} names taken by this job
+    newest = {}  # {source name key: key of the name it was placed under} for keep_newest
+    dropped = []
+    digests = {}
+
+    def digest(path):
+        if path not in digests:
+            digests[path] = file_digest(path).rsplit(':', 1)[-1]
+        return digests[path]
+
+    def holder_of(name):
+        # The file that holds name: a source of this job, a file already in OUT, or None
+        if key(name) in planned:
+            return planned[key(name)][0]
+        spelling = index.get(name)
+        return out / spelling if spelling is not None else None
+
+    def taken(name):
+        return holder_of(name) is not None
+
+    def comparable(name):
+        # Held by a file of this job or a regular file in OUT, not by a directory
+        return key(name) in planned or index.is_file(name)
+
+    counters = {}  # {key of stem + ext: next suffix to try}, so many same-named files stay linear
+
+    def free_name(stem, ext):
+        n = counters.get(key(stem + ext), 1)
+        while taken(f"{stem}_{n}{ext}"):
+            n += 1
+        counters[key(stem + ext)] = n + 1
+        return f"{stem}_{n}{ext}"
+
+    for src in sorted((Path(f) for f in files), key=lambda p: p.as_posix()):
+        name = src.name
+        name_key = key(name)
+        if collision == "keep_newest" and name_key in newest:
+            # Only files of this job compete; the older one is not delivered and stays in IN
+            slot = newest[name_key]
+            holder, dst = planned[slot]
+            if os.stat(src).st_mtime > os.stat(holder).st_mtime:
+                planned[slot] = (src, dst)
+                src = holder
+            dropped.append((src, False))
+            continue
+        holder = planned.get(name_key)
+        holder_path = holder_of(name)
+        stem, ext = os.path.splitext(name)
+        if holder_path is None:
+            target = name
+        elif collision == "overwrite" and comparable(name):
+            if holder:
+                dropped.append((holder[0], False))
+            planned[name_key] = (src, holder[1] if holder else holder_path)
+            continue
+        elif collision == "hash":
+            if comparable(name) and digest(src) == digest(holder_path):
+                dropped.append((src, True))
+                continue
+            target = f"{stem}_{digest(src)[:HASH_SUFFIX_LENGTH]}{ext}"
+            if taken(target):
+                if comparable(target) and digest(src) == digest(holder_of(target)):
+                    dropped.append((src, True))  # Delivered under its hashed name already
+                    continue
+                target = free_name(f"{stem}_{digest(src)[:HASH_SUFFIX_LENGTH]}", ext)
+        else:
+            target = free_name(stem, ext)
+        planned[key(target)] = (src, out / target)
+        newest[name_key] = key(target)
+    return list(planned.values()), dropped
+
+
+def remove_empty_dirs(folder):
+    """
+    Remove the empty directories below folder (not folder itself), deepest first, in one walk.
+    Returns the number removed.
+    """
+    removed = 0
+    for root, dirs, _ in os.walk(folder, topdown=False):
+        for name in dirs:
+            try:
+                os.rmdir(os.path.join(root, name))
+                removed += 1
+            except OSError:
+                pass  # Not empty
+    return removed
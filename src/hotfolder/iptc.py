@@ -0,0 +1,283 @@
+import os
+import shutil
+import struct
+import tempfile
+
+from hotfolder.transfer import COPY_BUFFER_SIZE
+
+# IPTC-NAA (IIM) records are stored in JPEG files as Photoshop image resource 0x0404 inside an APP13
+# segment, and in TIFF files under tag 33723 of the first IFD. Both are patched where they are: the new
+# record block overwrites the old one and is padded with NULs (which IIM readers stop at) when shorter.
+# Only a JPEG whose block must grow is rewritten, streaming everything after APP13 in large chunks.
+
+PHOTOSHOP_HEADER = b"Photoshop 3.0\x00"
+IIM_RESOURCE_ID = 0x0404
+TIFF_IPTC_TAG = 33723
+_TIFF_TYPE_SIZES = {1: 1, 2: 1, 3: 2, 4: 4, 5: 8, 6: 1, 7: 1, 8: 2, 9: 4, 10: 8, 11: 4, 12: 8, 13: 4}
+_UTF8_CHARSET = b"\x1b%G"  # IIM 1:90 coded character set for UTF-8
+# A block that has to grow is padded to a multiple of this, so the next change usually fits in place
+IIM_PADDING = 256
+
+
+class UnsupportedImage(Exception):
+    """
+    The file is not a JPEG or classic TIFF, so it has no place to store IPTC-NAA records.
+    """
+
+
+def parse_iim(data):
+    """
+    Split an IIM block into a list of (record, dataset, value). Parsing stops at the first byte that does
+    not start a record, so trailing NUL padding is ignored.
+    """
+    records = []
+    pos = 0
+    while pos + 5 <= len(data) and data[pos] == 0x1c:
+        record, dataset, length = struct.unpack(">BBH", data[pos + 1:pos + 5])
+        pos += 5
+        if length & 0x8000:
+            # Extended dataset: the low bits give the size of the length field that follows
+            size = length & 0x7fff
+            length = int.from_bytes(data[pos:pos + size], "big")
+            pos += size
+        records.append((record, dataset, bytes(data[pos:pos + length])))
+        pos += length
+    return records
+
+
+def pack_iim(records):
+    """
+    Inverse of parse_iim().
+    """
+    out = []
+    for record, dataset, value in records:
+        if len(value) < 0x8000:
+            out.append(struct.pack(">BBBH", 0x1c, record, dataset, len(value)))
+        else:
+            out.append(struct.pack(">BBBHI", 0x1c, record, dataset, 0x8004, len(value)))
+        out.append(value)
+    return b"".join(out)
+
+
+def set_dataset(records, dataset, value):
+    """
+    Return records with every record 2 entry of dataset replaced by a single one holding value (bytes),
+    or None if that is already the only value.
+    """
+    current = [v for r, d, v in records if r == 2 and d == dataset]
+    if current == [value]:
+        return None
+    records = list(records)
+    position = next((i for i, (r, d, _) in enumerate(records) if r == 2 and d == dataset), None)
+    records = [entry for entry in records if not (entry[0] == 2 and entry[1] == dataset)]
+    if position is None:
+        position = next((i for i, (r, d, _) in enumerate(records) if r == 2 and d > dataset), None)
+    if position is None:
+        position = next((i for i, (r, _, _) in enumerate(records) if r > 2), len(records))
+    records.insert(position, (2, dataset, value))
+    if not any(r == 2 and d == 0 for r, d, _ in records):
+        position = next((i for i, (r, _, _) in enumerate(records) if r >= 2), len(records))
+        records.insert(position, (2, 0, b"\x00\x04"))  # Record version 4
+    if not value.isascii() and not any(r == 1 and d == 90 for r, d, _ in records):
+        position = next((i for i, (r, _, _) in enumerate(records) if r > 1), len(records))
+        records.insert(position, (1, 90, _UTF8_CHARSET))
+    return records
+
+
+def write_iptc(file_path, dataset, value):
+    """
+    Set IIM dataset (record 2) of a JPEG or TIFF file to value (str, stored as UTF-8).
+    Returns 'present' if the file already carries exactly that value, 'patched' if the block was
+    overwritten in place, 'appended' if a TIFF block was appended and its tag repointed, or 'rewritten'
+    if a JPEG had to be rewritten to make room. Raises UnsupportedImage for other formats.
+    """
+    value = value.encode("utf-8") if isinstance(value, str) else bytes(value)
+    with open(file_path, "r+b") as f:
+        head = f.read(4)
+        if head[:2] == b"\xff\xd8":
+            return _write_jpeg(file_path, f, dataset, value)
+        if head in (b"II*\x00", b"MM\x00*"):
+            return _write_tiff(f, "<" if head[:2] == b"II" else ">", dataset, value)
+    raise UnsupportedImage(f"{file_path} is not a JPEG or TIFF file")
+
+
+# --- JPEG ---
+
+def _jpeg_segments(f):
+    # Yield (offset, marker, payload length) for every segment before the image data
+    f.seek(2)
+    while True:
+        offset = f.tell()
+        byte = f.read(1)
+        while byte == b"\xff":
+            marker = f.read(1)
+            if marker != b"\xff":
+                break
+            offset += 1
+        else:
+            return
+        if not marker:
+            return
+        marker = marker[0]
+        if marker == 0x01 or 0xd0 <= marker <= 0xd7:
+            continue  # Standalone markers carry no length
+        if marker in (0xd9, 0xda):
+            return  # EOI / start of scan: metadata segments all come before this
+        length_bytes = f.read(2)
+        if len(length_bytes) < 2:
+            return
+        length = struct.unpack(">H", length_bytes)[0] - 2
+        yield offset, marker, length
+        f.seek(offset + 4 + length)
+
+
+def _photoshop_resources(payload):
+    # Yield (id, name bytes, data offset within payload, data length) for each 8BIM resource
+    pos = len(PHOTOSHOP_HEADER)
+    while pos + 12 <= len(payload) and payload[pos:pos + 4] == b"8BIM":
+        resource_id = struct.unpack(">H", payload[pos + 4:pos + 6])[0]
+        name_length = payload[pos + 6]
+        name_end = pos + 7 + name_length
+        name_end += (name_end - pos - 6) % 2  # Pascal string padded to even length
+        name = payload[pos + 6:name_end]
+        size = struct.unpack(">I", payload[name_end:name_end + 4])[0]
+        data_start = name_end + 4
+        if data_start + size > len(payload):
+            raise ValueError("Photoshop resource runs past the end of its APP13 segment")
+        yield resource_id, name, data_start, size
+        pos = data_start + size + (size % 2)
+
+
+def _photoshop_resource(resource_id, name, data):
+    return b"8BIM" + struct.pack(">H", resource_id) + name + struct.pack(">I", len(data)) + data + b"\x00" * (len(data) % 2)
+
+
+def _write_jpeg(file_path, f, dataset, value):
+    app13 = None   # (segment offset, payload length, payload)
+    insert_at = 2  # after SOI and any APP0/APP1 (JFIF, Exif, XMP), where a new APP13 belongs
+    for offset, marker, length in _jpeg_segments(f):
+        if marker == 0xed:
+            payload = f.read(length)
+            if payload.startswith(PHOTOSHOP_HEADER) and app13 is None:
+                app13 = (offset, length, payload)
+        elif marker in (0xe0, 0xe1) and app13 is None:
+            insert_at = offset + 4 + length
+    resources = []
+    iim = None
+    if app13 is not None:
+        offset, length, payload = app13
+        for resource_id, name, data_start, size in _photoshop_resources(payload):
+            resources.append((resource_id, name, payload[data_start:data_start + size]))
+            if resource_id == IIM_RESOURCE_ID and iim is None:
+                iim = (data_start, size)
+    records = parse_iim(app13[2][iim[0]:iim[0] + iim[1]]) if iim else []
+    records = set_dataset(records, dataset, value)
+    if records is None:
+        return "present"
+    block = pack_iim(records)
+    if iim is not None and len(block) <= iim[1]:
+        f.seek(app13[0] + 4 + iim[0])
+        f.write(block + b"\x00" * (iim[1] - len(block)))
+        return "patched"
+    # The block has to grow (or there is none yet): rebuild APP13 with every other resource kept
+    block += b"\x00" * (-len(block) % IIM_PADDING)
+    if iim is not None:
+        resources = [(r, n, block if r == IIM_RESOURCE_ID else d) for r, n, d in resources]
+    else:
+        resources.append((IIM_RESOURCE_ID, b"\x00\x00", block))
+    payload = PHOTOSHOP_HEADER + b"".join(_photoshop_resource(*resource) for resource in resources)
+    if len(payload) + 2 > 0xffff:
+        raise ValueError("IPTC block does not fit into a single APP13 segment")
+    segment = b"\xff\xed" + struct.pack(">H", len(payload) + 2) + payload
+    if app13 is not None:
+        start, end = app13[0], app13[0] + 4 + app13[1]
+    else:
+        start = end = insert_at
+    _rewrite(file_path, f, start, end, segment)
+    return "rewritten"
+
+
+def _rewrite(file_path, f, start, end, replacement):
+    # Write file[:start] + replacement + file[end:] to a sibling file and rename it over file_path
+    directory, name = os.path.split(os.path.abspath(file_path))
+    fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=".iptc", dir=directory)
+    try:
+        with os.fdopen(fd, "wb") as out:
+            f.seek(0)
+            out.write(f.read(start))
+            out.write(replacement)
+            f.seek(end)
+            shutil.copyfileobj(f, out, COPY_BUFFER_SIZE)
+        shutil.copymode(file_path, tmp_path)
+        os.replace(tmp_path, file_path)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except FileNotFoundError:
+            pass
+        raise
+
+
+# --- TIFF ---
+
+def _write_tiff(f, order, dataset, value):
+    f.seek(4)
+    ifd_offset = struct.unpack(order + "I", f.read(4))[0]
+    f.seek(ifd_offset)
+    count = struct.unpack(order + "H", f.read(2))[0]
+    entries = [f.read(12) for _ in range(count)]
+    next_ifd = f.read(4)
+    index = None
+    for i, entry in enumerate(entries):
+        if struct.unpack(order + "H", entry[:2])[0] == TIFF_IPTC_TAG:
+            index = i
+            break
+    data_type, data_count, data_offset, capacity = 7, 0, 0, 0
+    records = []
+    if index is not None:
+        _, data_type, data_count = struct.unpack(order + "HHI", entries[index][:8])
+        capacity = data_count * _TIFF_TYPE_SIZES.get(data_type, 1)
+        if capacity <= 4:
+            data_offset = ifd_offset + 2 + index * 12 + 8  # Value stored inline in the entry
+        else:
+            data_offset = struct.unpack(order + "I", entries[index][8:])[0]
+        f.seek(data_offset)
+        records = parse_iim(f.read(capacity))
+    records = set_dataset(records, dataset, value)
+    if records is None:
+        return "present"
+    block = pack_iim(records)
+    unit = _TIFF_TYPE_SIZES.get(data_type, 1)
+    if len(block) % unit:
+        block += b"\x00" * (unit - len(block) % unit)  # LONG-typed tags count 4-byte units
+    if index is not None and len(block) <= capacity:
+        f.seek(data_offset)
+        f.write(block + b"\x00" * (capacity - len(block)))
+        return "patched"
+    # Append the block (word aligned) instead of rewriting the file; the old block is blanked once the
+    # tag points at the new one, since readers that scan for IIM markers (iptcinfo3) would still find it
+    block += b"\x00" * (-len(block) % IIM_PADDING)
+    end = f.seek(0, os.SEEK_END)
+    if end % 2:
+        f.write(b"\x00")
+        end += 1
+    f.write(block)
+    entry = struct.pack(order + "HHII", TIFF_IPTC_TAG, data_type, len(block) // unit, end)
+    if index is not None:
+        f.seek(ifd_offset + 2 + index * 12)
+        f.write(entry)
+        if capacity > 4:
+            f.seek(data_offset)
+            f.write(b"\x00" * capacity)
+        return "appended"
+    # No IPTC tag yet: write a copy of the first IFD with the new entry and point the header at it
+    entries.append(entry)
+    entries.sort(key=lambda e: struct.unpack(order + "H", e[:2])[0])
+    new_ifd = f.seek(0, os.SEEK_END)
+    if new_ifd % 2:
+        f.write(b"\x00")
+        new_ifd += 1
+    f.write(struct.pack(order + "H", len(entries)) + b"".join(entries) + next_ifd)
+    f.seek(4)
+    f.write(struct.pack(order + "I", new_ifd))
+    return "appended"
@@ -0,0 +1,76 @@
+import os
+import time
+from pathlib import Path
+
+# Completions are written to the state DB at most this often while a job is transferring
+FLUSH_INTERVAL = 1.0
+
+
+class TransferJournal:
+    """
+    Journal of one job's transfer to OUT, kept in the state DB's transfer_journal table.
+    begin() records every file that is about to be copied or moved and commits at once, so the intent
+    survives a crash even inside a state_db.transaction(). done() is the TransferEngine on_done callback
+    and marks files as arrived (committed every FLUSH_INTERVAL seconds); finish() drops the journal once
+    the job's processed state has been written. Must be used from the thread that owns the transaction.
+    """
+    def __init__(self, state_db, folder, job):
+        self.state_db = state_db
+        self.folder = Path(folder)
+        self.job = job
+        self._pending = []
+        self._last_flush = time.monotonic()
+
+    def begin(self, files, mode):
+        """
+        files: iterable of (rel, dst) pairs with rel relative to the hotfolder; mode: 'copy' or 'move'.
+        """
+        rows = []
+        for rel, dst in files:
+            try:
+                st = os.stat(self.folder / rel)
+            except FileNotFoundError:
+                continue
+            rows.append((rel, dst, mode, st.st_size, st.st_mtime))
+        self.state_db.add_journal_intents(rows, time.time())
+        self.state_db.commit()
+
+    def done(self, pairs):
+        for src, _ in pairs:
+            try:
+                self._pending.append(str(Path(src).relative_to(self.folder)))
+            except ValueError:
+                continue  # Not a file of this hotfolder (e.g. a staged clone)
+        if time.monotonic() - self._last_flush >= FLUSH_INTERVAL:
+            self.flush()
+
+    def flush(self):
+        if self._pending:
+            self.state_db.mark_journal_done_many(self._pending)
+            self.state_db.commit()
+            self._pending = []
+        self._last_flush = time.monotonic()
+
+    def finish(self):
+        """
+        Drop the journal; call inside the same transaction that records the job as processed.
+        """
+        self._pending = []
+        self.state_db.clear_journal(self.job)
+
+
+def arrived(src, dst, entry):
+    """
+    True if the journaled file src (or its source, now gone) has completely arrived at dst.
+    Copies keep size and mtime (copystat runs last), so a partial copy never matches; a move whose
+    source is gone has finished, since the source is only removed after the data is in place.
+    """
+    try:
+        dst_stat = os.stat(dst)
+    except FileNotFoundError:
+        return False
+    try:
+        src_stat = os.stat(src)
+    except FileNotFoundError:
+        return entry['mode'] == 'move'
+    return dst_stat.st_size == src_stat.st_size and dst_stat.st_mtime == src_stat.st_mtime
@@ -0,0 +1,166 @@
+import math
+import os
+import socket
+import sqlite3
+import threading
+import time
+from pathlib import Path
+
+# Coordination DB when cluster_db is not set, relative to the first hotfolder root. In a hidden
+# subfolder, so heartbeats do not show up as changes of the root itself
+CLUSTER_DB_PATH = Path(".cluster") / "hotfolder_cluster.db"
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS workers (
+    owner TEXT PRIMARY KEY,
+    host TEXT,
+    pid INTEGER,
+    started REAL,
+    heartbeat REAL
+);
+CREATE TABLE IF NOT EXISTS leases (
+    hotfolder TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    acquired REAL,
+    expires REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_leases_owner ON leases(owner);
+"""
+
+
+def default_owner(worker=None):
+    """
+    Owner id of this process: host:pid, plus the worker index when started by the cluster launcher.
+    """
+    owner = f"{socket.gethostname()}:{os.getpid()}"
+    return owner if worker is None else f"{owner}:{worker}"
+
+
+class LeaseCoordinator:
+    """
+    Hotfolder ownership for several agent processes, on one host or on several hosts mounting the same share.
+    Every process heartbeats into a shared SQLite DB (workers table) and holds time-limited leases on the
+    hotfolders it scans (leases table). heartbeat() renews this process's leases, drops workers that stopped
+    heartbeating, and rebalances: a process claims free or expired leases up to its fair share
+    (ceil(hotfolders / live workers)) and reports the leases above that share for the caller to give up once
+    their scans have finished (release()). A process that dies stops renewing, so its hotfolders are picked up
+    by the others after lease_ttl seconds. Hosts must agree on the time and mount hotfolders at the same paths.
+    """
+    def __init__(self, db_path, owner=None, lease_ttl=30, logger=None):
+        self.db_path = Path(db_path)
+        self.owner = owner or default_owner()
+        self.lease_ttl = float(lease_ttl)
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.expires = {}  # {hotfolder: lease expiry as of the last heartbeat}
+        self.releasing = set()  # Given up, still held until release() once the scan has stopped
+        self.workers = 1
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        # Rollback journal, not WAL: WAL needs shared memory and does not work across hosts
+        self.conn = sqlite3.connect(self.db_path, timeout=self.lease_ttl, isolation_level=None, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=DELETE")
+        self.conn.executescript(_SCHEMA)
+
+    @property
+    def heartbeat_interval(self):
+        # Three renewals per lease_ttl, so a single slow heartbeat does not lose any lease
+        return self.lease_ttl / 3
+
+    def _write(self, fn):
+        # One IMMEDIATE transaction: the write lock is taken up front, so concurrent heartbeats never deadlock
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = fn(self.conn)
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+            return result
+
+    def heartbeat(self, hotfolders):
+        """
+        Renew, claim and rebalance leases for the hotfolders currently found in the roots.
+        Returns the hotfolders this process should scan; held leases missing from the result are
+        surplus and must be passed to release() once their scans have stopped.
+        """
+        hotfolders = sorted(hotfolders)
+        candidates = set(hotfolders)
+
+        def beat(conn):
+            now = time.time()
+            expires = now + self.lease_ttl
+            conn.execute(
+                "INSERT INTO workers (owner, host, pid, started, heartbeat) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(owner) DO UPDATE SET heartbeat = excluded.heartbeat",
+                (self.owner, socket.gethostname(), os.getpid(), now, now))
+            # Workers that missed lease_ttl worth of heartbeats are gone; their leases expire on their own
+            conn.execute("DELETE FROM workers WHERE heartbeat < ?", (now - self.lease_ttl,))
+            conn.execute("DELETE FROM leases WHERE expires < ? AND owner NOT IN (SELECT owner FROM workers)", (now,))
+            workers = conn.execute("SELECT COUNT(*) FROM workers").fetchone()[0]
+            conn.execute("UPDATE leases SET expires = ? WHERE owner = ?", (expires, self.owner))
+            held = {row[0] for row in conn.execute("SELECT hotfolder FROM leases WHERE owner = ?", (self.owner,))}
+            # Leases of hotfolders that no longer exist are dropped
+            gone = held - candidates - self.releasing
+            conn.executemany("DELETE FROM leases WHERE hotfolder = ? AND owner = ?", [(h, self.owner) for h in gone])
+            held -= gone
+            share = math.ceil(len(hotfolders) / max(1, workers))
+            active = sorted(held - self.releasing)
+            if len(active) > share:
+                # Give up the surplus; the other workers claim it once it is released
+                surplus = active[share:]
+                self.releasing.update(surplus)
+                active = active[:share]
+            elif len(active) < share:
+                taken = {row[0]: row[1] for row in conn.execute("SELECT hotfolder, expires FROM leases")}
+                for hotfolder in hotfolders:
+                    if len(active) >= share:
+                        break
+                    if hotfolder in held or taken.get(hotfolder, 0) >= now:
+                        continue
+                    # Free, or expired: claim it unless another worker got there first
+                    cursor = conn.execute(
+                        "INSERT INTO leases (hotfolder, owner, acquired, expires) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(hotfolder) DO UPDATE SET owner = excluded.owner, acquired = excluded.acquired, "
+                        "expires = excluded.expires WHERE leases.expires < ?",
+                        (hotfolder, self.owner, now, expires, now))
+                    if cursor.rowcount:
+                        active.append(hotfolder)
+                        held.add(hotfolder)
+            self.workers = workers
+            self.expires = {hotfolder: expires for hotfolder in held}
+            return set(active)
+
+        return self._write(beat)
+
+    def holds(self, hotfolder):
+        """
+        True while this process's lease on hotfolder is valid. Checked before every scan, so a process whose
+        heartbeats stalled stops touching a hotfolder before another process can claim it.
+        """
+        return self.expires.get(hotfolder, 0) > time.time()
+
+    def release(self, hotfolder):
+        """
+        Give up the lease on a hotfolder this process stopped scanning.
+        """
+        def drop(conn):
+            conn.execute("DELETE FROM leases WHERE hotfolder = ? AND owner = ?", (hotfolder, self.owner))
+            self.expires.pop(hotfolder, None)
+            self.releasing.discard(hotfolder)
+        self._write(drop)
+
+    def close(self):
+        """
+        Leave the cluster: release every lease and the worker entry, so the others rebalance at once.
+        """
+        def leave(conn):
+            conn.execute("DELETE FROM leases WHERE owner = ?", (self.owner,))
+            conn.execute("DELETE FROM workers WHERE owner = ?", (self.owner,))
+        try:
+            self._write(leave)
+        except sqlite3.Error as e:
+            if self.logger is not None:
+                self.logger.error(f"Failed to release hotfolder leases: {e}")
+        self.expires = {}
+        self.conn.close()
@@ -1,7 +1,9 @@
+import atexit
 import logging
-from logging.handlers import TimedRotatingFileHandler
+import queue
+import threading
+from logging.handlers import TimedRotatingFileHandler, QueueHandler, QueueListener
 from pathlib import Path
-import os
 
 class OnDemandFileHandler(logging.Handler):
     def __init__(self, log_file, retention_days):
@@ -10,6 +12,11 @@ class OnDemandFileHandler(logging.Handler):
         self.retention_days = retention_days
         self.inner_handler = None
 
+    def set_retention(self, retention_days):
+        self.retention_days = retention_days
+        if self.inner_handler is not None:
+            self.inner_handler.backupCount = retention_days
+
     def emit(self, record):
         if self.inner_handler is None:
             log_dir = self.log_file.parent
@@ -24,6 +31,68 @@ class OnDemandFileHandler(logging.Handler):
             self.inner_handler.setFormatter(formatter)
         self.inner_handler.emit(record)
 
+    def close(self):
+        if self.inner_handler is not None:
+            self.inner_handler.close()
+            self.inner_handler = None
+        super().close()
+
+# --- Asynchronous file writing ---
+# Loggers only put records on _log_queue; a single listener thread writes them to the log files,
+# so scans and transfers never wait for disk or network-share I/O.
+
+class _SinkQueueHandler(QueueHandler):
+    # Tags each record with the file handler that should write it
+    def __init__(self, log_queue, sink):
+        super().__init__(log_queue)
+        self.sink = sink
+
+    def prepare(self, record):
+        record = super().prepare(record)
+        record.hotfolder_sink = self.sink
+        return record
+
+class _RoutingHandler(logging.Handler):
+    # Runs on the listener thread: writes each record with its sink, or closes the sink on request
+    def emit(self, record):
+        sink = getattr(record, "hotfolder_sink", None)
+        if sink is None:
+            return
+        try:
+            if getattr(record, "hotfolder_close", False):
+                sink.close()
+            else:
+                sink.handle(record)
+        except Exception:
+            self.handleError(record)
+
+_log_queue = queue.SimpleQueue()
+_listener = None
+_loggers_lock = threading.Lock()
+_own_loggers = {}  # {hotfolder_path: (logger, sink)}
+
+def _ensure_listener():
+    global _listener
+    if _listener is None:
+        _listener = QueueListener(_log_queue, _RoutingHandler())
+        _listener.start()
+
+def stop_log_listener():
+    """
+    Write out every queued record and stop the listener thread (registered with atexit).
+    """
+    global _listener
+    with _loggers_lock:
+        listener, _listener = _listener, None
+    if listener is not None:
+        listener.stop()
+
+atexit.register(stop_log_listener)
+
+def _attach(logger, sink):
+    logger.handlers = [_SinkQueueHandler(_log_queue, sink)]
+    _ensure_listener()
+
 def get_hotfolder_logger(hotfolder_path, retention_days=7):
     # Special handling for global logger
     if hotfolder_path == "global":
@@ -34,35 +103,59 @@ def get_hotfolder_logger(hotfolder_path, retention_days=7):
         log_dir = hotfolder_path / ".log"
         log_file = log_dir / f"{hotfolder_path.name}.log"
 
-    logger = logging.getLogger(f"hotfolder.{hotfolder_path}")
-    logger.setLevel(logging.INFO)
-    # Remove all handlers to avoid duplicate logs if re-instantiated
-    logger.handlers = []
-    handler = OnDemandFileHandler(log_file, retention_days)
-    logger.addHandler(handler)
-    return logger
+    key = str(hotfolder_path)
+    with _loggers_lock:
+        cached = _own_loggers.get(key)
+        if cached is not None:
+            logger, sink = cached
+            if sink.retention_days != retention_days:
+                sink.set_retention(retention_days)
+            return logger
+        logger = logging.getLogger(f"hotfolder.{hotfolder_path}")
+        logger.setLevel(logging.INFO)
+        sink = OnDemandFileHandler(log_file, retention_days)
+        _attach(logger, sink)
+        _own_loggers[key] = (logger, sink)
+        return logger
 
 # New: Debug logger for parallel debug log file
-_own_debug_loggers = {}
+_own_debug_loggers = {}  # {hotfolder_path: (logger, sink)}
 def get_hotfolder_debug_logger(hotfolder_path):
     hotfolder_path = str(hotfolder_path)
-    if hotfolder_path in _own_debug_loggers:
-        return _own_debug_loggers[hotfolder_path]
-    log_dir = Path(hotfolder_path) / ".log" if hotfolder_path != "global" else Path("logs")
-    log_dir.mkdir(exist_ok=True)
-    if hotfolder_path == "global":
-        log_file = log_dir / "global.debug.log"
-        logger_name = "global_debug"
-    else:
-        log_file = log_dir / f"{Path(hotfolder_path).name}.debug.log"
-        logger_name = f"{Path(hotfolder_path).name}_debug"
-    logger = logging.getLogger(logger_name)
-    logger.setLevel(logging.DEBUG)
-    fh = logging.FileHandler(log_file)
-    fh.setLevel(logging.DEBUG)
-    formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
-    fh.setFormatter(formatter)
-    if not logger.hasHandlers():
-        logger.addHandler(fh)
-    _own_debug_loggers[hotfolder_path] = logger
-    return logger 
\ No newline at end of file
+    with _loggers_lock:
+        if hotfolder_path in _own_debug_loggers:
+            return _own_debug_loggers[hotfolder_path][0]
+        log_dir = Path(hotfolder_path) / ".log" if hotfolder_path != "global" else Path("logs")
+        log_dir.mkdir(exist_ok=True)
+        if hotfolder_path == "global":
+            log_file = log_dir / "global.debug.log"
+            logger_name = "global_debug"
+        else:
+            log_file = log_dir / f"{Path(hotfolder_path).name}.debug.log"
+            # Full path, so hotfolders with the same name under different roots do not share a file
+            logger_name = f"hotfolder_debug.{hotfolder_path}"
+        logger = logging.getLogger(logger_name)
+        logger.setLevel(logging.DEBUG)
+        fh = logging.FileHandler(log_file, delay=True)
+        fh.setLevel(logging.DEBUG)
+        formatter = logging.Formatter('%(asctime)s %(levelname)s %(message)s')
+        fh.setFormatter(formatter)
+        _attach(logger, fh)
+        _own_debug_loggers[hotfolder_path] = (logger, fh)
+        return logger
+
+def close_hotfolder_logger(hotfolder_path):
+    """
+    Detach the cached loggers of a hotfolder. Their files are closed on the listener thread
+    after every record already queued for them has been written.
+    """
+    key = str(hotfolder_path) if hotfolder_path == "global" else str(Path(hotfolder_path))
+    with _loggers_lock:
+        entries = [e for e in (_own_loggers.pop(key, None), _own_debug_loggers.pop(key, None)) if e is not None]
+    for logger, sink in entries:
+        logger.handlers = []
+        close_record = logging.makeLogRecord({"hotfolder_sink": sink, "hotfolder_close": True})
+        if _listener is not None:
+            _log_queue.put(close_record)
+        else:
+            sink.close()
@@ -0,0 +1,68 @@
+import functools
+import os
+
+from iptcinfo3 import IPTCData, c_datasets, c_datasets_r
+
+from hotfolder.iptc import write_iptc, UnsupportedImage
+
+
+@functools.lru_cache(maxsize=None)
+def resolve_metadata_field(metadata_field):
+    """
+    Map a configured field name to the IPTC dataset name iptcinfo3 writes, or None if nothing matches.
+    Exact names and iptcinfo3's aliases ('credit', 'destination') are used as-is; otherwise the first
+    dataset whose name contains the configured one is taken (e.g. 'caption' -> 'caption/abstract').
+    """
+    name = str(metadata_field).strip().lower()
+    try:
+        dataset = IPTCData._key_as_int(name)
+    except (KeyError, AttributeError):
+        dataset = None
+    if dataset in c_datasets:
+        return c_datasets[dataset]
+    for candidate in c_datasets_r:
+        if name and name in candidate:
+            return candidate
+    return None
+
+
+def tag_image(file_path, field, value):
+    """
+    Write value into the IPTC dataset field of one image unless it already carries it.
+    field must already be resolved (see resolve_metadata_field). The IPTC block is patched in place
+    where it fits (see hotfolder.iptc). Runs in a worker process, so it does not log; returns
+    (file_path, status, detail, (size, mtime)) where status is 'written', 'present', 'unsupported'
+    or 'failed', detail is the write method or the error, and (size, mtime) is the file's stat afterwards.
+    """
+    try:
+        method = write_iptc(file_path, c_datasets_r[field], value)
+    except UnsupportedImage as e:
+        return file_path, "unsupported", str(e), None
+    except Exception as e:
+        return file_path, "failed", str(e), None
+    st = os.stat(file_path)
+    return file_path, "present" if method == "present" else "written", method, (st.st_size, st.st_mtime)
+
+
+class MetadataStage:
+    """
+    Tags the images of a job on the shared CpuPool, so parsing and writing many large images does not
+    hold the scan thread (and the GIL) for the whole job. Jobs with a single image, or a pool with a
+    single worker, are tagged in the calling thread.
+    """
+    def __init__(self, pool):
+        self.pool = pool
+
+    def run(self, file_paths, field, value, owner=None):
+        """
+        Tag every file in file_paths with tag_image() and return its results in the same order.
+        owner: the hotfolder the job belongs to, for its share of the pool's queue.
+        """
+        file_paths = [str(p) for p in file_paths]
+        results = self.pool.map(tag_image, file_paths, [field] * len(file_paths), [value] * len(file_paths), owner=owner)
+        # tag_image reports its own errors; an error here means the worker itself failed
+        return [result if error is None else (path, "failed", str(error), None)
+                for path, (result, error) in zip(file_paths, results)]
+
+    def shutdown(self, wait=True):
+        self.pool.shutdown(wait=wait)
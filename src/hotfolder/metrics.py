@@ -0,0 +1,169 @@
+import bisect
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Histogram buckets (upper bounds); +Inf is implicit
+DURATION_BUCKETS = (0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+COUNT_BUCKETS = (10, 100, 1000, 10000, 100000, 1000000)
+THROUGHPUT_BUCKETS = (1 << 20, 10 << 20, 50 << 20, 100 << 20, 250 << 20, 500 << 20, 1 << 30)
+LATENCY_BUCKETS = (1, 10, 60, 300, 600, 1800, 3600, 4 * 3600, 12 * 3600, 24 * 3600)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+
+class MetricsRegistry:
+    """
+    Thread-safe counters, gauges and histograms keyed by metric name and labels, rendered in the
+    Prometheus text exposition format. Metrics are created on first use; declare() adds HELP text and histogram buckets.
+    """
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._metrics = {}  # {name: (type, {labels tuple: value or _Histogram})}
+        self._help = {}
+        self._buckets = {}
+
+    def declare(self, name, kind, help_text, buckets=None):
+        with self._lock:
+            self._metrics.setdefault(name, (kind, {}))
+            self._help[name] = help_text
+            if buckets is not None:
+                self._buckets[name] = tuple(buckets)
+
+    def _series(self, name, kind):
+        entry = self._metrics.get(name)
+        if entry is None:
+            entry = self._metrics[name] = (kind, {})
+        return entry[1]
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            series = self._series(name, "counter")
+            key = tuple(sorted(labels.items()))
+            series[key] = series.get(key, 0) + value
+
+    def set(self, name, value, **labels):
+        with self._lock:
+            self._series(name, "gauge")[tuple(sorted(labels.items()))] = value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            series = self._series(name, "histogram")
+            key = tuple(sorted(labels.items()))
+            histogram = series.get(key)
+            if histogram is None:
+                histogram = series[key] = _Histogram(self._buckets.get(name, DURATION_BUCKETS))
+            histogram.observe(value)
+
+    def remove(self, **labels):
+        """
+        Drop every series carrying these labels (e.g. a hotfolder that is no longer watched).
+        """
+        wanted = set(labels.items())
+        with self._lock:
+            for _, series in self._metrics.values():
+                for key in [k for k in series if wanted <= set(k)]:
+                    del series[key]
+
+    def render(self):
+        lines = []
+        with self._lock:
+            for name in sorted(self._metrics):
+                kind, series = self._metrics[name]
+                if name in self._help:
+                    lines.append(f"# HELP {name} {self._help[name]}")
+                lines.append(f"# TYPE {name} {kind}")
+                for key in sorted(series):
+                    value = series[key]
+                    if kind != "histogram":
+                        lines.append(f"{name}{_labels(key)} {_number(value)}")
+                        continue
+                    cumulative = 0
+                    for bound, count in zip(value.buckets + (float("inf"),), value.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else _number(bound)
+                        lines.append(f"{name}_bucket{_labels(key + (('le', le),))} {cumulative}")
+                    lines.append(f"{name}_sum{_labels(key)} {_number(value.sum)}")
+                    lines.append(f"{name}_count{_labels(key)} {value.count}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(key):
+    if not key:
+        return ""
+    parts = []
+    for label, value in key:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{label}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+def _number(value):
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
+
+
+class MetricsServer:
+    """
+    Serves a MetricsRegistry at http://host:port/metrics from a daemon thread (stdlib http.server).
+    """
+    def __init__(self, registry, host="127.0.0.1", port=9108):
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?", 1)[0] not in ("/metrics", "/"):
+                    self.send_error(404)
+                    return
+                body = registry.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass  # Scrapes every few seconds would flood stderr
+
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="hotfolder-metrics", daemon=True)
+
+    @property
+    def address(self):
+        return self.server.server_address
+
+    def start(self):
+        self.thread.start()
+        return self
+
+    def shutdown(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def declare_hotfolder_metrics(registry):
+    """
+    HELP text and buckets for the metrics the watcher exports, all labelled by hotfolder.
+    """
+    registry.declare("hotfolder_scans_total", "counter", "Scans run")
+    registry.declare("hotfolder_scan_errors_total", "counter", "Scans that ended with an unhandled error")
+    registry.declare("hotfolder_scan_duration_seconds", "histogram", "Wall-clock time of one scan", DURATION_BUCKETS)
+    registry.declare("hotfolder_scan_phase_seconds", "histogram", "Time spent in each phase of a scan (label phase)", DURATION_BUCKETS)
+    registry.declare("hotfolder_scan_stat_calls", "histogram", "Files and directories stat'ed per scan", COUNT_BUCKETS)
+    registry.declare("hotfolder_db_transactions_total", "counter", "State DB transactions committed")
+    registry.declare("hotfolder_resting_jobs", "gauge", "Jobs waiting for resting_time at the end of the last scan")
+    registry.declare("hotfolder_jobs_processed_total", "counter", "Jobs delivered to OUT")
+    registry.declare("hotfolder_job_latency_seconds", "histogram", "Time from ARRIVED to PROCESSED per job", LATENCY_BUCKETS)
+    registry.declare("hotfolder_transferred_files_total", "counter", "Files copied or moved to OUT")
+    registry.declare("hotfolder_transferred_bytes_total", "counter", "Bytes copied or moved to OUT")
+    registry.declare("hotfolder_transfer_throughput_bytes_per_second", "histogram", "Throughput of each job transfer", THROUGHPUT_BUCKETS)
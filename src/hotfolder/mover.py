@@ -1,45 +1,26 @@
 import shutil
 from pathlib import Path
 import os
-import time
-from hotfolder.utils import is_image_file
-from iptcinfo3 import IPTCInfo
+from hotfolder.transfer import TransferEngine, TransferStats
+from hotfolder.metadata import resolve_metadata_field, tag_image
+from hotfolder.dissolve import NameIndex, plan_dissolve, remove_empty_dirs
 
 def write_metadata(file_path, metadata_field, value, logger):
-    try:
-        info = IPTCInfo(file_path, force=True)
-        field = metadata_field
-        # Try as provided
-        try:
-            info[field] = value
-            info.save()
-            logger.info(f"Wrote metadata '{field}'='{value}' to {file_path}")
-            logger.debug(f"[METADATA] Used provided field '{field}' for {file_path}")
-            return
-        except Exception as e:
-            logger.debug(f"[METADATA] Provided field '{field}' failed for {file_path}: {e}")
-        # Fallback: scan for a matching key
-        found_key = None
-        for k in info._data.keys():
-            if k.lower() == field.lower() or field.lower() in k.lower():
-                found_key = k
-                break
-        if found_key:
-            try:
-                info[found_key] = value
-                info.save()
-                logger.info(f"Wrote metadata '{found_key}'='{value}' to {file_path} (using fallback for '{field}')")
-                logger.debug(f"[METADATA] Provided field '{field}' not found, used '{found_key}' for {file_path}")
-                return
-            except Exception as e:
-                logger.error(f"Failed to write metadata to {file_path} using fallback key '{found_key}': {e}")
-                logger.debug(f"[METADATA] Fallback field '{found_key}' failed for {file_path}: {e}")
-        # If still not found
-        logger.error(f"Failed to write metadata: field '{field}' not found in {file_path}. Available keys: {list(info._data.keys())}")
-        logger.debug(f"[METADATA] No matching field for '{field}' in {file_path}. Skipping metadata write.")
-    except Exception as e:
-        logger.error(f"Failed to open or process {file_path} for metadata: {e}")
-        logger.debug(f"[METADATA] Exception in write_metadata for {file_path}: {e}")
+    field = resolve_metadata_field(metadata_field)
+    if field is None:
+        logger.error(f"Failed to write metadata: field '{metadata_field}' is not an IPTC field ({file_path})")
+        logger.debug(f"[METADATA] No matching field for '{metadata_field}' in {file_path}. Skipping metadata write.")
+        return
+    if field != str(metadata_field).lower():
+        logger.debug(f"[METADATA] Provided field '{metadata_field}' not found, using '{field}' for {file_path}")
+    _, status, detail, _ = tag_image(str(file_path), field, value)
+    if status == "written":
+        logger.info(f"Wrote metadata '{field}'='{value}' to {file_path} ({detail})")
+    elif status == "present":
+        logger.debug(f"[METADATA] {file_path} already has '{field}'='{value}'")
+    else:
+        logger.error(f"Failed to open or process {file_path} for metadata: {detail}")
+        logger.debug(f"[METADATA] Exception in write_metadata for {file_path}: {detail}")
 
 def get_all_items(folder):
     # Recursively get all files and folders (relative to folder)
@@ -55,91 +36,102 @@ def get_all_items(folder):
             items.append(str(rel))
     return items
 
-def move_hotfolder_contents(src_folder, dst_folder, dissolve_folders=False, metadata=False, metadata_field=None, logger=None, keep_copy=False, ignore_updates=False, update_mtime=True, ds_store=True, thumbs_db=True):
+def is_system_file(name, ds_store=True, thumbs_db=True):
+    return (ds_store and name == '.DS_Store') or (thumbs_db and name.lower() == 'thumbs.db')
+
+def move_hotfolder_contents(src_folder, dst_folder, dissolve_folders=False, metadata=False, metadata_field=None, logger=None, keep_copy=False, ignore_updates=False, update_mtime=True, ds_store=True, thumbs_db=True, items=None, transfer_engine=None, staging=None, on_done=None, budget=None, throttle=None, stats=None, dissolve_plans=None):
+    """
+    Move or copy the contents of src_folder to dst_folder.
+    items: optional list of top-level names to transfer (default: everything in src_folder).
+    Files are transferred concurrently by transfer_engine (a private single-worker engine if None);
+    each top-level item is finished before the next one starts.
+    staging: optional staging.StagedDelivery for dst_folder; copies then only appear in OUT complete.
+    on_done: optional callback receiving lists of (src, dst) files that have arrived (see TransferEngine.run).
+    budget: optional transfer.ByteBudget limiting the bytes this hotfolder has in flight.
+    throttle: optional throttle.Throttle limiting this hotfolder's bytes and files per second.
+    stats: optional TransferStats the totals of this call are added to.
+    dissolve_plans: optional {top-level name: (tasks, dropped)} from dissolve.plan_dissolve for the folders
+    to dissolve; folders without a plan are planned here with the 'suffix' collision policy and exact names.
+    """
     if logger:
         logger.info(f"move_hotfolder_contents called: src_folder={src_folder}, dst_folder={dst_folder}, keep_copy={keep_copy}, ignore_updates={ignore_updates}, update_mtime={update_mtime}, ds_store={ds_store}, thumbs_db={thumbs_db}")
     src_folder = Path(src_folder)
     dst_folder = Path(dst_folder)
+    engine = transfer_engine or TransferEngine(workers=1)
     moved_count = 0
     marked_for_deletion = []
+    job_stats = TransferStats()
+    name_index = None  # OUT names, listed once for the folders dissolved without a plan
+    entries = [src_folder / name for name in items] if items is not None else list(src_folder.iterdir())
     # For each item in src_folder
-    for item in src_folder.iterdir():
+    for item in entries:
         if logger:
             logger.info(f"Processing item: {item}, is_dir={item.is_dir()}, keep_copy={keep_copy}")
         if item.name.startswith('.'):
             continue  # Skip .config, .log, etc.
         # Respect config for ds_store and thumbs_db
-        if (ds_store and item.name == '.DS_Store') or (thumbs_db and item.name.lower() == 'thumbs.db'):
+        if is_system_file(item.name, ds_store, thumbs_db):
             if logger:
                 logger.info(f"Skipping system file: {item}")
             continue  # Never copy/move .DS_Store or Thumbs.db to OUT if enabled
         dest = dst_folder / item.name
-        rel_path = str(item.relative_to(src_folder))
-        mtime = item.stat().st_mtime
         if item.is_file():
-            if keep_copy:
-                if logger:
-                    logger.info(f"Copying file: {item} -> {dest}")
-                shutil.copy2(str(item), str(dest))
-            else:
-                if logger:
-                    logger.info(f"Moving file: {item} -> {dest}")
-                shutil.move(str(item), str(dest))
+            if logger:
+                logger.info(f"{'Copying' if keep_copy else 'Moving'} file: {item} -> {dest}")
+            job_stats.add(engine.run([(item, dest)], keep_copy=keep_copy, update_mtime=update_mtime, logger=logger, staging=staging, on_done=on_done, budget=budget, throttle=throttle))
             moved_count += 1
-            if update_mtime:
-                try:
-                    os.utime(str(dest), None)
-                except Exception as e:
-                    if logger:
-                        logger.warning(f"Failed to update mtime for {dest}: {e}")
         elif item.is_dir():
             if dissolve_folders:
-                # Flatten: move/copy all files in this subfolder directly to dst_folder
-                for root, dirs, files in os.walk(item):
-                    for fname in files:
-                        if (ds_store and fname == '.DS_Store') or (thumbs_db and fname.lower() == 'thumbs.db'):
+                # Flatten: move/copy all files in this subfolder directly to dst_folder, resolving name collisions
+                files = []
+                for root, dirs, fnames in os.walk(item):
+                    for fname in fnames:
+                        if is_system_file(fname, ds_store, thumbs_db):
                             if logger:
                                 logger.info(f"Skipping system file: {fname}")
                             continue
-                        src_file = Path(root) / fname
-                        dest_file = dst_folder / fname
-                        if keep_copy:
-                            if logger:
-                                logger.info(f"Copying file (dissolve): {src_file} -> {dest_file}")
-                            shutil.copy2(str(src_file), str(dest_file))
-                        else:
-                            if logger:
-                                logger.info(f"Moving file (dissolve): {src_file} -> {dest_file}")
-                            shutil.move(str(src_file), str(dest_file))
-                        moved_count += 1
-                        if update_mtime:
-                            try:
-                                os.utime(str(dest_file), None)
-                            except Exception as e:
-                                if logger:
-                                    logger.warning(f"Failed to update mtime for {dest_file}: {e}")
-                # After moving/copying, if the folder is now empty, mark for deletion
+                        files.append(Path(root) / fname)
+                plan = dissolve_plans.get(item.name) if dissolve_plans else None
+                if plan is None:
+                    if name_index is None:
+                        name_index = NameIndex(dst_folder)
+                    plan = plan_dissolve(files, name_index)
+                tasks, dropped = plan
+                if logger:
+                    for src_file, dest_file in tasks:
+                        renamed = f" (renamed, '{src_file.name}' is taken)" if dest_file.name != src_file.name else ""
+                        logger.info(f"{'Copying' if keep_copy else 'Moving'} file (dissolve): {src_file} -> {dest_file}{renamed}")
+                dissolve_stats = engine.run(tasks, keep_copy=keep_copy, update_mtime=update_mtime, logger=logger, staging=staging, on_done=on_done, budget=budget, throttle=throttle)
+                if name_index is not None:
+                    name_index.update(dest_file.name for _, dest_file in tasks)
+                job_stats.add(dissolve_stats)
+                moved_count += dissolve_stats.files
+                for src_file, identical in dropped:
+                    if identical:
+                        if logger:
+                            logger.info(f"Skipping file (dissolve): {src_file}, an identical '{src_file.name}' is in {dst_folder}")
+                        if not keep_copy:
+                            _remove_source(src_file, logger)
+                    elif logger:
+                        # Only identical files are removed from IN; this one is left where it is
+                        logger.warning(f"Not delivering file (dissolve): {src_file}, another '{src_file.name}' of the job is delivered to {dst_folder}; left in IN")
+                # After moving, remove the emptied subfolders; if the folder is now empty, mark for deletion
+                if not keep_copy:
+                    remove_empty_dirs(item)
                 if not any(item.iterdir()):
                     marked_for_deletion.append(item.name)
             else:
                 if keep_copy:
                     if logger:
                         logger.info(f"Copying directory: {item} -> {dest}")
-                    def ignore_system_files(dir, files):
-                        ignore = []
-                        if ds_store:
-                            ignore += [f for f in files if f == '.DS_Store']
-                        if thumbs_db:
-                            ignore += [f for f in files if f.lower() == 'thumbs.db']
-                        return ignore
-                    shutil.copytree(str(item), str(dest), dirs_exist_ok=True, ignore=ignore_system_files)
-                else:
+                    job_stats.add(_copy_tree(item, dest, engine, ds_store, thumbs_db, logger, staging, on_done, budget, throttle))
+                elif _same_device(item, dst_folder):
                     if logger:
                         logger.info(f"Moving directory: {item} -> {dest}")
                     shutil.move(str(item), str(dest))
                     for root, dirs, files in os.walk(dest):
                         for f in files:
-                            if (ds_store and f == '.DS_Store') or (thumbs_db and f.lower() == 'thumbs.db'):
+                            if is_system_file(f, ds_store, thumbs_db):
                                 try:
                                     os.remove(os.path.join(root, f))
                                     if logger:
@@ -147,6 +139,14 @@ def move_hotfolder_contents(src_folder, dst_folder, dissolve_folders=False, meta
                                 except Exception as e:
                                     if logger:
                                         logger.warning(f"Failed to remove system file from OUT: {e}")
+                else:
+                    # Cross-device move: copy in parallel, then remove the source (what shutil.move does serially)
+                    if dest.is_dir():
+                        dest = dest / item.name  # shutil.move semantics: move into an existing folder
+                    if logger:
+                        logger.info(f"Moving directory: {item} -> {dest}")
+                    job_stats.add(_copy_tree(item, dest, engine, ds_store, thumbs_db, logger, staging, on_done, budget, throttle))
+                    shutil.rmtree(str(item))
                 moved_count += 1
                 if update_mtime:
                     try:
@@ -154,5 +154,61 @@ def move_hotfolder_contents(src_folder, dst_folder, dissolve_folders=False, meta
                     except Exception as e:
                         if logger:
                             logger.warning(f"Failed to update mtime for {dest}: {e}")
+    if logger and job_stats.files:
+        logger.info(f"[TRANSFER] {src_folder.name} -> {dst_folder.name}: {job_stats}")
+    if stats is not None:
+        stats.add(job_stats)
     return moved_count, marked_for_deletion
-    # TODO: Handle more metadata if needed 
\ No newline at end of file
+
+def _remove_source(path, logger=None):
+    # A dissolved job's file that is not delivered, removed so the job folder can empty out
+    try:
+        os.remove(path)
+    except OSError as e:
+        if logger:
+            logger.warning(f"Failed to remove {path} from IN: {e}")
+
+def _same_device(path, other):
+    try:
+        return os.stat(path).st_dev == os.stat(other).st_dev
+    except OSError:
+        return False
+
+def _copy_tree(src_dir, dst_dir, engine, ds_store=True, thumbs_db=True, logger=None, staging=None, on_done=None, budget=None, throttle=None):
+    # Parallel equivalent of shutil.copytree(dirs_exist_ok=True) that skips system files.
+    # With staging, a new dst_dir is built in the staging directory and renamed into place as a whole;
+    # files copied into an existing dst_dir are staged one by one.
+    final_dir = dst_dir
+    staging_for_files = None
+    if staging is not None:
+        dst_dir = staging.job_root(final_dir)
+        if dst_dir == final_dir:
+            staging_for_files = staging
+    tasks = []
+    dirs_to_copy = []
+    for root, dirs, files in os.walk(src_dir):
+        rel_root = Path(root).relative_to(src_dir)
+        (dst_dir / rel_root).mkdir(parents=True, exist_ok=True)
+        dirs_to_copy.append((Path(root), dst_dir / rel_root))
+        for fname in files:
+            if is_system_file(fname, ds_store, thumbs_db):
+                continue
+            tasks.append((Path(root) / fname, dst_dir / rel_root / fname))
+    try:
+        stats = engine.run(tasks, keep_copy=True, logger=logger, staging=staging_for_files,
+                           on_done=on_done if dst_dir == final_dir else None, budget=budget, throttle=throttle)
+    except BaseException:
+        if dst_dir != final_dir:
+            staging.discard(dst_dir)
+        raise
+    # Directory timestamps last, deepest first, so copying files into them does not reset them
+    for src, dst in reversed(dirs_to_copy):
+        try:
+            shutil.copystat(str(src), str(dst))
+        except OSError:
+            pass
+    if dst_dir != final_dir:
+        staging.finish_job(dst_dir, final_dir)
+        if on_done and tasks:
+            on_done([(src, final_dir / dst.relative_to(dst_dir)) for src, dst in tasks])
+    return stats
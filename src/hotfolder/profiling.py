@@ -0,0 +1,200 @@
+import cProfile
+import json
+import os
+import pstats
+import sys
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+
+# Seconds between stack samples of the scan thread in sampling mode
+SAMPLE_INTERVAL = 0.005
+# Functions listed in a slow-scan trace
+TOP_FUNCTIONS = 25
+# Slow-scan traces kept per hotfolder in .log/; older ones are deleted
+TRACES_KEPT = 20
+
+PROFILE_MODES = ("none", "sampling", "cprofile")
+
+
+class ScanTrace:
+    """
+    Wall-clock time per phase of one hotfolder scan, counts of what the scan touched and, when profile is
+    'sampling' or 'cprofile', the functions it spent its time in. mark() switches the scan's current phase;
+    phase() runs a nested phase (transfer, metadata) whose time is not charged to the enclosing one, so the
+    phase timings add up to the scan's duration. Used from the scan thread only.
+    """
+    def __init__(self, folder, profile="none"):
+        self.folder = Path(folder)
+        self.profile = profile if profile in PROFILE_MODES else "none"
+        self.phases = {}  # {phase: seconds}, in the order the phases first ran
+        self.counts = Counter()
+        self.started_at = None
+        self.seconds = 0.0
+        self.error = None
+        self._stack = ["setup"]
+        self._stamp = None
+        self._start = None
+        self._profiler = None
+
+    def start(self):
+        self.started_at = time.time()
+        self._stamp = time.perf_counter()
+        self._start = self._stamp
+        if self.profile == "cprofile":
+            self._profiler = cProfile.Profile()
+            try:
+                self._profiler.enable()
+            except ValueError:
+                # Only one cProfile can be active per process on Python 3.12+: fall back to sampling
+                self._profiler = None
+                self.profile = "sampling"
+        if self.profile == "sampling":
+            self._profiler = _StackSampler(threading.get_ident()).start()
+        return self
+
+    def stop(self):
+        self._charge()
+        self.seconds = time.perf_counter() - self._start
+        if isinstance(self._profiler, cProfile.Profile):
+            self._profiler.disable()
+        elif self._profiler is not None:
+            self._profiler.stop()
+
+    def _charge(self):
+        now = time.perf_counter()
+        if self._stamp is not None:
+            name = self._stack[-1]
+            self.phases[name] = self.phases.get(name, 0.0) + now - self._stamp
+        self._stamp = now
+
+    def mark(self, name):
+        """
+        Start the next top-level phase of the scan.
+        """
+        self._charge()
+        self._stack[0] = name
+
+    @contextmanager
+    def phase(self, name):
+        self._charge()
+        self._stack.append(name)
+        try:
+            yield
+        finally:
+            self._charge()
+            self._stack.pop()
+
+    def count(self, name, amount=1):
+        if amount:
+            self.counts[name] += amount
+
+    def top_functions(self, limit=TOP_FUNCTIONS):
+        if isinstance(self._profiler, cProfile.Profile):
+            return _cprofile_top(self._profiler, limit)
+        if self._profiler is not None:
+            return self._profiler.top(limit)
+        return []
+
+    def to_dict(self):
+        return {
+            "hotfolder": str(self.folder),
+            "started": datetime.fromtimestamp(self.started_at).isoformat(timespec="seconds") if self.started_at else None,
+            "seconds": round(self.seconds, 4),
+            "error": self.error,
+            "phases": {name: round(seconds, 4) for name, seconds in self.phases.items()},
+            "counts": dict(self.counts),
+            "profile": self.profile,
+            "top_functions": self.top_functions(),
+        }
+
+    def dump(self, log_dir, keep=TRACES_KEPT):
+        """
+        Write the trace as JSON to log_dir/slow_scan_<timestamp>.json, keeping the newest keep traces.
+        Returns the path written.
+        """
+        log_dir = Path(log_dir)
+        log_dir.mkdir(exist_ok=True)
+        stamp = datetime.fromtimestamp(self.started_at or time.time()).strftime("%Y-%m-%d_%H-%M-%S")
+        path = log_dir / f"slow_scan_{stamp}.json"
+        tmp = path.with_suffix(".json.tmp")
+        with open(tmp, "w") as f:
+            json.dump(self.to_dict(), f, indent=2)
+        os.replace(tmp, path)
+        for old in sorted(log_dir.glob("slow_scan_*.json"))[:-keep]:
+            try:
+                old.unlink()
+            except OSError:
+                pass
+        return path
+
+
+def _function_name(filename, line, name):
+    # Shorten site-packages and stdlib paths to the module path, like pstats does for builtins
+    for prefix in sorted({p for p in sys.path if p}, key=len, reverse=True):
+        if filename.startswith(prefix + os.sep):
+            filename = filename[len(prefix) + 1:]
+            break
+    return f"{filename}:{line}({name})"
+
+
+def _cprofile_top(profiler, limit):
+    stats = pstats.Stats(profiler).stats  # {(file, line, name): (calls, primitive calls, tottime, cumtime, callers)}
+    rows = sorted(stats.items(), key=lambda item: item[1][3], reverse=True)[:limit]
+    return [
+        {"function": _function_name(*func), "calls": calls, "tottime": round(tottime, 4), "cumtime": round(cumtime, 4)}
+        for func, (_, calls, tottime, cumtime, _) in rows
+    ]
+
+
+class _StackSampler:
+    """
+    Samples the stack of one thread every SAMPLE_INTERVAL seconds from a daemon thread. Cheap enough to leave
+    on: the scan thread itself is never instrumented, and only the sampled frames are walked.
+    """
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.samples = 0
+        self.elapsed = 0.0
+        self.inclusive = Counter()  # Samples with the function anywhere on the stack
+        self.exclusive = Counter()  # Samples with the function on top of the stack
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="hotfolder-scan-sampler", daemon=True)
+
+    def start(self):
+        self._started = time.perf_counter()
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+        self.elapsed = time.perf_counter() - self._started
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+            self.samples += 1
+            code = frame.f_code
+            self.exclusive[(code.co_filename, code.co_firstlineno, code.co_name)] += 1
+            functions = set()
+            while frame is not None:
+                code = frame.f_code
+                functions.add((code.co_filename, code.co_firstlineno, code.co_name))
+                frame = frame.f_back
+            self.inclusive.update(functions)
+
+    def top(self, limit):
+        # Samples are not exactly interval apart, so seconds are each function's share of the elapsed time
+        per_sample = self.elapsed / self.samples if self.samples else 0.0
+        return [
+            {"function": _function_name(*func), "samples": count, "self_samples": self.exclusive[func],
+             "seconds": round(count * per_sample, 4)}
+            for func, count in self.inclusive.most_common(limit)
+        ]
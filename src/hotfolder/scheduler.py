@@ -0,0 +1,252 @@
+import os
+import selectors
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+
+class _Entry:
+    def __init__(self, key, task, source, on_remove, due, priority=0):
+        self.key = key
+        self.priority = priority
+        self.task = task
+        self.source = source
+        self.on_remove = on_remove
+        self.due = due
+        self.running = False
+        self.removed = False
+        self.wake_on_change = False
+        self.changed_while_running = False
+
+
+class HotfolderScheduler:
+    """
+    Runs per-hotfolder scan tasks on a fixed-size thread pool instead of one thread per hotfolder.
+
+    Every hotfolder has a next-due time. A task returns (delay, wake_on_change): the hotfolder is
+    scheduled again after delay seconds, or earlier if wake_on_change is set and its change source
+    reports activity. A hotfolder never has more than one scan in flight. Removing a hotfolder
+    cancels its future scans; its on_remove callback runs once any in-flight scan has finished.
+    Scans are only handed to the pool when a worker is free; when more hotfolders are due than
+    workers are idle, higher priority goes first, then the hotfolder that has been due longest.
+    """
+    def __init__(self, max_workers, debounce=1.0, error_delay=10, logger=None):
+        if max_workers < 1:
+            raise ValueError(f"max_workers must be >= 1, got {max_workers}")
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="hotfolder-scan")
+        self.max_workers = max_workers
+        self.in_flight = 0
+        self.debounce = debounce
+        self.error_delay = error_delay
+        self.logger = logger
+        self.lock = threading.Lock()
+        self.entries = {}  # {key: _Entry}
+        self.selector = selectors.DefaultSelector()
+        # Self-pipe used to interrupt select() when the schedule changes
+        self._wake_r, self._wake_w = os.pipe()
+        os.set_blocking(self._wake_r, False)
+        os.set_blocking(self._wake_w, False)
+        self.selector.register(self._wake_r, selectors.EVENT_READ, None)
+        self.running = True
+        self.thread = threading.Thread(target=self._dispatch_loop, name="hotfolder-scheduler", daemon=True)
+        self.thread.start()
+
+    # --- Public API ---
+
+    def add(self, key, task, source=None, on_remove=None, delay=0, priority=0):
+        """
+        Register a hotfolder. task() is called on a pool thread and must return (delay, wake_on_change).
+        source: optional change source; if it has a file descriptor, activity can wake the hotfolder early.
+        priority: higher values are scanned first when scan workers are scarce.
+        """
+        with self.lock:
+            if key in self.entries:
+                raise ValueError(f"{key} is already scheduled")
+            entry = _Entry(key, task, source, on_remove, time.time() + delay, priority)
+            self.entries[key] = entry
+            fd = source.fileno() if source is not None else None
+            if fd is not None:
+                self.selector.register(fd, selectors.EVENT_READ, entry)
+        self._notify()
+
+    def add_shared_source(self, source):
+        """
+        Watch a change source shared by several hotfolders (change_source.InotifyHub). Its drain() returns
+        the per-hotfolder sources that changed; the hotfolders registered with those sources are woken.
+        """
+        with self.lock:
+            self.selector.register(source.fileno(), selectors.EVENT_READ, source)
+        self._notify()
+
+    def remove(self, key):
+        """
+        Cancel all future scans of a hotfolder. Returns False if it was not scheduled.
+        """
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            if entry is None:
+                return False
+            entry.removed = True
+            self._unregister(entry)
+            finalize = not entry.running
+        if finalize:
+            self._finalize(entry)
+        self._notify()
+        return True
+
+    def keys(self):
+        with self.lock:
+            return list(self.entries)
+
+    def set_priority(self, key, priority):
+        """
+        Change a hotfolder's priority (e.g. after its config changed); takes effect at its next dispatch.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.priority = priority
+
+    def wake(self, key):
+        """
+        Make a hotfolder due immediately.
+        """
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                entry.due = time.time()
+        self._notify()
+
+    def shutdown(self, wait=True):
+        """
+        Stop dispatching, wait for in-flight scans and run every on_remove callback.
+        """
+        self.running = False
+        self._notify()
+        self.thread.join()
+        self.executor.shutdown(wait=wait)
+        with self.lock:
+            entries = list(self.entries.values())
+            self.entries = {}
+        for entry in entries:
+            entry.removed = True
+            self._unregister(entry)
+            self._finalize(entry)
+        self.selector.close()
+        os.close(self._wake_r)
+        os.close(self._wake_w)
+
+    # --- Internals ---
+
+    def _notify(self):
+        try:
+            os.write(self._wake_w, b"\0")
+        except (BlockingIOError, OSError):
+            pass  # Pipe full (a wake-up is already pending) or closed during shutdown
+
+    def _unregister(self, entry):
+        fd = entry.source.fileno() if entry.source is not None else None
+        if fd is not None:
+            try:
+                self.selector.unregister(fd)
+            except (KeyError, ValueError):
+                pass
+
+    def _finalize(self, entry):
+        if entry.on_remove is not None:
+            try:
+                entry.on_remove()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f"Error while removing hotfolder {entry.key}: {e}")
+
+    def _dispatch_loop(self):
+        while self.running:
+            now = time.time()
+            timeout = None
+            due = []
+            with self.lock:
+                for entry in self.entries.values():
+                    if entry.running:
+                        continue
+                    if entry.due <= now:
+                        due.append(entry)
+                    else:
+                        wait = entry.due - now
+                        timeout = wait if timeout is None else min(timeout, wait)
+                # Due hotfolders that do not get a worker now are dispatched when a scan finishes
+                due.sort(key=lambda e: (-e.priority, e.due))
+                due = due[:max(0, self.max_workers - self.in_flight)]
+                for entry in due:
+                    entry.running = True
+                    entry.changed_while_running = False
+                    self.in_flight += 1
+            # Submit outside the lock: a done callback may run synchronously and take it again
+            for entry in due:
+                future = self.executor.submit(entry.task)
+                future.add_done_callback(lambda f, e=entry: self._task_done(e, f))
+            for key, _ in self.selector.select(timeout):
+                if key.data is None:
+                    try:
+                        while os.read(self._wake_r, 4096):
+                            pass
+                    except BlockingIOError:
+                        pass
+                    continue
+                if isinstance(key.data, _Entry):
+                    self._source_ready(key.data)
+                else:
+                    self._shared_source_ready(key.data)
+
+    def _source_ready(self, entry):
+        if entry.removed:
+            return
+        try:
+            changed = entry.source.drain()
+        except OSError as e:
+            changed = True
+            if self.logger:
+                self.logger.error(f"Change source error for {entry.key}: {e}")
+        if changed:
+            with self.lock:
+                self._changed(entry)
+
+    def _shared_source_ready(self, shared):
+        try:
+            changed = shared.drain()
+        except OSError as e:
+            if self.logger:
+                self.logger.error(f"Shared change source error: {e}")
+            return
+        if not changed:
+            return
+        with self.lock:
+            for entry in self.entries.values():
+                if entry.source in changed:
+                    self._changed(entry)
+
+    def _changed(self, entry):
+        # Called with self.lock held
+        if entry.running:
+            entry.changed_while_running = True
+        elif entry.wake_on_change:
+            entry.due = min(entry.due, time.time() + self.debounce)
+
+    def _task_done(self, entry, future):
+        delay, wake_on_change = self.error_delay, False
+        try:
+            delay, wake_on_change = future.result()
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f"Unhandled error in scan task for {entry.key}: {e}")
+        with self.lock:
+            entry.running = False
+            self.in_flight -= 1
+            entry.wake_on_change = wake_on_change
+            entry.due = time.time() + delay
+            if wake_on_change and entry.changed_while_running:
+                entry.due = min(entry.due, time.time() + self.debounce)
+            finalize = entry.removed
+        if finalize:
+            self._finalize(entry)
+        self._notify()  # A worker is free again
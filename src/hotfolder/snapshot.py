@@ -0,0 +1,164 @@
+import os
+import time
+from stat import S_ISREG
+import unicodedata
+from collections import namedtuple
+from pathlib import Path
+
+FileStat = namedtuple("FileStat", ["size", "mtime", "inode"])
+
+# A directory listing is only reused if the directory was already this many seconds old when the
+# previous snapshot was taken. Protects against coarse mtime granularity (HFS+, SMB) hiding changes.
+RACY_WINDOW = 2.0
+
+
+class DirectorySnapshot:
+    """
+    A single os.scandir walk of a hotfolder, shared by every phase of one scan.
+    Hidden top-level entries (.config, .log, .db, ...) are skipped; hidden files inside jobs are kept,
+    matching what rglob('*') returned before.
+    Directory listings are reused from the previous snapshot when the directory's mtime is unchanged,
+    so unchanged subtrees are not re-read. Files are always stat'ed once per scan because in-place
+    writes do not touch the parent directory's mtime.
+    """
+    def __init__(self, root, previous=None):
+        self.root = Path(root)
+        self.taken_at = time.time()
+        self.top_level = []  # names of non-hidden top-level items, in directory order
+        self.files = {}      # {relpath: FileStat} for every regular file
+        self.dirs = {}       # {relpath: FileStat} for every directory below the root
+        self.jobs = {}       # {top-level dir: {relpath: FileStat}} files below each job folder
+        self.stat_calls = 0
+        self.reused_listings = 0
+        self._listings = {}  # {relpath: (mtime_ns, [(name, is_dir), ...])}
+        self._normalized = None
+        self._scan(previous)
+
+    def _scan(self, previous):
+        entries = self._list_dir(self.root, "", previous)
+        if entries is None:
+            raise FileNotFoundError(2, "Hotfolder vanished during scan", str(self.root))
+        for name, is_dir in entries:
+            if name.startswith('.'):
+                continue
+            # Entries that vanish between listing and stat are left out
+            if is_dir:
+                files = self._walk(name, previous)
+                if files is not None:
+                    self.jobs[name] = files
+                    self.top_level.append(name)
+            else:
+                st = self._stat(self.root / name)
+                if st is not None:
+                    self.files[name] = st
+                    self.top_level.append(name)
+
+    def _walk(self, rel, previous):
+        # Depth-first walk of one job folder; returns its files, or None if the folder vanished
+        if self._list_dir(self.root / rel, rel, previous) is None:
+            return None
+        files = {}
+        stack = [rel]
+        while stack:
+            current = stack.pop()
+            entries = self._listings[current][1] if current == rel else self._list_dir(self.root / current, current, previous)
+            if entries is None:
+                continue
+            for name, is_dir in entries:
+                child = f"{current}/{name}"
+                if is_dir:
+                    stack.append(child)
+                else:
+                    st = self._stat(self.root / child)
+                    if st is not None:
+                        self.files[child] = st
+                        files[child] = st
+        return files
+
+    def _stat(self, path):
+        self.stat_calls += 1
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if not S_ISREG(st.st_mode):
+            return None
+        return FileStat(st.st_size, st.st_mtime, st.st_ino)
+
+    def _list_dir(self, path, rel, previous):
+        self.stat_calls += 1
+        try:
+            st = os.stat(path)
+        except (FileNotFoundError, NotADirectoryError):
+            return None
+        if rel:
+            self.dirs[rel] = FileStat(st.st_size, st.st_mtime, st.st_ino)
+        cached = previous._listings.get(rel) if previous is not None else None
+        if cached is not None and cached[0] == st.st_mtime_ns and st.st_mtime < previous.taken_at - RACY_WINDOW:
+            entries = cached[1]
+            self.reused_listings += 1
+        else:
+            try:
+                with os.scandir(path) as it:
+                    # Do not descend into symlinked directories (same as rglob)
+                    entries = [(e.name, e.is_dir(follow_symlinks=False)) for e in it]
+            except (FileNotFoundError, NotADirectoryError):
+                return None
+        self._listings[rel] = (st.st_mtime_ns, entries)
+        return entries
+
+    # --- Queries ---
+
+    def exists(self, rel):
+        """
+        True if rel (file or directory) was present when the snapshot was taken.
+        Unicode normalization is ignored, like lookups on macOS filesystems.
+        """
+        if rel in self.files or rel in self.dirs:
+            return True
+        if self._normalized is None:
+            self._normalized = {unicodedata.normalize('NFC', p) for p in self.files}
+            self._normalized.update(unicodedata.normalize('NFC', p) for p in self.dirs)
+        return unicodedata.normalize('NFC', rel) in self._normalized
+
+    def is_dir(self, rel):
+        return rel in self.dirs
+
+    def is_file(self, rel):
+        return rel in self.files
+
+    def stat(self, rel):
+        """
+        Return the FileStat for a file or directory, or None if it was not present.
+        """
+        return self.files.get(rel) or self.dirs.get(rel)
+
+    def job_size(self, rel):
+        """
+        Total bytes of the files below the job folder rel, or the size of rel if it is a plain file.
+        """
+        if rel in self.files:
+            return self.files[rel].size
+        return sum(st.size for st in self.jobs.get(rel, {}).values())
+
+    def refresh(self, rel):
+        """
+        Re-stat a file the agent itself rewrote during this scan (e.g. metadata injection), so later
+        phases see its new size and mtime. Returns the new FileStat, or None if the file is gone.
+        """
+        st = self._stat(self.root / rel)
+        job = rel.split('/', 1)[0]
+        for files in (self.files, self.jobs.get(job) if job != rel else None):
+            if files is None:
+                continue
+            if st is None:
+                files.pop(rel, None)
+            else:
+                files[rel] = st
+        return st
+
+    def job_files(self, rel):
+        """
+        Return {relpath: FileStat} for every file below the job folder rel (empty for plain files).
+        """
+        return self.jobs.get(rel, {})
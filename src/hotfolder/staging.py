@@ -0,0 +1,135 @@
+import errno
+import os
+import secrets
+import shutil
+from pathlib import Path
+
+STAGING_DIR = ".staging"
+FSYNC_BATCH = 64
+
+
+def _fsync(path, directory=False):
+    flags = os.O_RDONLY | (getattr(os, "O_DIRECTORY", 0) if directory else 0)
+    try:
+        fd = os.open(path, flags)
+    except OSError:
+        if directory:
+            return  # Directories cannot be opened on Windows; renames there are durable on their own
+        raise
+    try:
+        os.fsync(fd)
+    except OSError as e:
+        # Some filesystems (SMB, some FUSE) do not support fsync on directories
+        if not directory or e.errno not in (errno.EINVAL, errno.EBADF, errno.ENOTSUP, errno.EOPNOTSUPP):
+            raise
+    finally:
+        os.close(fd)
+
+
+class StagedDelivery:
+    """
+    Delivers files into an OUT folder through the hidden directory OUT/.staging on the same volume.
+    Files are written under temporary names there, fsync'd in batches of fsync_batch, and only then
+    renamed to their final paths, so anything polling OUT never sees a partially written file.
+    A job folder that does not exist in OUT yet is built completely inside the staging directory and
+    renamed into place in one step, so the whole job appears at once.
+    """
+    def __init__(self, out_root, fsync_batch=FSYNC_BATCH):
+        self.out_root = Path(out_root)
+        self.root = self.out_root / STAGING_DIR
+        self.fsync_batch = max(1, int(fsync_batch))
+
+    def _new_path(self, name):
+        self.root.mkdir(parents=True, exist_ok=True)
+        return self.root / f"{secrets.token_hex(6)}.{name}"
+
+    def path_for(self, dst):
+        """
+        Return a unique temporary path in the staging directory for a file that will become dst.
+        """
+        return self._new_path(Path(dst).name)
+
+    def job_root(self, dest_dir):
+        """
+        Return the directory a job folder should be written into: dest_dir itself if it already exists
+        (files are then staged one by one), otherwise a new staging directory for finish_job().
+        """
+        dest_dir = Path(dest_dir)
+        if dest_dir.exists():
+            return dest_dir
+        root = self._new_path(dest_dir.name)
+        root.mkdir()
+        return root
+
+    def publish(self, pairs):
+        """
+        fsync and rename every (temporary path, final path) pair, in order and in batches of fsync_batch.
+        The final directories are fsync'd after each batch so the renames survive a crash as well.
+        """
+        pairs = [(Path(tmp), Path(dst)) for tmp, dst in pairs]
+        for start in range(0, len(pairs), self.fsync_batch):
+            batch = pairs[start:start + self.fsync_batch]
+            for tmp, _ in batch:
+                _fsync(tmp)
+            for tmp, dst in batch:
+                os.replace(tmp, dst)
+            for parent in sorted({dst.parent for _, dst in batch}):
+                _fsync(parent, directory=True)
+
+    def finish_job(self, root, dest_dir):
+        """
+        Move a job folder built by job_root() into place: fsync its files in batches, then rename the
+        whole directory. If dest_dir appeared in the meantime, the files are renamed into it one by one.
+        """
+        root, dest_dir = Path(root), Path(dest_dir)
+        if root == dest_dir:
+            return
+        files = []
+        dirs = []
+        for current, _, names in os.walk(root):
+            dirs.append(Path(current))
+            files.extend(Path(current) / name for name in names)
+        for start in range(0, len(files), self.fsync_batch):
+            for path in files[start:start + self.fsync_batch]:
+                _fsync(path)
+        for directory in reversed(dirs):
+            _fsync(directory, directory=True)
+        dest_dir.parent.mkdir(parents=True, exist_ok=True)
+        try:
+            os.rename(root, dest_dir)
+        except OSError:
+            if not dest_dir.is_dir():
+                raise
+            self._merge(root, dest_dir)
+        _fsync(dest_dir.parent, directory=True)
+
+    def _merge(self, root, dest_dir):
+        for current, _, names in os.walk(root):
+            target = dest_dir / Path(current).relative_to(root)
+            target.mkdir(parents=True, exist_ok=True)
+            for name in names:
+                os.replace(Path(current) / name, target / name)
+            _fsync(target, directory=True)
+        shutil.rmtree(root, ignore_errors=True)
+
+    def discard(self, path):
+        """
+        Remove a temporary file or job folder that will not be published.
+        """
+        path = Path(path)
+        if path == self.root or self.root not in path.parents:
+            return
+        if path.is_dir():
+            shutil.rmtree(path, ignore_errors=True)
+        else:
+            try:
+                path.unlink()
+            except FileNotFoundError:
+                pass
+
+    def clear(self):
+        """
+        Remove leftovers of deliveries that were interrupted (e.g. by a crash) from the staging directory.
+        """
+        if self.root.is_dir():
+            shutil.rmtree(self.root, ignore_errors=True)
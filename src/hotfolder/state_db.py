@@ -1,7 +1,14 @@
 import sqlite3
 from pathlib import Path
 import threading
-import time
+import unicodedata
+from contextlib import contextmanager
+
+def job_of(file_path: str) -> str:
+    """
+    Return the job (top-level item) a relative path belongs to, NFC-normalized.
+    """
+    return unicodedata.normalize('NFC', file_path.split('/', 1)[0])
 
 class HotfolderStateDB:
     """
@@ -9,25 +16,155 @@ class HotfolderStateDB:
     Tracks seen and processed files per hotfolder, replacing .seen.json and .processed.json.
     All state is kept in .db/hotfolder_state.db in the hotfolder.
     Thread-safe for use in multi-threaded watcher.
+    A single connection is kept open for the lifetime of the object; call close()
+    when the hotfolder goes away.
+    Each write commits on its own unless it runs inside `with state_db.transaction():`,
+    in which case everything is committed once when the outermost block exits.
+    Every row carries the job (top-level item) it belongs to, so per-job reads and deletes use an index.
+    The schema version is kept in PRAGMA user_version; older databases are migrated on open.
     """
-    def __init__(self, folder: Path):
+    SYNCHRONOUS_MODES = ("OFF", "NORMAL", "FULL", "EXTRA")
+    JOURNAL_MODES = ("DELETE", "TRUNCATE", "PERSIST", "MEMORY", "WAL", "OFF")
+
+    def __init__(self, folder: Path, journal_mode: str = "WAL", synchronous: str = "NORMAL", cache_size: int = -2000):
         """
         Initialize the state DB for a given hotfolder.
         Creates the database and tables if they do not exist.
+        journal_mode, synchronous and cache_size are applied as SQLite pragmas
+        (cache_size follows SQLite semantics: negative values are KiB, positive values are pages).
         """
         folder = Path(folder)
         folder.mkdir(exist_ok=True)  # Ensure hotfolder exists
         db_dir = folder / ".db"
         db_dir.mkdir(exist_ok=True)
         self.db_path = db_dir / "hotfolder_state.db"
-        self.lock = threading.Lock()
+        journal_mode = str(journal_mode).upper()
+        synchronous = str(synchronous).upper()
+        if journal_mode not in self.JOURNAL_MODES:
+            raise ValueError(f"Invalid journal_mode '{journal_mode}', expected one of {self.JOURNAL_MODES}")
+        if synchronous not in self.SYNCHRONOUS_MODES:
+            raise ValueError(f"Invalid synchronous '{synchronous}', expected one of {self.SYNCHRONOUS_MODES}")
+        self.journal_mode = journal_mode
+        self.synchronous = synchronous
+        self.cache_size = int(cache_size)
+        # Re-entrant so that single-row helpers can be called inside transaction()
+        self.lock = threading.RLock()
+        self.conn = None
+        self._transaction_depth = 0
+        self.commits = 0  # Write transactions committed since the DB was opened (exported as a metric)
         self._init_db()
 
+    def _connect(self):
+        """
+        Return the long-lived connection, opening and configuring it on first use.
+        Must be called with self.lock held.
+        """
+        if self.conn is None:
+            # The connection is shared between threads; access is serialized by self.lock
+            conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            conn.execute(f'PRAGMA journal_mode={self.journal_mode}')
+            conn.execute(f'PRAGMA synchronous={self.synchronous}')
+            conn.execute(f'PRAGMA cache_size={self.cache_size}')
+            self.conn = conn
+        return self.conn
+
+    @contextmanager
+    def transaction(self):
+        """
+        Group several writes into a single commit. Nested blocks join the outer transaction.
+        The whole transaction is rolled back if the outermost block raises.
+        """
+        with self.lock:
+            conn = self._connect()
+            self._transaction_depth += 1
+            try:
+                yield self
+            except BaseException:
+                self._transaction_depth -= 1
+                if self._transaction_depth == 0:
+                    conn.rollback()
+                raise
+            self._transaction_depth -= 1
+            if self._transaction_depth == 0:
+                self._commit(conn)
+
+    @contextmanager
+    def _write(self):
+        """
+        Yield the connection for a write, committing afterwards unless a transaction() is open.
+        """
+        with self.lock:
+            conn = self._connect()
+            if self._transaction_depth:
+                yield conn
+                return
+            try:
+                yield conn
+            except BaseException:
+                conn.rollback()
+                raise
+            self._commit(conn)
+
+    @contextmanager
+    def _read(self):
+        """
+        Yield the connection for a read without touching any open transaction.
+        """
+        with self.lock:
+            yield self._connect()
+
+    @contextmanager
+    def outside_transaction(self):
+        """
+        Commit the open transaction() and run the block outside it, without holding the lock, e.g. while
+        a job is transferred; writes in the block commit on their own. The transaction() carries on with
+        what is written afterwards. Must be called from the thread that opened the transaction.
+        """
+        with self.lock:
+            depth = self._transaction_depth
+            if self.conn is not None:
+                self._commit(self.conn)
+            self._transaction_depth = 0
+        # transaction() holds the lock once per nesting level
+        for _ in range(depth):
+            self.lock.release()
+        try:
+            yield self
+        finally:
+            for _ in range(depth):
+                self.lock.acquire()
+            self._transaction_depth = depth
+
+    def commit(self):
+        """
+        Make everything written so far durable now, even inside transaction(). The open transaction()
+        block carries on and only commits or rolls back what is written after this point.
+        """
+        with self.lock:
+            if self.conn is not None:
+                self._commit(self.conn)
+
+    def _commit(self, conn):
+        # Only transactions that actually wrote something are counted
+        if conn.in_transaction:
+            self.commits += 1
+        conn.commit()
+
+    def close(self):
+        """
+        Close the underlying connection. The object may be reused; the connection is reopened on demand.
+        """
+        with self.lock:
+            if self.conn is not None:
+                self.conn.close()
+                self.conn = None
+
     def _init_db(self):
         """
-        Create tables for seen_files and processed_files if they do not exist.
+        Create tables for seen_files and processed_files if they do not exist,
+        then apply any pending schema migrations.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
+        with self._write() as conn:
             c = conn.cursor()
             c.execute('''CREATE TABLE IF NOT EXISTS seen_files (
                 file_path TEXT PRIMARY KEY,
@@ -41,129 +178,410 @@ class HotfolderStateDB:
                 mtime REAL,
                 ready_for_deletion INTEGER DEFAULT 0
             )''')
-            conn.commit()
+        self._migrate()
+
+    # --- Schema migrations ---
+
+    def _migrate(self):
+        """
+        Bring the schema up to SCHEMA_VERSION, one version per transaction.
+        """
+        with self.lock:
+            conn = self._connect()
+            version = conn.execute('PRAGMA user_version').fetchone()[0]
+            for target, migration in enumerate(self.MIGRATIONS, start=1):
+                if version >= target:
+                    continue
+                conn.execute('BEGIN IMMEDIATE')
+                try:
+                    migration(self, conn)
+                    conn.execute(f'PRAGMA user_version = {target}')
+                except BaseException:
+                    conn.rollback()
+                    raise
+                conn.commit()
+                version = target
+
+    def _migrate_job_column(self, conn):
+        # 1: job column on both tables, backfilled from file_path and indexed
+        for table in ('seen_files', 'processed_files'):
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+            if 'job' not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN job TEXT')
+            rows = conn.execute(f'SELECT file_path FROM {table} WHERE job IS NULL').fetchall()
+            conn.executemany(f'UPDATE {table} SET job = ? WHERE file_path = ?', ((job_of(r[0]), r[0]) for r in rows))
+            conn.execute(f'CREATE INDEX IF NOT EXISTS idx_{table}_job ON {table} (job)')
+
+    def _migrate_digests(self, conn):
+        # 2: content digests for change_detection 'sampled'/'full', plus a digest cache keyed by (size, mtime, inode)
+        for table in ('seen_files', 'processed_files'):
+            columns = [row[1] for row in conn.execute(f'PRAGMA table_info({table})')]
+            if 'digest' not in columns:
+                conn.execute(f'ALTER TABLE {table} ADD COLUMN digest TEXT')
+        conn.execute('''CREATE TABLE IF NOT EXISTS file_hashes (
+            file_path TEXT PRIMARY KEY,
+            job TEXT,
+            size INTEGER,
+            mtime REAL,
+            inode INTEGER,
+            digest TEXT
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_file_hashes_job ON file_hashes (job)')
+
+    def _migrate_block_signatures(self, conn):
+        # 3: per-block signatures of the version last delivered to OUT, for keep_copy delta sync
+        conn.execute('''CREATE TABLE IF NOT EXISTS block_signatures (
+            file_path TEXT PRIMARY KEY,
+            job TEXT,
+            block_size INTEGER,
+            out_size INTEGER,
+            out_mtime_ns INTEGER,
+            signatures BLOB
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_block_signatures_job ON block_signatures (job)')
+
+    def _migrate_metadata_status(self, conn):
+        # 4: IPTC injection status, so each version of an image is tagged once
+        conn.execute('''CREATE TABLE IF NOT EXISTS metadata_status (
+            file_path TEXT PRIMARY KEY,
+            job TEXT,
+            field TEXT,
+            value TEXT,
+            size INTEGER,
+            mtime REAL,
+            status TEXT
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_metadata_status_job ON metadata_status (job)')
+
+    def _migrate_transfer_journal(self, conn):
+        # 5: per-file intents and completions of transfers to OUT, replayed after a crash
+        conn.execute('''CREATE TABLE IF NOT EXISTS transfer_journal (
+            file_path TEXT PRIMARY KEY,
+            job TEXT,
+            dst TEXT,
+            mode TEXT,
+            size INTEGER,
+            mtime REAL,
+            done INTEGER DEFAULT 0,
+            created REAL
+        )''')
+        conn.execute('CREATE INDEX IF NOT EXISTS idx_transfer_journal_job ON transfer_journal (job)')
+
+    MIGRATIONS = [_migrate_job_column, _migrate_digests, _migrate_block_signatures, _migrate_metadata_status,
+                  _migrate_transfer_journal]
+    SCHEMA_VERSION = len(MIGRATIONS)
 
     # --- Seen files ---
 
-    def set_seen(self, file_path: str, seen_time: float, mtime: float):
+    def set_seen(self, file_path: str, seen_time: float, mtime: float, digest: str = None):
         """
-        Mark a file as seen, with its seen_time and mtime.
+        Mark a file as seen, with its seen_time, mtime and optional content digest.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('''INSERT OR REPLACE INTO seen_files (file_path, seen_time, mtime) VALUES (?, ?, ?)''',
-                      (file_path, seen_time, mtime))
-            conn.commit()
+        self.set_seen_many([(file_path, seen_time, mtime, digest)])
+
+    def set_seen_many(self, rows):
+        """
+        Mark many files as seen in one statement.
+        rows: iterable of (file_path, seen_time, mtime) or (file_path, seen_time, mtime, digest).
+        """
+        params = ((r[0], r[1], r[2], job_of(r[0]), r[3] if len(r) > 3 else None) for r in rows)
+        with self._write() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO seen_files (file_path, seen_time, mtime, job, digest) VALUES (?, ?, ?, ?, ?)''', params)
 
     def get_seen(self):
         """
-        Return a dict of all seen files: {file_path: {'seen_time': ..., 'mtime': ...}}
+        Return a dict of all seen files: {file_path: {'seen_time': ..., 'mtime': ..., 'digest': ...}}
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             c = conn.cursor()
-            c.execute('SELECT file_path, seen_time, mtime FROM seen_files')
-            return {row[0]: {'seen_time': row[1], 'mtime': row[2]} for row in c.fetchall()}
+            c.execute('SELECT file_path, seen_time, mtime, digest FROM seen_files')
+            return {row[0]: {'seen_time': row[1], 'mtime': row[2], 'digest': row[3]} for row in c.fetchall()}
+
+    def get_seen_for_job(self, job: str):
+        """
+        Return seen files of one job (the job entry itself and everything below it), same format as get_seen().
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT file_path, seen_time, mtime, digest FROM seen_files WHERE job = ?', (job_of(job),))
+            return {row[0]: {'seen_time': row[1], 'mtime': row[2], 'digest': row[3]} for row in c.fetchall()}
 
     def remove_seen(self, file_path: str):
         """
         Remove a file from the seen_files table.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM seen_files WHERE file_path = ?', (file_path,))
-            conn.commit()
+        self.remove_seen_many([file_path])
+
+    def remove_seen_many(self, file_paths):
+        """
+        Remove many files from the seen_files table in one statement.
+        """
+        with self._write() as conn:
+            conn.executemany('DELETE FROM seen_files WHERE file_path = ?', ((p,) for p in file_paths))
 
     def clear_seen(self):
         """
         Remove all entries from the seen_files table.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM seen_files')
-            conn.commit()
+        with self._write() as conn:
+            conn.execute('DELETE FROM seen_files')
 
     def remove_seen_prefix(self, prefix: str):
         """
         Remove all seen files where file_path starts with prefix or equals prefix.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM seen_files WHERE file_path = ? OR file_path LIKE ?', (prefix, f'{prefix}/%'))
-            conn.commit()
+        with self._write() as conn:
+            conn.execute('DELETE FROM seen_files WHERE job = ? AND (file_path = ? OR file_path LIKE ?)', (job_of(prefix), prefix, f'{prefix}/%'))
 
     # --- Processed files ---
 
-    def set_processed(self, file_path: str, processed_time: float, mtime: float, ready_for_deletion: bool = False):
+    def set_processed(self, file_path: str, processed_time: float, mtime: float, ready_for_deletion: bool = False, digest: str = None):
         """
-        Mark a file as processed, with its processed_time, mtime, and ready_for_deletion flag.
+        Mark a file as processed, with its processed_time, mtime, ready_for_deletion flag and optional content digest.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('''INSERT OR REPLACE INTO processed_files (file_path, processed_time, mtime, ready_for_deletion) VALUES (?, ?, ?, ?)''',
-                      (file_path, processed_time, mtime, int(ready_for_deletion)))
-            conn.commit()
+        self.set_processed_many([(file_path, processed_time, mtime, ready_for_deletion, digest)])
+
+    def set_processed_many(self, rows):
+        """
+        Mark many files as processed in one statement.
+        rows: iterable of (file_path, processed_time, mtime[, ready_for_deletion[, digest]]).
+        """
+        params = ((r[0], r[1], r[2], int(r[3]) if len(r) > 3 else 0, job_of(r[0]), r[4] if len(r) > 4 else None) for r in rows)
+        with self._write() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO processed_files (file_path, processed_time, mtime, ready_for_deletion, job, digest) VALUES (?, ?, ?, ?, ?, ?)''', params)
 
     def get_processed(self):
         """
-        Return a dict of all processed files: {file_path: {'processed_time': ..., 'mtime': ...}}
+        Return a dict of all processed files: {file_path: {'processed_time': ..., 'mtime': ..., 'digest': ...}}
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             c = conn.cursor()
-            c.execute('SELECT file_path, processed_time, mtime FROM processed_files')
-            return {row[0]: {'processed_time': row[1], 'mtime': row[2]} for row in c.fetchall()}
+            c.execute('SELECT file_path, processed_time, mtime, digest FROM processed_files')
+            return {row[0]: {'processed_time': row[1], 'mtime': row[2], 'digest': row[3]} for row in c.fetchall()}
+
+    def get_processed_for_job(self, job: str):
+        """
+        Return processed files of one job (the job entry itself and everything below it), same format as get_processed().
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT file_path, processed_time, mtime, digest FROM processed_files WHERE job = ?', (job_of(job),))
+            return {row[0]: {'processed_time': row[1], 'mtime': row[2], 'digest': row[3]} for row in c.fetchall()}
 
     def remove_processed(self, file_path: str):
         """
         Remove a file from the processed_files table.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM processed_files WHERE file_path = ?', (file_path,))
-            conn.commit()
+        self.remove_processed_many([file_path])
+
+    def remove_processed_many(self, file_paths):
+        """
+        Remove many files from the processed_files table in one statement.
+        """
+        with self._write() as conn:
+            conn.executemany('DELETE FROM processed_files WHERE file_path = ?', ((p,) for p in file_paths))
 
     def remove_processed_prefix(self, prefix: str):
         """
         Remove all processed files where file_path starts with prefix or equals prefix.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM processed_files WHERE file_path = ? OR file_path LIKE ?', (prefix, f'{prefix}/%'))
-            conn.commit()
+        with self._write() as conn:
+            conn.execute('DELETE FROM processed_files WHERE job = ? AND (file_path = ? OR file_path LIKE ?)', (job_of(prefix), prefix, f'{prefix}/%'))
 
     def clear_processed(self):
         """
         Remove all entries from the processed_files table.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('DELETE FROM processed_files')
-            conn.commit()
+        with self._write() as conn:
+            conn.execute('DELETE FROM processed_files')
 
     def mark_ready_for_deletion(self, job_folder: str):
         """
         Mark a job folder as ready for deletion (set ready_for_deletion=1 for the folder entry).
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('''UPDATE processed_files SET ready_for_deletion=1 WHERE file_path = ?''', (job_folder,))
-            conn.commit()
+        with self._write() as conn:
+            conn.execute('''UPDATE processed_files SET ready_for_deletion=1 WHERE file_path = ?''', (job_folder,))
 
     def get_ready_for_deletion_jobs(self):
         """
         Return a list of job folder names marked as ready for deletion.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
+        with self._read() as conn:
             c = conn.cursor()
             c.execute('''SELECT file_path FROM processed_files WHERE ready_for_deletion=1''')
             return [row[0] for row in c.fetchall()]
 
+    # --- Content digests ---
+
+    def get_hashes_for_job(self, job: str):
+        """
+        Return cached digests of one job: {file_path: (size, mtime, inode, digest)}
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT file_path, size, mtime, inode, digest FROM file_hashes WHERE job = ?', (job_of(job),))
+            return {row[0]: tuple(row[1:]) for row in c.fetchall()}
+
+    def set_hashes_many(self, rows):
+        """
+        Cache digests in one statement. rows: iterable of (file_path, size, mtime, inode, digest).
+        """
+        params = ((r[0], job_of(r[0]), r[1], r[2], r[3], r[4]) for r in rows)
+        with self._write() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO file_hashes (file_path, job, size, mtime, inode, digest) VALUES (?, ?, ?, ?, ?, ?)''', params)
+
+    def remove_hashes_many(self, file_paths):
+        """
+        Drop cached digests for many files in one statement.
+        """
+        with self._write() as conn:
+            conn.executemany('DELETE FROM file_hashes WHERE file_path = ?', ((p,) for p in file_paths))
+
+    # --- Delta sync ---
+
+    def get_block_signatures_for_job(self, job: str):
+        """
+        Return delta-sync records of one job: {file_path: (block_size, out_size, out_mtime_ns, signatures)}
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT file_path, block_size, out_size, out_mtime_ns, signatures FROM block_signatures WHERE job = ?', (job_of(job),))
+            return {row[0]: tuple(row[1:]) for row in c.fetchall()}
+
+    def set_block_signatures_many(self, rows):
+        """
+        Store delta-sync records in one statement.
+        rows: iterable of (file_path, block_size, out_size, out_mtime_ns, signatures).
+        """
+        params = ((r[0], job_of(r[0]), r[1], r[2], r[3], r[4]) for r in rows)
+        with self._write() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO block_signatures (file_path, job, block_size, out_size, out_mtime_ns, signatures) VALUES (?, ?, ?, ?, ?, ?)''', params)
+
+    def remove_block_signatures_many(self, file_paths):
+        """
+        Drop delta-sync records for many files in one statement.
+        """
+        with self._write() as conn:
+            conn.executemany('DELETE FROM block_signatures WHERE file_path = ?', ((p,) for p in file_paths))
+
+    # --- Metadata injection ---
+
+    def get_metadata_status_for_job(self, job: str):
+        """
+        Return metadata injection results of one job: {file_path: (field, value, size, mtime, status)}
+        size and mtime are those of the file after injection.
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT file_path, field, value, size, mtime, status FROM metadata_status WHERE job = ?', (job_of(job),))
+            return {row[0]: tuple(row[1:]) for row in c.fetchall()}
+
+    def set_metadata_status_many(self, rows):
+        """
+        Store metadata injection results in one statement.
+        rows: iterable of (file_path, field, value, size, mtime, status).
+        """
+        params = ((r[0], job_of(r[0]), r[1], r[2], r[3], r[4], r[5]) for r in rows)
+        with self._write() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO metadata_status (file_path, job, field, value, size, mtime, status) VALUES (?, ?, ?, ?, ?, ?, ?)''', params)
+
+    def remove_metadata_status_many(self, file_paths):
+        """
+        Drop metadata injection results for many files in one statement.
+        """
+        with self._write() as conn:
+            conn.executemany('DELETE FROM metadata_status WHERE file_path = ?', ((p,) for p in file_paths))
+
+    # --- Transfer journal ---
+
+    def add_journal_intents(self, rows, created: float):
+        """
+        Record files about to be transferred to OUT. rows: iterable of (file_path, dst, mode, size, mtime)
+        where mode is 'copy' or 'move' and size/mtime are those of the source.
+        """
+        params = ((r[0], job_of(r[0]), str(r[1]), r[2], r[3], r[4], created) for r in rows)
+        with self._write() as conn:
+            conn.executemany('''INSERT OR REPLACE INTO transfer_journal (file_path, job, dst, mode, size, mtime, done, created) VALUES (?, ?, ?, ?, ?, ?, 0, ?)''', params)
+
+    def mark_journal_done_many(self, file_paths):
+        """
+        Mark journaled files as completely transferred.
+        """
+        with self._write() as conn:
+            conn.executemany('UPDATE transfer_journal SET done = 1 WHERE file_path = ?', ((p,) for p in file_paths))
+
+    def get_journal_for_job(self, job: str):
+        """
+        Return the journal of one job: {file_path: {'dst': ..., 'mode': ..., 'size': ..., 'mtime': ..., 'done': bool}}
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT file_path, dst, mode, size, mtime, done FROM transfer_journal WHERE job = ?', (job_of(job),))
+            return {row[0]: {'dst': row[1], 'mode': row[2], 'size': row[3], 'mtime': row[4], 'done': bool(row[5])} for row in c.fetchall()}
+
+    def get_journal_jobs(self):
+        """
+        Return the set of jobs with an unfinished transfer in the journal.
+        """
+        with self._read() as conn:
+            return {row[0] for row in conn.execute('SELECT DISTINCT job FROM transfer_journal')}
+
+    def clear_journal(self, job: str):
+        """
+        Drop the journal of a job whose transfer has finished.
+        """
+        with self._write() as conn:
+            conn.execute('DELETE FROM transfer_journal WHERE job = ?', (job_of(job),))
+
+    # --- All tables ---
+
+    def remove_many(self, file_paths):
+        """
+        Remove many files from seen_files, processed_files, the digest cache, delta-sync records and
+        metadata injection results in a single transaction.
+        """
+        file_paths = list(file_paths)
+        with self.transaction():
+            self.remove_seen_many(file_paths)
+            self.remove_processed_many(file_paths)
+            self.remove_hashes_many(file_paths)
+            self.remove_block_signatures_many(file_paths)
+            self.remove_metadata_status_many(file_paths)
+
+    def remove_prefix(self, prefix: str):
+        """
+        Remove a job folder and everything below it from all tables in a single transaction.
+        """
+        with self.transaction():
+            self.remove_seen_prefix(prefix)
+            self.remove_processed_prefix(prefix)
+            with self._write() as conn:
+                for table in ('file_hashes', 'block_signatures', 'metadata_status'):
+                    conn.execute(f'DELETE FROM {table} WHERE job = ? AND (file_path = ? OR file_path LIKE ?)', (job_of(prefix), prefix, f'{prefix}/%'))
+
+    def get_jobs(self):
+        """
+        Return the set of jobs that have any seen or processed entries.
+        """
+        with self._read() as conn:
+            c = conn.execute('SELECT job FROM seen_files UNION SELECT job FROM processed_files')
+            return {row[0] for row in c.fetchall()}
+
+    def delete_job(self, job: str):
+        """
+        Remove every entry of a job from all tables in a single transaction.
+        """
+        job = job_of(job)
+        with self.transaction():
+            with self._write() as conn:
+                conn.execute('DELETE FROM seen_files WHERE job = ?', (job,))
+                conn.execute('DELETE FROM processed_files WHERE job = ?', (job,))
+                conn.execute('DELETE FROM file_hashes WHERE job = ?', (job,))
+                conn.execute('DELETE FROM block_signatures WHERE job = ?', (job,))
+                conn.execute('DELETE FROM metadata_status WHERE job = ?', (job,))
+                conn.execute('DELETE FROM transfer_journal WHERE job = ?', (job,))
+
     # --- Utility ---
 
     def vacuum(self):
         """
         Run VACUUM to compact the database file.
         """
-        with self.lock, sqlite3.connect(self.db_path) as conn:
-            c = conn.cursor()
-            c.execute('VACUUM')
-            conn.commit() 
\ No newline at end of file
+        with self.lock:
+            if self._transaction_depth:
+                raise RuntimeError("VACUUM cannot run inside a transaction")
+            self._connect().execute('VACUUM')
@@ -0,0 +1,99 @@
+import os
+import threading
+import time
+from pathlib import Path
+
+
+class TokenBucket:
+    """
+    Token bucket refilled at `rate` tokens per second and holding at most one second's worth.
+    consume() may take the bucket into debt: the caller sleeps until the debt is paid off, so a request
+    larger than the bucket still passes, and the long-run rate holds across all threads. rate 0 = no limit.
+    """
+    def __init__(self, rate=0):
+        self._lock = threading.Lock()
+        self.rate = 0.0
+        self.tokens = 0.0
+        self.stamp = time.monotonic()
+        self.set_rate(rate)
+
+    def set_rate(self, rate):
+        rate = max(0.0, float(rate or 0))
+        with self._lock:
+            if rate != self.rate:
+                self.rate = rate
+                self.tokens = rate
+                self.stamp = time.monotonic()
+
+    def consume(self, amount):
+        """
+        Take amount tokens, sleeping as long as needed. Returns the seconds slept.
+        """
+        if not self.rate or amount <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self.tokens = min(self.rate, self.tokens + (now - self.stamp) * self.rate)
+            self.stamp = now
+            self.tokens -= amount
+            wait = -self.tokens / self.rate if self.tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+
+class Throttle:
+    """
+    A bytes/second and a files/second limit (0 = unlimited), shared by every thread that consumes from it.
+    """
+    def __init__(self, bytes_per_second=0, files_per_second=0):
+        self.bytes = TokenBucket(bytes_per_second)
+        self.files = TokenBucket(files_per_second)
+
+    def set_rates(self, bytes_per_second=0, files_per_second=0):
+        self.bytes.set_rate(bytes_per_second)
+        self.files.set_rate(files_per_second)
+
+    @property
+    def enabled(self):
+        return bool(self.bytes.rate or self.files.rate)
+
+    def consume(self, nbytes=0, files=0):
+        return self.files.consume(files) + self.bytes.consume(nbytes)
+
+
+class VolumeThrottles:
+    """
+    One Throttle per destination volume (st_dev), so every hotfolder and transfer thread writing to the
+    same share draws from the same limits, while deliveries to other volumes are not slowed down.
+    """
+    def __init__(self, bytes_per_second=0, files_per_second=0):
+        self.bytes_per_second = bytes_per_second
+        self.files_per_second = files_per_second
+        self._volumes = {}  # {st_dev: Throttle}
+        self._lock = threading.Lock()
+
+    @property
+    def enabled(self):
+        return bool(self.bytes_per_second or self.files_per_second)
+
+    def for_path(self, path):
+        """
+        Return the Throttle of the volume path is (or will be) on, or None if volumes are not limited.
+        """
+        if not self.enabled:
+            return None
+        path = Path(path)
+        while True:
+            try:
+                dev = os.stat(path).st_dev
+                break
+            except FileNotFoundError:
+                if path.parent == path:
+                    return None
+                path = path.parent  # Not created yet: use the nearest existing parent
+        with self._lock:
+            throttle = self._volumes.get(dev)
+            if throttle is None:
+                throttle = self._volumes[dev] = Throttle(self.bytes_per_second, self.files_per_second)
+            return throttle
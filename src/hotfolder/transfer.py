@@ -0,0 +1,500 @@
+import errno
+import os
+import shutil
+import sys
+import threading
+import time
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from hotfolder.delta import delta_sync_file
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+COPY_BUFFER_SIZE = 8 * 1024 * 1024
+FICLONE = 0x40049409  # _IOW(0x94, 9, int) from linux/fs.h
+# errnos meaning "this copy method is not available here", as opposed to a real I/O failure
+_UNSUPPORTED = {errno.ENOSYS, errno.EXDEV, errno.EINVAL, errno.EOPNOTSUPP, errno.ENOTSUP,
+                errno.ENOTTY, errno.EBADF, errno.ETXTBSY, errno.EPERM}
+
+
+def _clone(src_fd, dst_fd):
+    # Reflink (btrfs, XFS with reflink=1): the copy shares blocks with the source until either is written
+    if fcntl is None:
+        return False
+    try:
+        fcntl.ioctl(dst_fd, FICLONE, src_fd)
+    except OSError as e:
+        if e.errno in _UNSUPPORTED:
+            return False
+        raise
+    return True
+
+
+def _copy_fds(src_fd, dst_fd, size, buffer_size, throttle=None):
+    """
+    Copy src_fd to dst_fd from their current positions and return the method that finished the copy.
+    Each kernel-side method is tried in turn; a method that is unsupported hands over at the current
+    file positions, so a partial copy is never restarted.
+    throttle: optional callable taking a byte count, called before each chunk is copied; kernel-side
+    copies then also go in chunks of buffer_size so the limit is applied evenly.
+    """
+    copied = 0
+    chunk = buffer_size if throttle else 1 << 30
+    if hasattr(os, "copy_file_range"):
+        try:
+            while copied < size:
+                if throttle:
+                    throttle(min(size - copied, chunk))
+                n = os.copy_file_range(src_fd, dst_fd, min(size - copied, chunk))
+                if n == 0:
+                    break  # Some filesystems (FUSE, procfs) report success without copying
+                copied += n
+            if copied >= size:
+                return "copy_file_range"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    if copied == 0 and _clone(src_fd, dst_fd):
+        return "reflink"
+    if hasattr(os, "sendfile") and sys.platform.startswith("linux"):
+        try:
+            while copied < size:
+                if throttle:
+                    throttle(min(size - copied, chunk))
+                n = os.sendfile(dst_fd, src_fd, None, min(size - copied, chunk))
+                if n == 0:
+                    break
+                copied += n
+            if copied >= size:
+                return "sendfile"
+        except OSError as e:
+            if e.errno not in _UNSUPPORTED:
+                raise
+    # Userspace fallback; also picks up anything appended since size was taken
+    buf = bytearray(buffer_size)
+    view = memoryview(buf)
+    while True:
+        n = os.readv(src_fd, [buf])
+        if not n:
+            break
+        if throttle:
+            throttle(n)
+        written = 0
+        while written < n:
+            written += os.write(dst_fd, view[written:n])
+    return "chunked"
+
+
+def copy_file(src, dst, buffer_size=COPY_BUFFER_SIZE, throttle=None):
+    """
+    Copy src to dst preserving metadata like shutil.copy2, preferring kernel-side copies:
+    copy_file_range, then a FICLONE reflink, then sendfile, then a chunked copy with buffer_size bytes.
+    On non-Linux platforms shutil.copyfile (which already uses fcopyfile/CopyFile2) is used, or a
+    chunked copy when throttled. throttle: see _copy_fds.
+    Returns the name of the method that copied the data.
+    """
+    src, dst = str(src), str(dst)
+    if os.path.isdir(dst):
+        dst = os.path.join(dst, os.path.basename(src))
+    if not sys.platform.startswith("linux"):
+        if throttle:
+            with open(src, "rb") as fsrc, open(dst, "wb") as fdst:
+                while True:
+                    data = fsrc.read(buffer_size)
+                    if not data:
+                        break
+                    throttle(len(data))
+                    fdst.write(data)
+            method = "chunked"
+        else:
+            shutil.copyfile(src, dst)
+            method = "copyfile"
+        shutil.copystat(src, dst)
+        return method
+    if os.path.exists(dst) and os.path.samefile(src, dst):
+        raise shutil.SameFileError(f"{src!r} and {dst!r} are the same file")
+    with open(src, "rb") as fsrc:
+        size = os.fstat(fsrc.fileno()).st_size
+        with open(dst, "wb") as fdst:
+            method = _copy_fds(fsrc.fileno(), fdst.fileno(), size, buffer_size, throttle)
+    shutil.copystat(src, dst)
+    return method
+
+
+def move_file(src, dst, buffer_size=COPY_BUFFER_SIZE, throttle=None):
+    """
+    Move src to dst: a rename on the same filesystem, otherwise copy_file() followed by removing src.
+    Returns the method used.
+    """
+    try:
+        os.replace(src, dst)
+        return "rename"
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+    method = copy_file(src, dst, buffer_size, throttle)
+    os.unlink(src)
+    return method
+
+
+class TransferStats:
+    """
+    Aggregate counters for one job's transfer.
+    """
+    def __init__(self):
+        self.files = 0
+        self.bytes = 0
+        self.seconds = 0.0
+        self.methods = Counter()  # {copy method: files}
+
+    def add(self, other):
+        self.files += other.files
+        self.bytes += other.bytes
+        self.seconds += other.seconds
+        self.methods.update(other.methods)
+        return self
+
+    @property
+    def throughput(self):
+        """
+        Bytes per second over the wall-clock time of the transfer.
+        """
+        return self.bytes / self.seconds if self.seconds > 0 else 0.0
+
+    def __str__(self):
+        text = (f"{self.files} files, {self.bytes / 1048576:.1f} MiB in {self.seconds:.2f}s "
+                f"({self.throughput / 1048576:.1f} MiB/s)")
+        if self.methods:
+            text += " via " + ", ".join(f"{method}={count}" for method, count in self.methods.most_common())
+        return text
+
+
+class ByteBudget:
+    """
+    Caps the bytes one hotfolder has queued or in flight on the shared TransferEngine (0 = no limit).
+    A job larger than the budget still runs, just not alongside more of the same hotfolder's files,
+    so the shared transfer pool keeps room for jobs from other hotfolders.
+    """
+    def __init__(self, limit=0):
+        self.limit = max(0, int(limit))
+        self.in_flight = 0
+        self._cond = threading.Condition()
+
+    def set_limit(self, limit):
+        with self._cond:
+            self.limit = max(0, int(limit))
+            self._cond.notify_all()
+
+    def acquire(self, size):
+        with self._cond:
+            # Oversized groups are admitted once nothing else is in flight, so they cannot block forever
+            while self.limit and self.in_flight and self.in_flight + size > self.limit:
+                self._cond.wait()
+            self.in_flight += size
+
+    def release(self, size):
+        with self._cond:
+            self.in_flight -= size
+            self._cond.notify_all()
+
+
+def _source_size(paths):
+    size = 0
+    for path in paths:
+        try:
+            size += os.stat(path).st_size
+        except OSError:
+            pass  # Reported by the transfer itself
+    return size
+
+
+class TransferEngine:
+    """
+    Copies or moves the files of a job concurrently on a fixed-size thread pool.
+    One engine is shared by all hotfolders, so `workers` bounds the total number of files in flight.
+    run() blocks until the whole job is done, so jobs still complete one after another.
+    volume_throttles: optional throttle.VolumeThrottles limiting bytes and files per second for each
+    destination volume, shared by every hotfolder delivering to it.
+    """
+    def __init__(self, workers=4, buffer_size=COPY_BUFFER_SIZE, volume_throttles=None):
+        self.workers = max(1, int(workers))
+        self.buffer_size = max(64 * 1024, int(buffer_size))
+        self.volume_throttles = volume_throttles
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="hotfolder-transfer")
+            return self._executor
+
+    def run(self, tasks, keep_copy=True, update_mtime=False, logger=None, staging=None, on_done=None, budget=None, throttle=None):
+        """
+        Copy (keep_copy=True) or move every (src, dst) file pair and return TransferStats.
+        Pairs sharing a destination run sequentially in the given order, so the last one wins
+        exactly as in a serial loop. Destination folders are created as needed. If any file fails,
+        the remaining files are still transferred and the first error is raised at the end.
+        With staging (a staging.StagedDelivery), files are written under temporary names and published
+        together once all are done; moves on the same filesystem are plain renames and need no staging.
+        on_done, if given, is called in the calling thread with each list of (src, dst) pairs that has
+        completely arrived in OUT (used for the transfer journal).
+        With budget (a ByteBudget), files are only handed to the pool while the budget has room.
+        throttle: optional throttle.Throttle of the hotfolder, applied on top of the volume's limits.
+        """
+        start = time.time()
+        groups = OrderedDict()  # {dst: [src, ...]}
+        for src, dst in tasks:
+            groups.setdefault(Path(dst), []).append(Path(src))
+        for parent in sorted({dst.parent for dst in groups}):
+            parent.mkdir(parents=True, exist_ok=True)
+        stats = TransferStats()
+        errors = []
+        if self.workers == 1 or len(groups) <= 1:
+            results = []
+            for dst, srcs in groups.items():
+                size = _source_size(srcs) if budget is not None else 0
+                if budget is not None:
+                    budget.acquire(size)
+                try:
+                    results.append(self._transfer_group(srcs, dst, keep_copy, update_mtime, logger, staging, throttle))
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                finally:
+                    if budget is not None:
+                        budget.release(size)
+                if on_done and results[-1][4]:
+                    on_done(results[-1][4])
+        else:
+            pool = self._pool()
+            futures = [self._submit(pool, budget, srcs, self._transfer_group, srcs, dst, keep_copy, update_mtime, logger, staging, throttle)
+                       for dst, srcs in groups.items()]
+            results = []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+                    continue
+                if on_done and results[-1][4]:
+                    on_done(results[-1][4])
+        staged = []
+        for files, size, methods, pending, _ in results:
+            stats.files += files
+            stats.bytes += size
+            stats.methods.update(methods)
+            staged.extend(pending)
+        if staged:
+            published = self._publish(staging, staged, errors)
+            if on_done and published:
+                on_done(published)
+        stats.seconds = time.time() - start
+        if errors:
+            raise errors[0]
+        return stats
+
+    def run_delta(self, tasks, block_size, logger=None, staging=None, on_done=None, budget=None, throttle=None):
+        """
+        Delta-sync every (src, dst, previous) triple (see delta.delta_sync_file) and return
+        (TransferStats, {dst: record}). stats.bytes counts the bytes actually written to OUT.
+        Destination folders are created as needed; the first error is raised after all files finish.
+        With staging, the current dst is first cloned into the staging directory (copy_file, so a
+        reflink or in-kernel copy where possible), the delta is applied to the clone and the clone
+        is published over dst. on_done, budget and throttle work as in run(); the bytes a delta
+        actually wrote are charged to the throttle after each file.
+        """
+        start = time.time()
+        tasks = [(Path(src), Path(dst), previous) for src, dst, previous in tasks]
+        for parent in sorted({dst.parent for _, dst, _ in tasks}):
+            parent.mkdir(parents=True, exist_ok=True)
+        stats = TransferStats()
+        records = {}
+        errors = []
+        if self.workers == 1 or len(tasks) <= 1:
+            outcomes = []
+            for src, dst, previous in tasks:
+                size = _source_size([src]) if budget is not None else 0
+                if budget is not None:
+                    budget.acquire(size)
+                try:
+                    outcomes.append((dst, self._delta_file(src, dst, block_size, previous, staging, throttle)))
+                except Exception as e:
+                    errors.append(e)
+                finally:
+                    if budget is not None:
+                        budget.release(size)
+        else:
+            pool = self._pool()
+            futures = [(dst, self._submit(pool, budget, [src], self._delta_file, src, dst, block_size, previous, staging, throttle))
+                       for src, dst, previous in tasks]
+            outcomes = []
+            for dst, future in futures:
+                try:
+                    outcomes.append((dst, future.result()))
+                except Exception as e:
+                    errors.append(e)
+        staged = []
+        done = []
+        sources = {dst: src for src, dst, _ in tasks}
+        for dst, (written, record, method, tmp) in outcomes:
+            stats.files += 1
+            stats.bytes += written
+            stats.methods[method] += 1
+            records[dst] = record
+            if tmp is not None:
+                staged.append((tmp, dst, sources[dst], False))
+            else:
+                done.append((sources[dst], dst))
+        if staged:
+            done.extend(self._publish(staging, staged, errors))
+        if on_done and done:
+            on_done(done)
+        stats.seconds = time.time() - start
+        if errors:
+            raise errors[0]
+        return stats, records
+
+    def _submit(self, pool, budget, srcs, fn, *args):
+        # Submit fn(*args), first waiting (in the calling thread) until budget admits the size of srcs
+        if budget is None:
+            return pool.submit(fn, *args)
+        size = _source_size(srcs)
+        budget.acquire(size)
+        try:
+            future = pool.submit(fn, *args)
+        except BaseException:
+            budget.release(size)
+            raise
+        future.add_done_callback(lambda _: budget.release(size))
+        return future
+
+    def _delta_file(self, src, dst, block_size, previous, staging, throttle=None):
+        limit = self._limiter(dst, throttle)
+        if limit:
+            limit(files=1)
+        if staging is None:
+            result = delta_sync_file(src, dst, block_size, previous) + (None,)
+        else:
+            tmp = staging.path_for(dst)
+            try:
+                if previous is not None and dst.exists():
+                    copy_file(dst, tmp, self.buffer_size, limit)  # Keeps size and mtime, so previous still validates
+                result = delta_sync_file(src, tmp, block_size, previous) + (tmp,)
+            except BaseException:
+                staging.discard(tmp)
+                raise
+        if limit:
+            limit(result[0])  # Written blocks are only known afterwards; the next transfer pays the wait
+        return result
+
+    def _limiter(self, dst, throttle):
+        # Returns a callable(nbytes=0, files=0) consuming from the hotfolder's and dst's volume throttles,
+        # or None if neither limits anything
+        throttles = [throttle, self.volume_throttles.for_path(Path(dst).parent) if self.volume_throttles else None]
+        throttles = [t for t in throttles if t is not None and t.enabled]
+        if not throttles:
+            return None
+
+        def limit(nbytes=0, files=0):
+            for t in throttles:
+                t.consume(nbytes, files)
+        return limit
+
+    def _publish(self, staging, staged, errors):
+        # Rename staged (tmp, dst, src, move) files into place, then drop the sources of staged moves.
+        # Returns the (src, dst) pairs that are complete.
+        try:
+            staging.publish((tmp, dst) for tmp, dst, _, _ in staged)
+        except Exception as e:
+            for tmp, _, _, _ in staged:
+                staging.discard(tmp)
+            errors.append(e)
+            return []
+        done = []
+        for _, dst, src, move in staged:
+            if move:
+                try:
+                    os.unlink(src)
+                except OSError as e:
+                    errors.append(e)
+                    continue
+            done.append((src, dst))
+        return done
+
+    def _transfer_group(self, srcs, dst, keep_copy, update_mtime, logger, staging=None, throttle=None):
+        files = 0
+        size = 0
+        methods = Counter()
+        pending = []  # [(tmp, dst, src, move)] waiting to be published
+        done = []     # [(src, dst)] already in place
+        limit = self._limiter(dst, throttle)
+        for src in srcs:
+            if limit:
+                limit(files=1)
+            if staging is None:
+                n, method = self.transfer_file(src, dst, keep_copy, update_mtime, logger, limit)
+                done.append((src, dst))
+            else:
+                n, method, staged = self._stage_file(src, dst, keep_copy, update_mtime, logger, staging, limit)
+                if staged is not None:
+                    pending.append(staged)
+                else:
+                    done.append((src, dst))
+            size += n
+            files += 1
+            methods[method] += 1
+        return files, size, methods, pending, done
+
+    def _stage_file(self, src, dst, keep_copy, update_mtime, logger, staging, throttle=None):
+        # Like transfer_file, but copies land in the staging directory; returns (bytes, method, staged or None)
+        size = os.stat(src).st_size
+        if not keep_copy:
+            try:
+                os.replace(src, dst)  # Same filesystem: already atomic
+                self._touch(dst, update_mtime, logger)
+                return size, "rename", None
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+        tmp = staging.path_for(dst)
+        try:
+            method = copy_file(src, tmp, self.buffer_size, throttle)
+        except BaseException:
+            staging.discard(tmp)
+            raise
+        self._touch(tmp, update_mtime, logger)
+        return size, method, (tmp, dst, src, not keep_copy)
+
+    def _touch(self, path, update_mtime, logger):
+        if update_mtime:
+            try:
+                os.utime(str(path), None)
+            except Exception as e:
+                if logger:
+                    logger.warning(f"Failed to update mtime for {path}: {e}")
+
+    def transfer_file(self, src, dst, keep_copy=True, update_mtime=False, logger=None, throttle=None):
+        """
+        Copy or move a single file (metadata preserved like shutil.copy2).
+        throttle: optional callable taking a byte count (see copy_file).
+        Returns (bytes transferred, copy method).
+        """
+        size = os.stat(src).st_size
+        if keep_copy:
+            method = copy_file(src, dst, self.buffer_size, throttle)
+        else:
+            method = move_file(src, dst, self.buffer_size, throttle)
+        self._touch(dst, update_mtime, logger)
+        return size, method
+
+    def shutdown(self, wait=True):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(wait=wait)
+                self._executor = None
@@ -1,11 +1,15 @@
+import logging
 import os
 import time
 from pathlib import Path
 
+logger = logging.getLogger(__name__)
+
 def is_folder_stable(folder_path, resting_time):
     folder_path = Path(folder_path)
     now = time.time()
     stable = True
+    debug = logger.isEnabledFor(logging.DEBUG)
     for root, dirs, files in os.walk(folder_path):
         # Skip .config and .log folders at any level
         dirs[:] = [d for d in dirs if d not in ['.config', '.log']]
@@ -14,7 +18,8 @@ def is_folder_stable(folder_path, resting_time):
                 continue
             path = Path(root) / name
             mtime = path.stat().st_mtime
-            print(f"[DEBUG] Checking {path}: mtime={time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))}, now={time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))}, delta={now - mtime:.1f}s (resting_time={resting_time}s)")
+            if debug:
+                logger.debug(f"Checking {path}: mtime={time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(mtime))}, now={time.strftime('%Y-%m-%d %H:%M:%S', time.localtime(now))}, delta={now - mtime:.1f}s (resting_time={resting_time}s)")
             if now - mtime < resting_time:
                 stable = False
     return stable
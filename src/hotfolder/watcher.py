@@ -1,7 +1,7 @@
-from hotfolder.config import load_global_config, get_effective_config, generate_example_config_dict
-from hotfolder.logger import get_hotfolder_logger, get_hotfolder_debug_logger
+from hotfolder.config import load_global_config, get_effective_config, generate_example_config_dict, clear_config_cache
+from hotfolder.logger import get_hotfolder_logger, get_hotfolder_debug_logger, close_hotfolder_logger
 from hotfolder.utils import is_folder_stable, normalize_path, is_image_file
-from hotfolder.mover import move_hotfolder_contents, write_metadata
+from hotfolder.mover import move_hotfolder_contents, is_system_file
 import os
 import time
 from pathlib import Path
@@ -10,11 +10,31 @@ from datetime import datetime, timedelta
 import sys
 import shutil
 from hotfolder.state_db import HotfolderStateDB
+from hotfolder.snapshot import DirectorySnapshot
+from hotfolder.change_source import create_change_source, InotifyHub
+from hotfolder.scheduler import HotfolderScheduler
+from hotfolder.transfer import TransferEngine, TransferStats, ByteBudget, COPY_BUFFER_SIZE
+from hotfolder.hashing import ContentHasher, HASH_SAMPLE_SIZE
+from hotfolder.delta import DELTA_BLOCK_SIZE
+from hotfolder.metadata import MetadataStage, resolve_metadata_field
+from hotfolder.cpu_pool import CpuPool
+from hotfolder.staging import StagedDelivery, FSYNC_BATCH
+from hotfolder.journal import TransferJournal, arrived
+from hotfolder.throttle import Throttle, VolumeThrottles
+from hotfolder.metrics import MetricsRegistry, MetricsServer, declare_hotfolder_metrics
+from hotfolder.profiling import ScanTrace
+from hotfolder.leases import LeaseCoordinator, CLUSTER_DB_PATH, default_owner
+from hotfolder.dissolve import NameIndex, plan_dissolve, remove_empty_dirs
 import yaml
 import unicodedata
 
+# Seconds to let a burst of filesystem events settle before an event-triggered scan
+WATCH_DEBOUNCE = 1.0
+
 class HotfolderWatcher:
-    def __init__(self):
+    def __init__(self, worker=None):
+        # worker: index of this process when several agents are started by main.py (cluster mode)
+        self.worker = worker
         self.global_config = load_global_config()
         self.debug = self.global_config.get('debug', True)
         # Validate config
@@ -34,7 +54,37 @@ class HotfolderWatcher:
         if self.debug:
             self._debug_print('global', f"Normalized hotfolder roots list: {self.hotfolder_roots}", debug_enabled=self.debug)
         self.running = False
-        self.threads = {}  # {subfolder_path: thread}
+        self.hotfolders = {}  # {subfolder_path: out_subfolder}, scans run on self.scheduler
+        self.hotfolder_pairs = {}  # {subfolder_path: out_subfolder}, every hotfolder found in the roots
+        self.leases = None  # LeaseCoordinator in cluster mode: only leased hotfolders are scanned
+        self.scheduler = None
+        self.inotify_hub = None  # One inotify instance for all hotfolders, see start_hotfolder
+        self.state_dbs = {}  # {subfolder_path: HotfolderStateDB}, long-lived per hotfolder
+        self.snapshots = {}  # {subfolder_path: DirectorySnapshot}, previous scan's snapshot
+        self.debug_levels = {}  # {subfolder_path: bool}, debug setting resolved at the start of each scan
+        self.byte_budgets = {}  # {subfolder_path: ByteBudget}, bytes a hotfolder may have in flight
+        self.throttles = {}  # {subfolder_path: Throttle}, a hotfolder's own bytes/files per second limits
+        # Shared by all hotfolders, so transfer_workers bounds the files in flight across the agent
+        self.transfer_engine = TransferEngine(
+            self.global_config.get("transfer_workers", 4),
+            buffer_size=self.global_config.get("copy_buffer_size", COPY_BUFFER_SIZE),
+            # Limits per destination volume, shared by every hotfolder that delivers to it
+            volume_throttles=VolumeThrottles(
+                self.global_config.get("volume_bytes_per_second", 0),
+                self.global_config.get("volume_files_per_second", 0),
+            ),
+        )
+        # Worker processes for CPU-bound job steps (content hashing, image metadata), shared by all hotfolders;
+        # metadata_workers is the name used before hashing moved to the same pool
+        self.cpu_pool = CpuPool(
+            self.global_config.get("cpu_workers", self.global_config.get("metadata_workers", 2)),
+            self.global_config.get("cpu_queue_size", 0),
+        )
+        self.metadata_stage = MetadataStage(self.cpu_pool)
+        # Always collected; served over HTTP only when metrics are enabled in the global config
+        self.metrics = MetricsRegistry()
+        declare_hotfolder_metrics(self.metrics)
+        self.arrivals = {}  # {(subfolder_path, job): time the job was first seen by this process}
         self.last_status = {}
         self.lock = threading.Lock()
 
@@ -42,6 +92,14 @@ class HotfolderWatcher:
         self.running = True
         if self.debug:
             self._debug_print('global', "Starting dynamic hotfolder watcher...", debug_enabled=self.debug)
+        # --- Cluster mode: hotfolders are shared with other agent processes through leases ---
+        cluster_config = self.global_config.get("cluster")
+        if isinstance(cluster_config, dict) and cluster_config.get("cluster_enabled", False):
+            self.leases = self._open_leases(cluster_config)
+            if self.leases is None:
+                # Scanning without leases would deliver jobs twice alongside the other workers
+                self.running = False
+                return
         # --- Heartbeat: only support nested config ---
         heartbeat_enabled = False
         if "heartbeat" in self.global_config and isinstance(self.global_config["heartbeat"], dict):
@@ -51,20 +109,82 @@ class HotfolderWatcher:
         heartbeat_dir = project_root / "heartbeat"
         heartbeat_dir.mkdir(exist_ok=True)
         heartbeat_file = heartbeat_dir / "heartbeat.txt"
+        # --- Metrics endpoint: nested config like heartbeat ---
+        metrics_server = None
+        metrics_config = self.global_config.get("metrics")
+        if isinstance(metrics_config, dict) and metrics_config.get("metrics_enabled", False):
+            try:
+                metrics_server = MetricsServer(
+                    self.metrics,
+                    metrics_config.get("metrics_host", "127.0.0.1"),
+                    # Worker processes of one host serve on consecutive ports
+                    metrics_config.get("metrics_port", 9108) + (self.worker or 0),
+                ).start()
+                host, port = metrics_server.address[:2]
+                get_hotfolder_logger("global").info(f"Serving metrics on http://{host}:{port}/metrics")
+            except OSError as e:
+                get_hotfolder_logger("global").error(f"Failed to start metrics endpoint: {e}")
+        # Roots are only re-listed when an entry is added/removed, or after idle_rescan_interval
+        root_source = create_change_source(
+            [Path(root).resolve() for root in self.hotfolder_roots],
+            self.global_config.get("watch_backend", "auto"),
+            recursive=False,
+            logger=get_hotfolder_logger("global"),
+        )
+        idle_rescan_interval = self.global_config.get("idle_rescan_interval", 300)
+        # Hotfolder scans run on a bounded pool instead of one thread per hotfolder
+        self.scheduler = HotfolderScheduler(
+            self.global_config.get("scan_workers", 4),
+            debounce=WATCH_DEBOUNCE,
+            error_delay=self.global_config.get("scan_interval", 10),
+            logger=get_hotfolder_logger("global"),
+        )
+        try:
+            self.inotify_hub = InotifyHub()
+            self.scheduler.add_shared_source(self.inotify_hub)
+        except OSError:
+            self.inotify_hub = None  # Not Linux, or no inotify instance left: hotfolders poll
+        wait_timeout = self.global_config.get("scan_interval", 10)
+        if self.leases is not None:
+            wait_timeout = min(wait_timeout, self.leases.heartbeat_interval)
+        roots_changed = True
+        last_root_scan = 0
+        last_heartbeat = 0
         try:
             while self.running:
-                try:
-                    self.scan_and_update_hotfolders()
-                except Exception as e:
-                    logger = get_hotfolder_logger("global")
-                    logger.error(f"Unhandled error in scan loop: {e}")
+                if roots_changed or time.time() - last_root_scan >= idle_rescan_interval:
+                    last_root_scan = last_heartbeat = time.time()
+                    try:
+                        self.scan_and_update_hotfolders()
+                    except Exception as e:
+                        logger = get_hotfolder_logger("global")
+                        logger.error(f"Unhandled error in scan loop: {e}")
+                elif self.leases is not None and time.time() - last_heartbeat >= self.leases.heartbeat_interval:
+                    # Renew leases and pick up hotfolders released by other workers, without re-listing the roots
+                    last_heartbeat = time.time()
+                    try:
+                        self.update_hotfolders()
+                    except Exception as e:
+                        logger = get_hotfolder_logger("global")
+                        logger.error(f"Unhandled error in lease heartbeat: {e}")
                 # Write heartbeat if enabled
                 if heartbeat_enabled:
                     with open(heartbeat_file, "w") as f:
                         f.write(datetime.now().isoformat())
-                time.sleep(self.global_config.get("scan_interval", 10))
+                roots_changed = root_source.wait(wait_timeout)
         except KeyboardInterrupt:
             self.running = False
+        finally:
+            root_source.close()
+            self.scheduler.shutdown()
+            if self.inotify_hub is not None:
+                self.inotify_hub.close()
+            if self.leases is not None:
+                self.leases.close()
+            self.transfer_engine.shutdown()
+            self.cpu_pool.shutdown()
+            if metrics_server is not None:
+                metrics_server.shutdown()
             print("Shutting down watcher...")
 
     def scan_and_update_hotfolders(self):
@@ -83,26 +203,36 @@ class HotfolderWatcher:
                     hotfolder_pairs[str(subfolder)] = out_subfolder
                     # Ensure OUT folder exists immediately
                     out_subfolder.mkdir(parents=True, exist_ok=True)
-        # Start threads for new hotfolders
+        self.hotfolder_pairs = hotfolder_pairs
+        self.update_hotfolders()
+
+    def update_hotfolders(self):
+        # Start and stop scans to match the hotfolders found by the last root scan (and, in cluster mode, held leases)
+        hotfolder_pairs = self.hotfolder_pairs
+        current_hotfolders = set(hotfolder_pairs)
+        if self.leases is not None:
+            current_hotfolders = self.leases.heartbeat(current_hotfolders)
+        # Schedule new hotfolders
         with self.lock:
-            for folder in current_hotfolders:
-                if folder not in self.threads:
-                    if self.debug:
-                        self._debug_print(folder, "Starting watcher for new hotfolder.", debug_enabled=self.debug)
-                    out_subfolder = hotfolder_pairs[folder]
-                    t = threading.Thread(target=self.watch_hotfolder, args=(folder, out_subfolder), daemon=True)
-                    t.start()
-                    self.threads[folder] = t
-            # Remove threads for hotfolders that no longer exist
-            removed = [f for f in self.threads if f not in current_hotfolders]
-            for folder in removed:
-                if self.debug:
-                    self._debug_print(folder, "Hotfolder removed or no longer exists.", debug_enabled=self.debug)
-                del self.threads[folder]
+            new_hotfolders = [f for f in current_hotfolders if f not in self.hotfolders]
+            removed = [f for f in self.hotfolders if f not in current_hotfolders]
+        for folder in new_hotfolders:
+            if self.debug:
+                self._debug_print(folder, "Starting watcher for new hotfolder.", debug_enabled=self.debug)
+            try:
+                self.start_hotfolder(folder, hotfolder_pairs[folder])
+            except Exception as e:
+                logger = get_hotfolder_logger("global")
+                logger.error(f"Failed to start watching hotfolder {folder}: {e}")
+        # Cancel scans for hotfolders that no longer exist
+        for folder in removed:
+            if self.debug:
+                self._debug_print(folder, "Hotfolder removed or no longer exists.", debug_enabled=self.debug)
+            self.stop_hotfolder(folder)
         if self.debug:
-            self._debug_print('global', f"Currently watched hotfolders: {list(self.threads.keys())}", debug_enabled=self.debug)
+            self._debug_print('global', f"Currently watched hotfolders: {list(self.hotfolders.keys())}", debug_enabled=self.debug)
 
-    def watch_hotfolder(self, folder_path, out_subfolder):
+    def start_hotfolder(self, folder_path, out_subfolder):
         folder = Path(folder_path).resolve()
         config = get_effective_config(folder, self.global_config)
         # Determine debug mode for this hotfolder
@@ -113,66 +243,137 @@ class HotfolderWatcher:
             folder_name = folder.name if hasattr(folder, 'name') else str(folder)
             print(f"[DEBUG][hotfolder: {folder_name}] Effective config loaded (per-hotfolder):\n{yaml.safe_dump(dict(ordered_config), indent=2, sort_keys=False)}")
         out_subfolder.mkdir(parents=True, exist_ok=True)
-        while self.running:
-            try:
-                self.handle_hotfolder(folder, out_subfolder, hotfolder_debug)
-            except FileNotFoundError as e:
-                # Only suppress/log as debug if the missing path is the folder itself or a direct subfolder (job folder)
-                missing_path = Path(getattr(e, 'filename', ''))
-                if missing_path == folder or missing_path.parent == folder:
-                    if hotfolder_debug:
-                        self._debug_print(folder, f"[SKIP] Folder or job folder not found during scan (likely just moved): {e}", debug_enabled=hotfolder_debug)
-                    # Do not log as error
-                else:
-                    logger = get_hotfolder_logger(folder)
-                    logger.error(f"Unhandled error in hotfolder thread: {e}")
-                    if hotfolder_debug:
-                        self._debug_print(folder, f"[ERROR] Unhandled error in hotfolder thread: {e}", debug_enabled=hotfolder_debug)
-            except Exception as e:
+        # Files left in OUT/.staging by an interrupted delivery were never published
+        StagedDelivery(out_subfolder).clear()
+        source = create_change_source(folder, config.get("watch_backend", "auto"), logger=get_hotfolder_logger(folder), hub=self.inotify_hub)
+        if hotfolder_debug:
+            self._debug_print(folder, f"Using '{source.backend}' change detection backend.", debug_enabled=hotfolder_debug)
+
+        def on_remove():
+            source.close()
+            self._release_hotfolder(folder)
+            if self.leases is not None:
+                # Only once the last scan has finished may another worker take the hotfolder over
+                self.leases.release(folder_path)
+
+        with self.lock:
+            self.hotfolders[folder_path] = out_subfolder
+        self.scheduler.add(
+            folder_path,
+            lambda: self.scan_hotfolder(folder, out_subfolder, config, hotfolder_debug, source, folder_path),
+            source=source,
+            on_remove=on_remove,
+            priority=config.get("priority", 0),
+        )
+
+    def stop_hotfolder(self, folder_path):
+        # Future scans are cancelled; state DB and change source are released after any running scan
+        with self.lock:
+            self.hotfolders.pop(folder_path, None)
+        self.scheduler.remove(folder_path)
+
+    def scan_hotfolder(self, folder, out_subfolder, config, hotfolder_debug, source, key=None):
+        # One scheduled scan; returns (delay, wake_on_change) for the scheduler
+        if self.leases is not None and key is not None and not self.leases.holds(key):
+            # Lease not renewed in time: another worker may own this hotfolder by now
+            if hotfolder_debug:
+                self._debug_print(folder, "[LEASE] Lease expired, skipping scan until it is renewed.", debug_enabled=hotfolder_debug)
+            return config.get("scan_interval", 10), False
+        pending = None
+        started = time.monotonic()
+        state_db = self.state_dbs.get(str(folder))
+        commits = state_db.commits if state_db is not None else 0
+        # Phase timers always run; profile_scans adds a sampling or cProfile profile of the scan thread
+        scan_config = config  # The config the hotfolder was started with, until its config.yml is loaded
+        trace = ScanTrace(folder).start()
+        try:
+            # Loaded inside the try, so an invalid config.yml is logged, counted and traced like any failed scan
+            scan_config = get_effective_config(folder, self.global_config)
+            trace = ScanTrace(folder, scan_config.get("profile_scans", "none")).start()
+            pending = self.handle_hotfolder(folder, out_subfolder, hotfolder_debug, trace=trace)
+        except FileNotFoundError as e:
+            # Only suppress/log as debug if the missing path is the folder itself or a direct subfolder (job folder)
+            missing_path = Path(getattr(e, 'filename', ''))
+            if missing_path == folder or missing_path.parent == folder:
+                if hotfolder_debug:
+                    self._debug_print(folder, f"[SKIP] Folder or job folder not found during scan (likely just moved): {e}", debug_enabled=hotfolder_debug)
+                # Do not log as error
+            else:
+                trace.error = str(e)
+                self.metrics.inc("hotfolder_scan_errors_total", hotfolder=str(folder))
                 logger = get_hotfolder_logger(folder)
                 logger.error(f"Unhandled error in hotfolder thread: {e}")
                 if hotfolder_debug:
                     self._debug_print(folder, f"[ERROR] Unhandled error in hotfolder thread: {e}", debug_enabled=hotfolder_debug)
-            time.sleep(config.get("scan_interval", 10))
+        except Exception as e:
+            trace.error = str(e)
+            self.metrics.inc("hotfolder_scan_errors_total", hotfolder=str(folder))
+            logger = get_hotfolder_logger(folder)
+            logger.error(f"Unhandled error in hotfolder thread: {e}")
+            if hotfolder_debug:
+                self._debug_print(folder, f"[ERROR] Unhandled error in hotfolder thread: {e}", debug_enabled=hotfolder_debug)
+        trace.stop()
+        self._record_scan(folder, started, state_db, commits, trace)
+        self._dump_slow_scan(folder, trace, scan_config)
+        if key is not None and self.scheduler is not None:
+            # Pick up a priority changed in the hotfolder's config.yml
+            self.scheduler.set_priority(key, scan_config.get("priority", 0))
+        # pending: True/None when timer-driven work (resting, retention) remains, False when idle
+        if source.backend == "poll" or pending is not False:
+            return config.get("scan_interval", 10), False
+        # Idle hotfolder: rescan when something changes below it, with a periodic safety rescan
+        return config.get("idle_rescan_interval", 300), True
 
-    def handle_hotfolder(self, folder, out_folder, hotfolder_debug=None):
+    def handle_hotfolder(self, folder, out_folder, hotfolder_debug=None, trace=None):
         # Determine debug mode for this hotfolder
+        config = get_effective_config(folder, self.global_config)
         if hotfolder_debug is None:
-            config = get_effective_config(folder, self.global_config)
             hotfolder_debug = config.get("debug", self.debug)
-        else:
-            config = get_effective_config(folder, self.global_config)
         debug_enabled = hotfolder_debug
+        self.debug_levels[str(folder)] = debug_enabled
 
         # Remove old state files if present
         if not folder.exists():
+            self._release_hotfolder(folder)
             if debug_enabled:
                 self._debug_print(folder, f"[SKIP] Folder {folder} no longer exists, skipping.", debug_enabled=debug_enabled)
             return
 
-        # Use SQLite state DB
-        state_db = HotfolderStateDB(folder)
+        if trace is None:
+            trace = ScanTrace(folder)  # Not started: phase timers are no-ops
+
+        # Use the long-lived SQLite state DB for this hotfolder
+        state_db = self._get_state_db(folder, config)
+        # Finish transfers cut short by a crash or restart before looking at the hotfolder
+        trace.mark("resume")
+        self._resume_transfers(folder, out_folder, state_db, config, debug_enabled, trace)
         
-        # Get current files and folders
-        current_items = {str(f.relative_to(folder)) for f in folder.iterdir() if not f.name.startswith('.')}
+        # Walk the hotfolder once; every phase below reads from this snapshot instead of rglob/stat
+        trace.mark("snapshot")
+        snapshot = DirectorySnapshot(folder, previous=self.snapshots.get(str(folder)))
+        self.snapshots[str(folder)] = snapshot
+        self.metrics.observe("hotfolder_scan_stat_calls", snapshot.stat_calls, hotfolder=str(folder))
+        trace.count("stat_calls", snapshot.stat_calls)
         
         # Get DB states
+        trace.mark("cleanup")
         seen = state_db.get_seen()
         processed = state_db.get_processed()
+        now = time.time()
+        cleanup_time = config.get("cleanup_time", 1440)
         
         # Clean up seen state for any removed items
         removed_seen_items = []
         for seen_path in list(seen.keys()):
             # Skip if item still exists in filesystem
-            if (folder / seen_path).exists():
+            if snapshot.exists(seen_path):
                 continue
                 
             # Special case: if parent folder is missing, clean up regardless of retention
             parent_path = str(Path(seen_path).parent)
-            if parent_path != '.' and not (folder / parent_path).exists():
+            if parent_path != '.' and not snapshot.exists(parent_path):
                 if debug_enabled:
                     self._debug_print(folder, f"[CLEANUP] Removing seen state for {seen_path} - parent folder {parent_path} was deleted", debug_enabled=debug_enabled)
-                state_db.remove_seen(seen_path)
                 removed_seen_items.append(seen_path)
                 continue
                 
@@ -184,7 +385,6 @@ class HotfolderWatcher:
                         self._debug_print(folder, f"[CLEANUP] Skipping seen state cleanup for {seen_path} - still under retention (processed {((now - processed_time) / 60):.1f} min ago)", debug_enabled=debug_enabled)
                     continue
             # Item was removed from filesystem and not under retention - clean up its state
-            state_db.remove_seen(seen_path)
             removed_seen_items.append(seen_path)
         
         # Log removed items in groups if any were removed
@@ -209,15 +409,14 @@ class HotfolderWatcher:
         removed_processed_items = []
         for processed_path in list(processed.keys()):
             # Skip if item still exists in filesystem
-            if (folder / processed_path).exists():
+            if snapshot.exists(processed_path):
                 continue
                 
             # Special case: if parent folder is missing, clean up regardless of retention
             parent_path = str(Path(processed_path).parent)
-            if parent_path != '.' and not (folder / parent_path).exists():
+            if parent_path != '.' and not snapshot.exists(parent_path):
                 if debug_enabled:
                     self._debug_print(folder, f"[CLEANUP] Removing processed state for {processed_path} - parent folder {parent_path} was deleted", debug_enabled=debug_enabled)
-                state_db.remove_processed(processed_path)
                 removed_processed_items.append(processed_path)
                 continue
                 
@@ -228,8 +427,15 @@ class HotfolderWatcher:
                     self._debug_print(folder, f"[CLEANUP] Skipping processed state cleanup for {processed_path} - still under retention (processed {((now - processed_time) / 60):.1f} min ago)", debug_enabled=debug_enabled)
                 continue
             # Item was removed from filesystem and past retention - clean up its state
-            state_db.remove_processed(processed_path)
             removed_processed_items.append(processed_path)
+
+        # Apply both cleanups in a single transaction
+        trace.count("seen_removed", len(removed_seen_items))
+        trace.count("processed_removed", len(removed_processed_items))
+        with state_db.transaction():
+            state_db.remove_seen_many(removed_seen_items)
+            state_db.remove_processed_many(removed_processed_items)
+            state_db.remove_hashes_many(set(removed_seen_items) | set(removed_processed_items))
         
         # Log removed processed items in groups if any were removed
         if removed_processed_items and debug_enabled:
@@ -250,6 +456,7 @@ class HotfolderWatcher:
                         self._debug_print(folder, f"[CLEANUP] Removed processed state for {parent}/{item} (removed from filesystem)", debug_enabled=debug_enabled)
 
         # Deferred deletion: clean up any job folders marked for deletion
+        trace.mark("deferred_deletion")
         ready_for_deletion = state_db.get_ready_for_deletion_jobs()
         for job_name in ready_for_deletion:
             job_folder = folder / job_name
@@ -257,10 +464,8 @@ class HotfolderWatcher:
                 try:
                     job_folder.rmdir()
                     # Clean up state for this job folder and all its files
-                    state_db.remove_seen_prefix(job_name)
-                    state_db.remove_processed_prefix(job_name)
-                    config = get_effective_config(folder, self.global_config)
-                    debug_enabled = config.get("debug", self.debug)
+                    state_db.delete_job(job_name)
+                    trace.count("jobs_deleted")
                     logger = get_hotfolder_logger(folder, retention_days=config.get("log_retention", 7))
                     if debug_enabled:
                         self._debug_print(folder, f"[CLEANUP] Deleted marked job folder: {job_folder}", debug_enabled=debug_enabled)
@@ -270,143 +475,207 @@ class HotfolderWatcher:
                         self._debug_print(folder, f"[CLEANUP] Failed to delete marked job folder {job_folder}: {e}", debug_enabled=debug_enabled)
 
         # Never execute or import code from the hotfolder
+        trace.mark("resting")
         for f in folder.iterdir():
             if f.suffix in {'.py', '.pyc', '.pyo', '.sh', '.bash', '.zsh', '.pl', '.rb', '.php', '.js', '.exe', '.dll', '.so', '.dylib'}:
                 continue  # Just skip, never execute or import
         logger = get_hotfolder_logger(folder, retention_days=config.get("log_retention", 7))
         resting_time = config.get("resting_time", 300)
         dissolve_folders = config.get("dissolve_folders", False)
+        dissolve_collision = config.get("dissolve_collision", "suffix")
+        dissolve_ignore_case = config.get("dissolve_ignore_case", False)
         metadata = config.get("metadata", False)
         metadata_field = config.get("metadata_field", "headline")
         cleanup_enabled = config.get("cleanup", True)
         keep_copy = self.validate_bool(config.get("keep_copy", False), "keep_copy", False)
-        cleanup_time = config.get("cleanup_time", 1440)
         ignore_updates = self.validate_bool(config.get("ignore_updates", False), "ignore_updates", False)
         update_mtime = config.get("update_mtime", True)
         ds_store = config.get("ds_store", True)
         thumbs_db = config.get("thumbs_db", True)
         inject_folder_name = config.get("inject_folder_name", False)
+        # Optional content hashing: a touched but unchanged file neither resets resting nor is copied again
+        change_detection = config.get("change_detection", "mtime")
+        hasher = None
+        if change_detection != "mtime":
+            hasher = ContentHasher(folder, state_db, change_detection, config.get("hash_sample_size", HASH_SAMPLE_SIZE), self.cpu_pool, str(folder))
+        # keep_copy delta sync: only changed blocks of files already in OUT are rewritten
+        delta_sync = keep_copy and config.get("delta_sync", False)
+        delta_block_size = config.get("delta_block_size", DELTA_BLOCK_SIZE)
+        # Staged delivery: files only appear in OUT once complete and fsync'd
+        staging = None
+        if config.get("staged_delivery", False):
+            staging = StagedDelivery(out_folder, config.get("staging_fsync_batch", FSYNC_BATCH))
+        # Bytes this hotfolder may have queued on the shared transfer pool, so one huge job cannot fill it
+        budget = self._get_byte_budget(folder, config)
+        throttle = self._get_throttle(folder, config)
         now = time.time()
-        # Use DB for state
-        processed = state_db.get_processed()
-        seen = state_db.get_seen()
-        files = [f for f in folder.iterdir() if not f.name.startswith('.')]
+        names = snapshot.top_level
+        if config.get("small_jobs_first", False):
+            # Small-jobs lane: jobs up to small_job_size go before larger ones, each lane in directory order
+            small_job_size = config.get("small_job_size", 104857600)
+            names = sorted(names, key=lambda name: snapshot.job_size(name) > small_job_size)
+        files = [folder / name for name in names]
+        trace.count("jobs_scanned", len(files))
         changed = False
+        pending = False  # True while any item still waits on a timer (resting or retention)
+        resting = 0  # Items still waiting for resting_time
         for idx, f in enumerate(files):
-            if not f.exists():
-                continue
-            rel = str(f.relative_to(folder))
-            f_path = folder / rel
-            # 1. Add to seen if new
-            if rel not in seen:
-                mtime = f_path.stat().st_mtime
-                state_db.set_seen(rel, now, mtime)
-                changed = True
-                if debug_enabled:
-                    self._debug_print(folder, f"[DB] Added to seen: {rel}", debug_enabled=debug_enabled)
-                if idx > 0:
-                    logger.info("")
-                self.log_action(logger, folder, "ARRIVED", f"New file/folder: {rel}")
-                if f_path.is_dir():
-                    for subfile in f_path.rglob('*'):
-                        if subfile.is_file():
-                            subrel = str(subfile.relative_to(folder))
-                            submtime = subfile.stat().st_mtime
-                            state_db.set_seen(subrel, now, submtime)
+            # One transaction per top-level item: a job with thousands of files costs a single commit.
+            # Metadata injection and transfers run outside it, so the DB is not locked while a job is delivered
+            with state_db.transaction():
+                if not f.exists():
+                    continue
+                rel = str(f.relative_to(folder))
+                f_path = folder / rel
+                # Only this job's state is loaded (indexed by job), not the whole history of the hotfolder
+                seen = state_db.get_seen_for_job(rel)
+                processed = state_db.get_processed_for_job(rel)
+                # 1. Add to seen if new
+                if rel not in seen:
+                    mtime = snapshot.stat(rel).mtime
+                    if snapshot.is_file(rel):
+                        state_db.set_seen_many(self._new_seen_rows(hasher, [(rel, rel, snapshot.stat(rel))], now, logger))
+                    else:
+                        state_db.set_seen(rel, now, mtime)
+                    changed = True
+                    if debug_enabled:
+                        self._debug_print(folder, f"[DB] Added to seen: {rel}", debug_enabled=debug_enabled)
+                    if idx > 0:
+                        logger.info("")
+                    self.log_action(logger, folder, "ARRIVED", f"New file/folder: {rel}")
+                    self.arrivals[(str(folder), rel)] = now
+                    if snapshot.is_dir(rel):
+                        new_seen = []
+                        for subrel, sub_stat in snapshot.job_files(rel).items():
+                            new_seen.append((subrel, subrel, sub_stat))
                             if debug_enabled:
                                 self._debug_print(folder, f"[DB] Added to seen: {subrel}", debug_enabled=debug_enabled)
                             logger.info(f"    [CONTAINS] {subrel}")
-            # --- Resting time fix: reset seen_time if any file changes ---
-            if f_path.is_dir():
-                # Recursively check all files and subfolders
-                last_seen = seen[rel]['seen_time'] if rel in seen else now
-                latest_mtime = last_seen
-                file_set = set()
-                file_mtimes = {}
-                for subfile in f_path.rglob('*'):
-                    if subfile.is_file():
-                        subrel = unicodedata.normalize('NFC', str(subfile.relative_to(folder)))
+                        state_db.set_seen_many(self._new_seen_rows(hasher, new_seen, now, logger))
+                # --- Resting time fix: reset seen_time if any file changes ---
+                if snapshot.is_dir(rel):
+                    # Recursively check all files and subfolders
+                    last_seen = seen[rel]['seen_time'] if rel in seen else now
+                    latest_mtime = last_seen
+                    file_set = set()
+                    file_mtimes = {}
+                    file_stats = {}  # {normalized subrel: (snapshot subrel, FileStat)}
+                    new_seen = []
+                    for subrel, sub_stat in snapshot.job_files(rel).items():
+                        file_stats[unicodedata.normalize('NFC', subrel)] = (subrel, sub_stat)
+                        subrel = unicodedata.normalize('NFC', subrel)
                         file_set.add(subrel)
-                        mtime = subfile.stat().st_mtime
+                        mtime = sub_stat.mtime
                         file_mtimes[subrel] = mtime
                         # Add new files to seen
                         if subrel not in seen:
-                            state_db.set_seen(subrel, now, mtime)
-                            changed = True
-                # Normalize seen files for this job
-                seen_files_for_job = {unicodedata.normalize('NFC', k) for k in seen if k.startswith(rel + '/')}
-                # Extra debug: log normalized file sets
-                if debug_enabled:
-                    self._debug_print(folder, f"[DEBUG] repr(file_set): {repr(sorted(file_set))}", debug_enabled=debug_enabled)
-                    self._debug_print(folder, f"[DEBUG] repr(seen_files_for_job): {repr(sorted(seen_files_for_job))}", debug_enabled=debug_enabled)
-                # Compare file_set to seen files for this job
-                files_added = file_set - seen_files_for_job
-                files_removed = seen_files_for_job - file_set
-                mtimes_changed = set()
-                for fname in file_set & seen_files_for_job:
-                    current_mtime = file_mtimes.get(fname)
-                    seen_mtime = seen.get(fname, {}).get('mtime')
-                    if seen_mtime is not None and current_mtime != seen_mtime:
-                        mtimes_changed.add(fname)
-                # Remove deleted files from seen (only for this job)
-                deleted_from_seen = {k for k in seen if k.startswith(rel + '/') and k not in file_set}
-                for subrel in deleted_from_seen:
-                    state_db.remove_seen(subrel)
-                    changed = True
-                    if debug_enabled:
-                        self._debug_print(folder, f"[DB] Removed from seen: {subrel}", debug_enabled=debug_enabled)
-                # Reset seen_time if any file added, removed, or mtime changed
-                if files_added or files_removed or mtimes_changed or deleted_from_seen:
-                    state_db.set_seen(rel, now, f_path.stat().st_mtime)
-                    changed = True
-                    if debug_enabled:
-                        file_set_str = ', '.join(sorted(file_set))
-                        self._debug_print(folder, f"[RESTING] File set for {rel}: [{file_set_str}]", debug_enabled=debug_enabled)
-                        if file_set:
-                            mtimes_str = '; '.join([
-                                f"{fname}:cur={file_mtimes.get(fname)},seen={seen.get(fname, {}).get('mtime')}"
-                                for fname in sorted(file_set)
-                            ])
-                            self._debug_print(folder, f"[RESTING] File mtimes for {rel}: {mtimes_str}", debug_enabled=debug_enabled)
-                        debug_msg = f"[RESTING] Reset seen_time for {rel} due to file change (mtime or file set)"
-                        if files_added:
-                            debug_msg += f" | Added: {sorted(files_added)}"
-                        if files_removed:
-                            debug_msg += f" | Removed: {sorted(files_removed)}"
-                        if mtimes_changed:
-                            debug_msg += f" | Modified: {sorted(mtimes_changed)}"
-                        if deleted_from_seen:
-                            debug_msg += f" | Deleted from seen: {sorted(deleted_from_seen)}"
-                        self._debug_print(folder, debug_msg, debug_enabled=debug_enabled)
-                # After moving/copying all files with dissolve_folders, if the job folder is deleted, return immediately
-                if not f_path.exists():
-                    config = get_effective_config(folder, self.global_config)
-                    debug_enabled = config.get("debug", self.debug)
+                            new_seen.append((subrel, file_stats[subrel][0], sub_stat))
+                    if new_seen:
+                        state_db.set_seen_many(self._new_seen_rows(hasher, new_seen, now, logger))
+                        changed = True
+                    # Normalize seen files for this job
+                    seen_files_for_job = {unicodedata.normalize('NFC', k) for k in seen if k != rel}
+                    # Extra debug: log normalized file sets
+                    self._debug_print(folder, lambda: f"[DEBUG] repr(file_set): {repr(sorted(file_set))}", debug_enabled=debug_enabled)
+                    self._debug_print(folder, lambda: f"[DEBUG] repr(seen_files_for_job): {repr(sorted(seen_files_for_job))}", debug_enabled=debug_enabled)
+                    # Compare file_set to seen files for this job
+                    files_added = file_set - seen_files_for_job
+                    files_removed = seen_files_for_job - file_set
+                    mtimes_changed = set()
+                    if hasher is not None:
+                        # Hash every file whose mtime changed on the CPU pool at once, not one by one below
+                        self._prefetch_hashes(hasher, [
+                            file_stats[fname] for fname in file_set & seen_files_for_job
+                            if seen.get(fname, {}).get('mtime') not in (None, file_mtimes.get(fname))], logger)
+                    touched = []  # mtime changed but content did not (content hashing only)
+                    updated_seen = []
+                    for fname in file_set & seen_files_for_job:
+                        current_mtime = file_mtimes.get(fname)
+                        seen_entry = seen.get(fname, {})
+                        seen_mtime = seen_entry.get('mtime')
+                        if seen_mtime is not None and current_mtime != seen_mtime:
+                            digest = None
+                            if hasher is not None:
+                                unchanged, digest = hasher.unchanged(file_stats[fname][0], file_stats[fname][1], seen_entry)
+                                if unchanged:
+                                    touched.append((fname, seen_entry['seen_time'], current_mtime, digest))
+                                    continue
+                            mtimes_changed.add(fname)
+                            updated_seen.append((fname, now, current_mtime, digest))
+                    # Record the new mtimes, so a file that changed once does not keep resetting the job
+                    if touched or updated_seen:
+                        state_db.set_seen_many(touched + updated_seen)
+                    if touched and debug_enabled:
+                        self._debug_print(folder, f"[RESTING] Content unchanged for touched files in {rel}: {sorted(t[0] for t in touched)}", debug_enabled=debug_enabled)
+                    # Remove deleted files from seen (only for this job)
+                    deleted_from_seen = {k for k in seen if k != rel and k not in file_set}
+                    if deleted_from_seen:
+                        state_db.remove_seen_many(deleted_from_seen)
+                        state_db.remove_hashes_many(deleted_from_seen)
+                        changed = True
                     if debug_enabled:
-                        self._debug_print(folder, f"[SKIP] Job folder {f_path} was deleted during processing, skipping further processing this scan.", debug_enabled=debug_enabled)
-                    return
-            elif f_path.is_file():
-                mtime = f_path.stat().st_mtime
-                if rel in seen:
-                    prev_mtime = seen[rel]['mtime']
-                    if mtime != prev_mtime:
-                        if debug_enabled:
-                            self._debug_print(folder, f"[RESTING] mtime changed for {rel}: old={prev_mtime}, new={mtime}", debug_enabled=debug_enabled)
-                        state_db.set_seen(rel, now, mtime)
+                        for subrel in deleted_from_seen:
+                            self._debug_print(folder, f"[DB] Removed from seen: {subrel}", debug_enabled=debug_enabled)
+                    # Reset seen_time if any file added, removed, or mtime changed
+                    if files_added or files_removed or mtimes_changed or deleted_from_seen:
+                        state_db.set_seen(rel, now, snapshot.stat(rel).mtime)
                         changed = True
-                        self._debug_print(folder, f"[RESTING] Reset seen_time for {rel} due to mtime change", debug_enabled=debug_enabled)
-            # 2. Check if stable
-            seen_time = seen[rel]['seen_time'] if rel in seen else now
-            stable = (now - seen_time) >= resting_time
+                        if debug_enabled:
+                            file_set_str = ', '.join(sorted(file_set))
+                            self._debug_print(folder, f"[RESTING] File set for {rel}: [{file_set_str}]", debug_enabled=debug_enabled)
+                            if file_set:
+                                mtimes_str = '; '.join([
+                                    f"{fname}:cur={file_mtimes.get(fname)},seen={seen.get(fname, {}).get('mtime')}"
+                                    for fname in sorted(file_set)
+                                ])
+                                self._debug_print(folder, f"[RESTING] File mtimes for {rel}: {mtimes_str}", debug_enabled=debug_enabled)
+                            debug_msg = f"[RESTING] Reset seen_time for {rel} due to file change (mtime or file set)"
+                            if files_added:
+                                debug_msg += f" | Added: {sorted(files_added)}"
+                            if files_removed:
+                                debug_msg += f" | Removed: {sorted(files_removed)}"
+                            if mtimes_changed:
+                                debug_msg += f" | Modified: {sorted(mtimes_changed)}"
+                            if deleted_from_seen:
+                                debug_msg += f" | Deleted from seen: {sorted(deleted_from_seen)}"
+                            self._debug_print(folder, debug_msg, debug_enabled=debug_enabled)
+                    # After moving/copying all files with dissolve_folders, if the job folder is deleted, return immediately
+                    if not f_path.exists():
+                        if debug_enabled:
+                            self._debug_print(folder, f"[SKIP] Job folder {f_path} was deleted during processing, skipping further processing this scan.", debug_enabled=debug_enabled)
+                        return
+                elif snapshot.is_file(rel):
+                    mtime = snapshot.stat(rel).mtime
+                    if rel in seen:
+                        prev_mtime = seen[rel]['mtime']
+                        digest = None
+                        if mtime != prev_mtime and hasher is not None:
+                            unchanged, digest = hasher.unchanged(rel, snapshot.stat(rel), seen[rel])
+                            if unchanged:
+                                state_db.set_seen(rel, seen[rel]['seen_time'], mtime, digest)
+                                prev_mtime = mtime
+                                if debug_enabled:
+                                    self._debug_print(folder, f"[RESTING] Content of {rel} unchanged after mtime change, not resetting seen_time", debug_enabled=debug_enabled)
+                        if mtime != prev_mtime:
+                            if debug_enabled:
+                                self._debug_print(folder, f"[RESTING] mtime changed for {rel}: old={prev_mtime}, new={mtime}", debug_enabled=debug_enabled)
+                            state_db.set_seen(rel, now, mtime, digest)
+                            changed = True
+                            if debug_enabled:
+                                self._debug_print(folder, f"[RESTING] Reset seen_time for {rel} due to mtime change", debug_enabled=debug_enabled)
+                # 2. Check if stable
+                seen_time = seen[rel]['seen_time'] if rel in seen else now
+                stable = (now - seen_time) >= resting_time
+                if not stable:
+                    pending = True
+                    resting += 1
 
-            if stable:
-                f_path = folder / rel
-                if f_path.is_dir():
-                    # Check if ALL files in the folder have rested
-                    all_files_rested = True
-                    for subfile in f_path.rglob('*'):
-                        if subfile.is_file():
-                            subrel = str(subfile.relative_to(folder))
+                if stable:
+                    f_path = folder / rel
+                    if snapshot.is_dir(rel):
+                        # Check if ALL files in the folder have rested
+                        all_files_rested = True
+                        for subrel in snapshot.job_files(rel):
                             if subrel in seen:
                                 sub_seen_time = seen[subrel]['seen_time']
                                 if (now - sub_seen_time) < resting_time:
@@ -420,62 +689,120 @@ class HotfolderWatcher:
                                     self._debug_print(folder, f"[RESTING] File {subrel} not yet seen", debug_enabled=debug_enabled)
                                 break
                     
-                    if not all_files_rested:
-                        if debug_enabled:
-                            self._debug_print(folder, f"[RESTING] Not all files in {rel} have rested long enough", debug_enabled=debug_enabled)
-                        continue
+                        if not all_files_rested:
+                            pending = True
+                            resting += 1
+                            if debug_enabled:
+                                self._debug_print(folder, f"[RESTING] Not all files in {rel} have rested long enough", debug_enabled=debug_enabled)
+                            continue
+
+                    # After resting, before copy/move/dissolve, inject metadata if enabled
+                    if inject_folder_name and metadata_field:
+                        with trace.phase("metadata"), state_db.outside_transaction():
+                            if snapshot.is_dir(rel):
+                                written = self._inject_metadata(state_db, snapshot, rel, list(snapshot.job_files(rel)), metadata_field, f_path.name, seen, logger, debug_enabled)
+                            elif snapshot.is_file(rel):
+                                written = self._inject_metadata(state_db, snapshot, rel, [rel], metadata_field, folder.name, seen, logger, debug_enabled)
+                            else:
+                                written = 0
+                        trace.count("metadata_written", written)
 
-                    if keep_copy:
+                    if keep_copy and snapshot.is_dir(rel):
                         # Recursively process files in the job folder
-                        job_files = [sf for sf in f_path.rglob('*') if sf.is_file()]
-                        processed_entry = {k: v for k, v in processed.items() if k.startswith(rel + '/')}
-                        processed_files = processed_entry
+                        job_files = snapshot.job_files(rel)
+                        processed_files = {k: v for k, v in processed.items() if k != rel}
                         to_process = []
+                        unchanged_files = []
                         current_files = set()
-                        for sf in job_files:
-                            srel = str(sf.relative_to(folder))
-                            smtime = sf.stat().st_mtime
+                        if hasher is not None:
+                            self._prefetch_hashes(hasher, [
+                                (srel, s_stat) for srel, s_stat in job_files.items()
+                                if processed_files.get(srel, {}).get('mtime') != s_stat.mtime], logger)
+                        for srel, s_stat in job_files.items():
+                            sf = folder / srel
+                            smtime = s_stat.mtime
                             current_files.add(srel)
                             pf = processed_files.get(srel, {})
                             if pf.get('mtime') != smtime:
-                                to_process.append((sf, srel, smtime))
+                                digest = None
+                                if hasher is not None:
+                                    unchanged, digest = hasher.unchanged(srel, s_stat, pf)
+                                    if unchanged:
+                                        # Touched only: keep processed_time (retention) and just record the new mtime
+                                        unchanged_files.append((srel, pf['processed_time'], smtime, False, digest))
+                                        continue
+                                to_process.append((sf, srel, smtime, digest))
+                        if unchanged_files:
+                            state_db.set_processed_many(unchanged_files)
+                            if debug_enabled:
+                                self._debug_print(folder, f"[PER-FILE] Skipped {len(unchanged_files)} touched but unchanged files in {rel}", debug_enabled=debug_enabled)
                         if to_process:
-                            moved_count = 0
-                            for sf, srel, smtime in to_process:
-                                out_path = out_folder / srel
-                                out_path.parent.mkdir(parents=True, exist_ok=True)
-                                shutil.copy2(str(sf), str(out_path))
-                                moved_count += 1
-                                if debug_enabled:
+                            # A job that is not in OUT yet is staged as a whole and appears in one rename
+                            job_root = staging.job_root(out_folder / rel) if staging is not None else out_folder / rel
+                            file_staging = staging if job_root == out_folder / rel else None
+                            journal = TransferJournal(state_db, folder, rel)
+                            # Files of a job built in the staging directory only arrive with finish_job()
+                            on_done = journal.done if job_root == out_folder / rel else None
+                            with trace.phase("transfer"), state_db.outside_transaction():
+                                journal.begin(((srel, out_folder / srel) for _, srel, _, _ in to_process), "copy")
+                                try:
+                                    if delta_sync:
+                                        stats = self._deliver_delta(state_db, rel, [(sf, srel) for sf, srel, _, _ in to_process], out_folder, delta_block_size, logger, file_staging, job_root, on_done, budget, throttle)
+                                    else:
+                                        stats = self.transfer_engine.run(
+                                            [(sf, job_root / Path(srel).relative_to(rel)) for sf, srel, _, _ in to_process], keep_copy=True, logger=logger, staging=file_staging,
+                                            on_done=on_done, budget=budget, throttle=throttle)
+                                except BaseException:
+                                    if job_root != out_folder / rel:
+                                        staging.discard(job_root)
+                                    raise
+                                if job_root != out_folder / rel:
+                                    staging.finish_job(job_root, out_folder / rel)
+                            moved_count = stats.files
+                            if debug_enabled:
+                                for _, srel, _, _ in to_process:
                                     self._debug_print(folder, f"[PER-FILE] Copied {srel} to OUT (resting_time={resting_time}, stable={stable}).", debug_enabled=debug_enabled)
-                            # Update processed entry
-                            for _, srel, smtime in to_process:
-                                # Ensure processed_time is set
-                                state_db.set_processed(srel, now, smtime)
-                                if debug_enabled:
+                            # Update processed entries (processed_time is always set)
+                            state_db.set_processed_many((srel, now, smtime, False, digest) for _, srel, smtime, digest in to_process)
+                            journal.finish()
+                            if debug_enabled:
+                                for _, srel, _, _ in to_process:
                                     self._debug_print(folder, f"[DB] Added to processed: {srel}", debug_enabled=debug_enabled)
                             changed = True
-                            self.log_action(logger, folder, "PROCESSED", f"Processed {rel}, moved_count={moved_count}")
+                            self.log_action(logger, folder, "PROCESSED", f"Processed {rel}, moved_count={moved_count} ({stats})")
+                            self._record_processed(folder, rel, stats, seen_time, trace)
                             if debug_enabled:
-                                self._debug_print(folder, f"[PROCESSED] Processed {rel}, moved_count={moved_count}", debug_enabled=debug_enabled)
+                                self._debug_print(folder, f"[PROCESSED] Processed {rel}, moved_count={moved_count} ({stats})", debug_enabled=debug_enabled)
                         # Handle deletions: remove entries for files no longer present
                         removed_files = set(processed_files.keys()) - current_files
+                        state_db.remove_processed_many(removed_files)
+                        state_db.remove_block_signatures_many(removed_files)
                         for srel in removed_files:
-                            state_db.remove_processed(srel)
                             changed = True
                             self.log_action(logger, folder, "REMOVED", f"File removed from IN: {srel}")
                             if debug_enabled:
                                 self._debug_print(folder, f"[DB] Removed from processed: {srel}", debug_enabled=debug_enabled)
-                    elif keep_copy and f_path.is_file():
-                        smtime = f_path.stat().st_mtime
+                    elif keep_copy and snapshot.is_file(rel):
+                        smtime = snapshot.stat(rel).mtime
                         pf = processed.get(rel, {})
-                        if pf.get('mtime') != smtime:
-                            out_path = out_folder / rel
-                            out_path.parent.mkdir(parents=True, exist_ok=True)
-                            shutil.copy2(str(f_path), str(out_path))
-                            state_db.set_processed(rel, now, smtime)
+                        unchanged, digest = False, None
+                        if pf.get('mtime') != smtime and hasher is not None:
+                            unchanged, digest = hasher.unchanged(rel, snapshot.stat(rel), pf)
+                            if unchanged:
+                                state_db.set_processed(rel, pf['processed_time'], smtime, False, digest)
+                        if pf.get('mtime') != smtime and not unchanged:
+                            journal = TransferJournal(state_db, folder, rel)
+                            with trace.phase("transfer"), state_db.outside_transaction():
+                                journal.begin([(rel, out_folder / rel)], "copy")
+                                if delta_sync:
+                                    stats = self._deliver_delta(state_db, rel, [(f_path, rel)], out_folder, delta_block_size, logger, staging, on_done=journal.done, budget=budget, throttle=throttle)
+                                else:
+                                    stats = self.transfer_engine.run([(f_path, out_folder / rel)], keep_copy=True, logger=logger, staging=staging, on_done=journal.done, budget=budget, throttle=throttle)
+                            state_db.set_processed(rel, now, smtime, False, digest)
+                            journal.finish()
                             changed = True
                             self.log_action(logger, folder, "PROCESSED", f"Processed {rel}, moved_count=1")
+                            self._record_processed(folder, rel, stats, seen_time, trace)
                             if debug_enabled:
                                 self._debug_print(folder, f"[PROCESSED] Processed {rel}, moved_count=1", debug_enabled=debug_enabled)
                     elif not keep_copy:
@@ -483,81 +810,79 @@ class HotfolderWatcher:
                         if rel not in processed:
                             if debug_enabled:
                                 self._debug_print(folder, f"[PROCESSING] {rel} is stable, moving now.", debug_enabled=debug_enabled)
-                            moved_count, marked_for_deletion = move_hotfolder_contents(
-                                folder, out_folder, dissolve_folders, metadata, metadata_field, logger, keep_copy, ignore_updates, update_mtime, ds_store, thumbs_db)
-                            state_db.set_processed(rel, now, f_path.stat().st_mtime)
+                            journal = TransferJournal(state_db, folder, rel)
+                            stats = TransferStats()
+                            with trace.phase("transfer"), state_db.outside_transaction():
+                                # Dissolved jobs are planned once: the journal and the move use the same names
+                                dissolve_plan = None
+                                if dissolve_folders and snapshot.is_dir(rel):
+                                    dissolve_plan = self._plan_dissolve(snapshot, rel, out_folder, ds_store, thumbs_db, dissolve_collision, dissolve_ignore_case)
+                                journal.begin(self._planned_moves(snapshot, rel, out_folder, dissolve_folders, ds_store, thumbs_db, dissolve_plan), "move")
+                                moved_count, marked_for_deletion = move_hotfolder_contents(
+                                    folder, out_folder, dissolve_folders, metadata, metadata_field, logger, keep_copy, ignore_updates, update_mtime, ds_store, thumbs_db,
+                                    items=[rel], transfer_engine=self.transfer_engine, staging=staging, on_done=journal.done, budget=budget, throttle=throttle, stats=stats,
+                                    dissolve_plans={rel: dissolve_plan} if dissolve_plan is not None else None)
+                            state_db.set_processed(rel, now, snapshot.stat(rel).mtime)
+                            journal.finish()
                             # Mark for deferred deletion if needed
                             if dissolve_folders and rel in marked_for_deletion:
                                 state_db.mark_ready_for_deletion(rel)
                             changed = True
                             self.log_action(logger, folder, "PROCESSED", f"Processed {rel}, moved_count={moved_count}")
+                            self._record_processed(folder, rel, stats, seen_time, trace)
                             if debug_enabled:
                                 self._debug_print(folder, f"[PROCESSED] Processed {rel}, moved_count={moved_count}", debug_enabled=debug_enabled)
                             # After moving, check if folder still exists
                             if not f_path.exists():
                                 if debug_enabled:
-                                    self._debug_print(folder, f"[INFO] Folder {f_path} was moved and no longer exists. Exiting processing loop.", debug_enabled=debug_enabled)
-                                return
-            # 4. Log status
-            processed_time = processed.get(rel, {}).get("processed_time")
-            age = (now - processed_time) if processed_time else None
-            if debug_enabled:
-                if f_path.is_dir():
-                    # For debug output only: check processed times of files
-                    processed_files = {k: v for k, v in processed.items() if k.startswith(rel + '/')}
-                    if processed_files:
-                        latest_processed = max(v.get('processed_time', 0) for v in processed_files.values())
-                        self._debug_print(folder, f"Folder: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: {latest_processed}, age: {(now - latest_processed) if latest_processed else 'N/A'} (from processed files)", debug_enabled=debug_enabled)
-                    else:
-                        # Check if the folder itself is processed
-                        folder_processed = processed.get(rel, {}).get("processed_time")
-                        if folder_processed:
-                            self._debug_print(folder, f"Folder: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: {folder_processed}, age: {(now - folder_processed) if folder_processed else 'N/A'} (folder processed)", debug_enabled=debug_enabled)
-                        else:
-                            self._debug_print(folder, f"Folder: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: None, age: N/A (no processed files or folder)", debug_enabled=debug_enabled)
-                else:
-                    self._debug_print(folder, f"File: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: {processed_time}, age: {age if age is not None else 'N/A'}", debug_enabled=debug_enabled)
-            # After each file/folder, check if the parent folder still exists
-            if not folder.exists():
-                config = get_effective_config(folder, self.global_config)
-                debug_enabled = config.get("debug", self.debug)
+                                    self._debug_print(folder, f"[INFO] Folder {f_path} was moved and no longer exists. Continuing with the next item.", debug_enabled=debug_enabled)
+                                continue
+                # 4. Log status
+                processed_time = processed.get(rel, {}).get("processed_time")
+                age = (now - processed_time) if processed_time else None
                 if debug_enabled:
-                    self._debug_print(folder, f"[SKIP] Folder {folder} was deleted during scan, aborting.", debug_enabled=debug_enabled)
-                return
-            # After resting, before move/dissolve, inject metadata if enabled
-            if inject_folder_name and metadata_field and f_path.is_dir():
-                folder_name = f_path.name
-                for subfile in f_path.rglob('*'):
-                    if subfile.is_file() and is_image_file(subfile):
-                        if debug_enabled:
-                            self._debug_print(folder, f"[METADATA] Attempting to write '{folder_name}' to field '{metadata_field}' in {subfile}", debug_enabled=debug_enabled)
-                        write_metadata(str(subfile), metadata_field, folder_name, logger)
-                        if debug_enabled:
-                            self._debug_print(folder, f"[METADATA] Successfully wrote metadata for {subfile}. File has passed metadata process.", debug_enabled=debug_enabled)
-            elif inject_folder_name and metadata_field and f_path.is_file() and is_image_file(f_path):
-                folder_name = folder.name
-                if debug_enabled:
-                    self._debug_print(folder, f"[METADATA] Attempting to write '{folder_name}' to field '{metadata_field}' in {f_path}", debug_enabled=debug_enabled)
-                write_metadata(str(f_path), metadata_field, folder_name, logger)
-                if debug_enabled:
-                    self._debug_print(folder, f"[METADATA] Successfully wrote metadata for {f_path}. File has passed metadata process.", debug_enabled=debug_enabled)
+                    if snapshot.is_dir(rel):
+                        # For debug output only: check processed times of files
+                        processed_files = {k: v for k, v in processed.items() if k != rel}
+                        if processed_files:
+                            latest_processed = max(v.get('processed_time', 0) for v in processed_files.values())
+                            self._debug_print(folder, f"Folder: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: {latest_processed}, age: {(now - latest_processed) if latest_processed else 'N/A'} (from processed files)", debug_enabled=debug_enabled)
+                        else:
+                            # Check if the folder itself is processed
+                            folder_processed = processed.get(rel, {}).get("processed_time")
+                            if folder_processed:
+                                self._debug_print(folder, f"Folder: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: {folder_processed}, age: {(now - folder_processed) if folder_processed else 'N/A'} (folder processed)", debug_enabled=debug_enabled)
+                            else:
+                                self._debug_print(folder, f"Folder: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: None, age: N/A (no processed files or folder)", debug_enabled=debug_enabled)
+                    else:
+                        self._debug_print(folder, f"File: {rel}, seen_time: {seen_time}, stable: {stable}, processed_time: {processed_time}, age: {age if age is not None else 'N/A'}", debug_enabled=debug_enabled)
+                # After each file/folder, check if the parent folder still exists
+                if not folder.exists():
+                    if debug_enabled:
+                        self._debug_print(folder, f"[SKIP] Folder {folder} was deleted during scan, aborting.", debug_enabled=debug_enabled)
+                    return
+        self.metrics.set("hotfolder_resting_jobs", resting, hotfolder=str(folder))
+        trace.count("jobs_resting", resting)
         # 5. Retention cleanup
+        trace.mark("retention")
         if cleanup_enabled and keep_copy and cleanup_time > 0:
-            # Debug: show all processed entries and their processed_time
-            if debug_enabled:
-                debug_msg = f"[RETENTION] Processed entries for cleanup check (cleanup_time={cleanup_time} min):\n"
+            processed = state_db.get_processed()
+            # Debug: show all processed entries and their processed_time (only built when debug is on)
+            def retention_dump():
+                lines = [f"[RETENTION] Processed entries for cleanup check (cleanup_time={cleanup_time} min):"]
                 for rel, entry in processed.items():
                     pt = entry.get("processed_time")
-                    age = (now - pt) / 60 if pt else None
-                    exists = (folder / rel).exists()
-                    debug_msg += f"  {rel}: processed_time={pt}, age_min={age:.2f}, exists={exists}\n" if pt else f"  {rel}: processed_time=None, exists={exists}\n"
-                self._debug_print(folder, debug_msg.rstrip(), debug_enabled=debug_enabled)
+                    exists = snapshot.exists(rel)
+                    lines.append(f"  {rel}: processed_time={pt}, age_min={(now - pt) / 60:.2f}, exists={exists}" if pt else f"  {rel}: processed_time=None, exists={exists}")
+                return "\n".join(lines)
+            self._debug_print(folder, retention_dump, debug_enabled=debug_enabled)
             
             # Clean up processed entries for files that no longer exist or are past retention
+            retention_removed = []
             for rel, entry in list(processed.items()):
                 pt = entry.get("processed_time")
                 abs_path = folder / rel
-                file_exists = abs_path.exists()
+                file_exists = snapshot.exists(rel)
                 
                 # Clean up if file doesn't exist OR if it's past retention time
                 if not file_exists or (pt and (now - pt) / 60 > cleanup_time):
@@ -573,11 +898,12 @@ class HotfolderWatcher:
                                 self._debug_print(folder, f"[RETENTION] Failed to delete {rel}: {e}", debug_enabled=debug_enabled)
                     
                     # Always clean up DB entries for non-existent files or those past retention
-                    state_db.remove_seen(rel)
-                    state_db.remove_processed(rel)
+                    retention_removed.append(rel)
                     if debug_enabled:
                         reason = "file no longer exists" if not file_exists else f"past retention time ({cleanup_time} min)"
                         self._debug_print(folder, f"[RETENTION] Cleaned up DB entries for {rel} because {reason}", debug_enabled=debug_enabled)
+            state_db.remove_many(retention_removed)
+            trace.count("retention_removed", len(retention_removed))
 
             # After deleting files, check if the job folder is empty and delete it if so
             for job_folder in folder.iterdir():
@@ -589,40 +915,317 @@ class HotfolderWatcher:
                         try:
                             job_folder.rmdir()
                             # Clean up state for this job folder and all its files
-                            state_db.remove_seen_prefix(job_folder.name)
-                            state_db.remove_processed_prefix(job_folder.name)
+                            state_db.remove_prefix(job_folder.name)
                             if debug_enabled:
                                 self._debug_print(folder, f"[RETENTION] Deleted empty job folder {job_folder.name} after retention cleanup.", debug_enabled=debug_enabled)
                             self.log_action(logger, folder, "RETENTION", f"Deleted {job_folder.name} from IN after retention policy (folder was empty).")
                         except Exception as e:
                             if debug_enabled:
                                 self._debug_print(folder, f"[RETENTION] Failed to delete job folder {job_folder.name}: {e}", debug_enabled=debug_enabled)
+            # Retention deletes are timer-driven: stay on the scan cadence when one is due soon
+            expiries = [entry["processed_time"] + cleanup_time * 60 for entry in processed.values() if entry.get("processed_time")]
+            if expiries and min(expiries) - now < config.get("idle_rescan_interval", 300):
+                pending = True
         # 6. Save state (no-op for DB)
         # Clean up processed/seen if empty (no-op for DB)
+        # Anything that changed state this scan gets a follow-up scan on the regular cadence
+        return pending or changed
+
+    def _record_scan(self, folder, started, state_db, commits, trace=None):
+        # Per-scan metrics; stat calls are recorded by handle_hotfolder once the snapshot is taken
+        name = str(folder)  # The full path: hotfolders under different roots may share a name
+        self.metrics.inc("hotfolder_scans_total", hotfolder=name)
+        self.metrics.observe("hotfolder_scan_duration_seconds", time.monotonic() - started, hotfolder=name)
+        if trace is not None:
+            for phase, seconds in trace.phases.items():
+                self.metrics.observe("hotfolder_scan_phase_seconds", seconds, hotfolder=name, phase=phase)
+        if state_db is None:
+            state_db, commits = self.state_dbs.get(str(folder)), 0
+        if state_db is not None:
+            self.metrics.inc("hotfolder_db_transactions_total", state_db.commits - commits, hotfolder=name)
+
+    def _record_processed(self, folder, job, stats, seen_time=None, trace=None):
+        # Per-job metrics: ARRIVED -> PROCESSED latency (from the job's seen_time after a restart) and transfer totals
+        name = str(folder)
+        arrived = self.arrivals.pop((name, job), seen_time)
+        self.metrics.inc("hotfolder_jobs_processed_total", hotfolder=name)
+        if trace is not None:
+            trace.count("jobs_processed")
+            if stats is not None:
+                trace.count("files_transferred", stats.files)
+                trace.count("bytes_transferred", stats.bytes)
+        if arrived is not None:
+            self.metrics.observe("hotfolder_job_latency_seconds", max(0.0, time.time() - arrived), hotfolder=name)
+        if stats is not None and stats.files:
+            self.metrics.inc("hotfolder_transferred_files_total", stats.files, hotfolder=name)
+            self.metrics.inc("hotfolder_transferred_bytes_total", stats.bytes, hotfolder=name)
+            if stats.bytes and stats.seconds > 0:
+                self.metrics.observe("hotfolder_transfer_throughput_bytes_per_second", stats.throughput, hotfolder=name)
+
+    def _dump_slow_scan(self, folder, trace, config):
+        # Write the trace of a scan that took longer than slow_scan_threshold to the hotfolder's .log folder
+        threshold = config.get("slow_scan_threshold", 60)
+        if not threshold or trace.seconds < threshold or not folder.exists():
+            return
+        logger = get_hotfolder_logger(folder, retention_days=config.get("log_retention", 7))
+        try:
+            path = trace.dump(folder / ".log")
+        except OSError as e:
+            logger.error(f"Failed to write slow scan trace: {e}")
+            return
+        phases = ", ".join(f"{phase}={seconds:.2f}s" for phase, seconds in sorted(trace.phases.items(), key=lambda item: -item[1]) if seconds >= 0.01)
+        self.log_action(logger, folder, "SLOW_SCAN", f"Scan took {trace.seconds:.2f}s (slow_scan_threshold={threshold}s): {phases}; trace written to {path.name}", level="warning")
+
+    def _deliver_delta(self, state_db, job, files, out_folder, block_size, logger, staging=None, job_root=None, on_done=None, budget=None, throttle=None):
+        # Delta-sync [(src_path, rel)] of one job to OUT and persist the new block signatures.
+        # job_root: directory standing in for OUT/job (a staged job folder), if not OUT/job itself
+        previous = state_db.get_block_signatures_for_job(job)
+        targets = {rel: out_folder / rel if job_root is None else job_root / Path(rel).relative_to(job) for _, rel in files}
+        stats, records = self.transfer_engine.run_delta(
+            [(src, targets[rel], previous.get(rel)) for src, rel in files], block_size, logger=logger, staging=staging, on_done=on_done, budget=budget, throttle=throttle)
+        state_db.set_block_signatures_many((rel,) + records[targets[rel]] for _, rel in files)
+        return stats
+
+    def _plan_dissolve(self, snapshot, rel, out_folder, ds_store, thumbs_db, dissolve_collision, dissolve_ignore_case=False):
+        # (tasks, dropped) for flattening the job folder rel into out_folder, from one listing of OUT
+        files = [snapshot.root / srel for srel in snapshot.job_files(rel) if not is_system_file(srel.rsplit('/', 1)[-1], ds_store, thumbs_db)]
+        return plan_dissolve(files, NameIndex(out_folder, dissolve_ignore_case), dissolve_collision)
+
+    def _planned_moves(self, snapshot, rel, out_folder, dissolve_folders, ds_store, thumbs_db, dissolve_plan=None):
+        # [(rel, dst)] for every file move_hotfolder_contents will move for the top-level item rel
+        if snapshot.is_file(rel):
+            return [] if is_system_file(rel, ds_store, thumbs_db) else [(rel, out_folder / rel)]
+        if dissolve_folders and dissolve_plan is not None:
+            return [(src.relative_to(snapshot.root).as_posix(), dst) for src, dst in dissolve_plan[0]]
+        return [(srel, out_folder / srel) for srel in snapshot.job_files(rel) if not is_system_file(srel.rsplit('/', 1)[-1], ds_store, thumbs_db)]
+
+    def _resume_transfers(self, folder, out_folder, state_db, config, debug_enabled, trace=None):
+        """
+        Finish job transfers that were interrupted (agent killed, crashed or restarted mid-job) using the transfer journal.
+        Files that already arrived in OUT are not transferred again; the job is then recorded as processed,
+        exactly as if the transfer had not been interrupted, without waiting for it to rest again.
+        """
+        jobs = state_db.get_journal_jobs()
+        if not jobs:
+            return
+        logger = get_hotfolder_logger(folder, retention_days=config.get("log_retention", 7))
+        staging = None
+        if config.get("staged_delivery", False):
+            staging = StagedDelivery(out_folder, config.get("staging_fsync_batch", FSYNC_BATCH))
+        update_mtime = config.get("update_mtime", True)
+        dissolve_folders = config.get("dissolve_folders", False)
+        budget = self._get_byte_budget(folder, config)
+        throttle = self._get_throttle(folder, config)
+        for job in sorted(jobs):
+            entries = state_db.get_journal_for_job(job)
+            copies, moves = [], []
+            skipped = 0
+            for rel, entry in entries.items():
+                src, dst = folder / rel, Path(entry['dst'])
+                if entry['done'] or arrived(src, dst, entry):
+                    if entry['mode'] == 'move' and not entry['done'] and src.exists():
+                        src.unlink()  # Copied across filesystems, but the source was not removed yet
+                    skipped += 1
+                    continue
+                if not src.exists():
+                    logger.warning(f"[RESUME] {rel} is neither in IN nor complete in OUT; it cannot be resumed")
+                    continue
+                (moves if entry['mode'] == 'move' else copies).append((src, dst))
+            journal = TransferJournal(state_db, folder, job)
+            stats = TransferStats()
+            if copies:
+                stats.add(self.transfer_engine.run(copies, keep_copy=True, logger=logger, staging=staging, on_done=journal.done, budget=budget, throttle=throttle))
+            if moves:
+                stats.add(self.transfer_engine.run(moves, keep_copy=False, update_mtime=update_mtime, logger=logger, staging=staging, on_done=journal.done, budget=budget, throttle=throttle))
+            with state_db.transaction():
+                now = time.time()
+                if any(entry['mode'] == 'move' for entry in entries.values()):
+                    job_path = folder / job
+                    if not dissolve_folders and job_path.is_dir() and not any(files for _, _, files in os.walk(job_path)):
+                        shutil.rmtree(job_path)  # A cross-device directory move stopped before removing the source
+                    state_db.set_processed(job, now, job_path.stat().st_mtime if job_path.exists() else 0)
+                    if dissolve_folders and job_path.is_dir():
+                        remove_empty_dirs(job_path)
+                    if dissolve_folders and job_path.is_dir() and not any(job_path.iterdir()):
+                        state_db.mark_ready_for_deletion(job)
+                else:
+                    state_db.set_processed_many(
+                        (rel, now, (folder / rel).stat().st_mtime, False) for rel in entries if (folder / rel).exists())
+                journal.finish()
+            self._record_processed(folder, job, stats, trace=trace)
+            self.log_action(logger, folder, "RESUMED", f"Resumed interrupted transfer of {job}: {stats.files} files transferred, {skipped} already in OUT ({stats})")
+            if debug_enabled:
+                self._debug_print(folder, f"[RESUMED] {job}: {len(copies)} copies, {len(moves)} moves, {skipped} already complete", debug_enabled=debug_enabled)
+
+    def _open_leases(self, cluster_config):
+        # Coordination DB shared by every worker: cluster_db, or a file in the first hotfolder root
+        logger = get_hotfolder_logger("global")
+        db_path = cluster_config.get("cluster_db") or ""
+        if not db_path:
+            if not self.hotfolder_roots:
+                logger.error("Cluster mode needs cluster_db or at least one hotfolder root; not starting.")
+                return None
+            db_path = Path(self.hotfolder_roots[0]).resolve() / CLUSTER_DB_PATH
+        try:
+            leases = LeaseCoordinator(db_path, default_owner(self.worker), cluster_config.get("lease_ttl", 30), logger)
+        except Exception as e:
+            logger.error(f"Failed to open cluster coordination DB {db_path}: {e}; not starting.")
+            return None
+        logger.info(f"Cluster mode: worker {leases.owner} coordinating through {db_path}")
+        return leases
+
+    def _get_state_db(self, folder, config):
+        # One connection per hotfolder, reused across scans
+        key = str(folder)
+        with self.lock:
+            state_db = self.state_dbs.get(key)
+            if state_db is None:
+                state_db = HotfolderStateDB(
+                    folder,
+                    journal_mode=config.get("db_journal_mode", "WAL"),
+                    synchronous=config.get("db_synchronous", "NORMAL"),
+                    cache_size=config.get("db_cache_size", -2000),
+                )
+                self.state_dbs[key] = state_db
+            return state_db
+
+    def _inject_metadata(self, state_db, snapshot, job, files, metadata_field, value, seen, logger, debug_enabled):
+        """
+        Write value into metadata_field of the images among files (relative paths of one job) on the metadata stage.
+        An image is skipped while its recorded result still matches its size, mtime and the configured field and value,
+        so each version of a file is tagged once. Rewritten files are re-stat'ed in the snapshot and their seen mtime
+        is updated without resetting the resting timer, so the injection itself never looks like a change.
+        """
+        folder = snapshot.root
+        field = resolve_metadata_field(metadata_field)
+        recorded_field = field or metadata_field
+        status = state_db.get_metadata_status_for_job(job)
+        todo = []
+        for rel in files:
+            st = snapshot.stat(rel)
+            if st is None or not is_image_file(rel):
+                continue
+            entry = status.get(rel)
+            if entry is not None and entry[:4] == (recorded_field, value, st.size, st.mtime):
+                continue
+            todo.append(rel)
+        if not todo:
+            return 0
+        if field is None:
+            logger.error(f"Failed to write metadata: field '{metadata_field}' is not an IPTC field, {len(todo)} images in {job} left untagged")
+            state_db.set_metadata_status_many(
+                (rel, recorded_field, value, snapshot.stat(rel).size, snapshot.stat(rel).mtime, "failed") for rel in todo)
+            return 0
+        if debug_enabled:
+            self._debug_print(folder, f"[METADATA] Writing '{value}' to field '{field}' in {len(todo)} images of {job}", debug_enabled=debug_enabled)
+        start = time.time()
+        results = self.metadata_stage.run([folder / rel for rel in todo], field, value, owner=str(folder))
+        rows = []
+        seen_rows = []
+        written = 0
+        for rel, (path, result, detail, _) in zip(todo, results):
+            if result == "written":
+                written += 1
+                logger.info(f"Wrote metadata '{field}'='{value}' to {path} ({detail})")
+                st = snapshot.refresh(rel)
+                if st is None:
+                    continue
+                if rel in seen:
+                    seen_rows.append((rel, seen[rel]['seen_time'], st.mtime))
+            else:
+                if result != "present":
+                    logger.error(f"Failed to write metadata to {path}: {detail}")
+                st = snapshot.stat(rel)
+            rows.append((rel, field, value, st.size, st.mtime, result))
+        state_db.set_metadata_status_many(rows)
+        state_db.set_seen_many(seen_rows)
+        if debug_enabled:
+            self._debug_print(folder, f"[METADATA] {job}: {written} written, {len(todo) - written} skipped or failed in {time.time() - start:.2f}s", debug_enabled=debug_enabled)
+        return written
+
+    def _new_seen_rows(self, hasher, files, now, logger):
+        # Seen rows for newly seen files ((key, rel, FileStat) triples). With content hashing the digest is
+        # recorded right away, so the first touch of a new file can already be told from a change
+        if hasher is None:
+            return [(key, now, stat.mtime) for key, _, stat in files]
+        self._prefetch_hashes(hasher, [(rel, stat) for _, rel, stat in files], logger)
+        rows = []
+        for key, rel, stat in files:
+            try:
+                digest = hasher.digest(rel, stat)
+            except OSError:
+                digest = None  # Gone or unreadable already; compared by mtime until it is seen again
+            rows.append((key, now, stat.mtime, digest))
+        return rows
+
+    def _prefetch_hashes(self, hasher, files, logger):
+        # Files that could not be hashed in a worker are hashed again inline, where errors end the scan as before
+        for rel, error in hasher.prefetch(files):
+            logger.warning(f"Failed to hash {rel} on the CPU pool: {error}")
+
+    def _get_byte_budget(self, folder, config):
+        # One ByteBudget per hotfolder, its limit refreshed from the current config on every scan
+        with self.lock:
+            budget = self.byte_budgets.get(str(folder))
+            if budget is None:
+                budget = self.byte_budgets[str(folder)] = ByteBudget()
+        budget.set_limit(config.get("max_bytes_in_flight", 0))
+        return budget
+
+    def _get_throttle(self, folder, config):
+        # One Throttle per hotfolder, its rates refreshed from the current config on every scan
+        with self.lock:
+            throttle = self.throttles.get(str(folder))
+            if throttle is None:
+                throttle = self.throttles[str(folder)] = Throttle()
+        throttle.set_rates(config.get("max_bytes_per_second", 0), config.get("max_files_per_second", 0))
+        return throttle
+
+    def _release_hotfolder(self, folder):
+        # Drop everything cached for a hotfolder that is gone or no longer watched
+        with self.lock:
+            state_db = self.state_dbs.pop(str(folder), None)
+            self.snapshots.pop(str(folder), None)
+            self.debug_levels.pop(str(folder), None)
+            self.byte_budgets.pop(str(folder), None)
+            self.throttles.pop(str(folder), None)
+            for key in [k for k in self.arrivals if k[0] == str(folder)]:
+                del self.arrivals[key]
+        self.cpu_pool.forget(str(folder))
+        self.metrics.remove(hotfolder=str(folder))
+        clear_config_cache(folder)
+        close_hotfolder_logger(folder)
+        if state_db is not None:
+            state_db.close()
+
+    def _debug_enabled(self, folder):
+        # Per-hotfolder debug level, resolved once per scan by handle_hotfolder
+        if folder == 'global':
+            return self.debug
+        enabled = self.debug_levels.get(str(folder))
+        if enabled is None:
+            enabled = get_effective_config(folder, self.global_config).get('debug', self.debug)
+        return enabled
 
     def _debug_print(self, folder, message, debug_enabled=None):
         # folder: 'global' or hotfolder path
-        global_debug = self.debug
-        per_hotfolder_debug = False
-        folder_name = folder if folder == 'global' else Path(folder).name
-        if folder != 'global':
-            # Get per-hotfolder debug setting
-            config = get_effective_config(folder, self.global_config)
-            per_hotfolder_debug = config.get('debug', global_debug)
+        # message: a string, or a callable returning one; callables are only evaluated when debug is on,
+        # so expensive dumps cost nothing otherwise
+        if debug_enabled is False:
+            return
         if folder == 'global':
-            if global_debug:
-                ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                debug_msg = f"[DEBUG][{ts}][hotfolder: global] {message}"
-                print(debug_msg)
-                debug_logger = get_hotfolder_debug_logger('global')
-                debug_logger.debug(message)
+            enabled = self.debug
         else:
-            if per_hotfolder_debug:
-                ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                debug_msg = f"[DEBUG][{ts}][hotfolder: {folder_name}] {message}"
-                print(debug_msg)
-                debug_logger = get_hotfolder_debug_logger(folder)
-                debug_logger.debug(message)
+            # The caller's per-scan debug flag wins; fall back to the cached level
+            enabled = debug_enabled if debug_enabled is not None else self._debug_enabled(folder)
+        if not enabled:
+            return
+        if callable(message):
+            message = message()
+        folder_name = folder if folder == 'global' else Path(folder).name
+        ts = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        print(f"[DEBUG][{ts}][hotfolder: {folder_name}] {message}")
+        get_hotfolder_debug_logger(folder).debug(message)
 
     def log_action(self, logger, folder, action, details, level="info"):
         # Use only the folder name for per-hotfolder logs
@@ -1,10 +1,69 @@
+import multiprocessing
+import os
+import signal
+import time
+
+from hotfolder.config import load_global_config
+from hotfolder.logger import get_hotfolder_logger
 from hotfolder.watcher import HotfolderWatcher
 
+# Seconds between checks for worker processes that exited
+WORKER_CHECK_INTERVAL = 5
+
+
+def run_worker(index):
+    HotfolderWatcher(worker=index).run()
+
+
+def run_workers(count):
+    """
+    Cluster mode with several worker processes: each runs its own HotfolderWatcher and leases a share
+    of the hotfolders. A worker that exits is started again; its hotfolders move to the others meanwhile.
+    """
+    logger = get_hotfolder_logger("global")
+    context = multiprocessing.get_context("spawn")
+    workers = {}
+
+    def start(index):
+        process = context.Process(target=run_worker, args=(index,), name=f"hotfolder-worker-{index}")
+        process.start()
+        workers[index] = process
+
+    def terminate(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, terminate)
+    for index in range(count):
+        start(index)
+    logger.info(f"Started {count} worker processes")
+    try:
+        while True:
+            time.sleep(WORKER_CHECK_INTERVAL)
+            for index, process in list(workers.items()):
+                if process.exitcode is not None:
+                    logger.error(f"Worker {index} exited with code {process.exitcode}, restarting it")
+                    start(index)
+    except KeyboardInterrupt:
+        # SIGINT lets every worker release its leases before it exits
+        for process in workers.values():
+            if process.is_alive():
+                os.kill(process.pid, signal.SIGINT)
+        for process in workers.values():
+            process.join()
+
 
 def main():
-    watcher = HotfolderWatcher()
-    watcher.run()
+    config = load_global_config()
+    cluster = config.get("cluster")
+    processes = 1
+    if isinstance(cluster, dict) and cluster.get("cluster_enabled", False):
+        processes = cluster.get("cluster_processes", 1)
+    if processes > 1:
+        run_workers(processes)
+    else:
+        watcher = HotfolderWatcher()
+        watcher.run()
 
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()